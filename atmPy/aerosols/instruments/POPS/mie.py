@@ -26,6 +26,7 @@ from scipy.interpolate import interp1d
 
 from atmPy.aerosols.instruments.POPS import tools
 from atmPy.radiation.mie_scattering import bhmie
+from atmPy.radiation.mie_scattering import mie_cache
 
 
 ###########################
@@ -114,8 +115,12 @@ def makeMie_diameter(radiusRangeInMikroMeter = [0.05,1.5],
         singleLine = True
         
     output = np.zeros((exWavelengthInUm.shape[0]+1,dRange.shape[0]))
+    cache = mie_cache.get_default_cache()
     for e,i in enumerate(exWavelengthInUm):
         event.set_wavelength(i)
+        if cache:
+            # fill the cache for all radii at once, the loop below will then only get hits
+            cache.get(2 * np.pi / i * dRange, event.n, event.nang)
         perpInt = []
         for i in dRange:
             event.set_r(i)
@@ -348,8 +353,13 @@ class Mie():
     def do_bhmie_hagen(self):
         if not self.silent:
             self.print_current_parameter()
-        bhh = bhmie.bhmie_hagen(self.x, self.n, self.nang)
-        s1,s2,self.qext,self.qsca,self.qback,self.gsca = bhh.return_Values()
+        cache = mie_cache.get_default_cache()
+        if cache:
+            bhh = bhmie.bhmie_hagen_batch(self.x, self.n, self.nang, cache=cache)
+            s1, s2, self.qext, self.qsca, self.qback, self.gsca = [i[0] for i in bhh.return_Values()]
+        else:
+            bhh = bhmie.bhmie_hagen(self.x, self.n, self.nang)
+            s1,s2,self.qext,self.qsca,self.qback,self.gsca = bhh.return_Values()
 #         data = (abs(self.s1))**2#/(np.pi * self.x**2 * self.qsca)
         s1_Reverse = s1[::-1]
         self.s1 = np.concatenate((s1,s1_Reverse)) 
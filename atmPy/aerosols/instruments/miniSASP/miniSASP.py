@@ -121,10 +121,11 @@ def simulate_from_size_dist_LS(dist_LS, airmassfct=True, rotations=2, sun_azimut
         AODs
         skyBrs
     """
+    # all channels in one go
+    optP = dist_LS.calculate_optical_properties(np.array(miniSASP_channels, dtype=float), 1.455)
     optPs = {}
-    for wl in miniSASP_channels:
-        optP = dist_LS.calculate_optical_properties(wl, 1.455)
-        optPs[wl] = optP
+    for wl, opt_wl in zip(miniSASP_channels, optP.optical_properties):
+        optPs[wl] = opt_wl
 
     skyBrs = {}
     aods = {}
@@ -175,8 +176,8 @@ def simulate_from_size_dist_opt(opt_prop, airmassfct=True, rotations=2, sun_azim
     pandas DataFrame:
         AOD as a function of elevaton"""
 
-    time_series = opt_prop.parent_dist_LS.parent_timeseries
-    dist_ls = opt_prop.parent_dist_LS
+    time_series = opt_prop.parent_sizedist.parent_timeseries
+    dist_ls = opt_prop.parent_sizedist
     layerthickness = np.apply_along_axis(lambda line: line[1] - line[0], 1, dist_ls.layerbounderies)
     time_series = solar.get_sun_position_TS(time_series)
     where = array_tools.find_closest(time_series.data.Altitude.values, dist_ls.layercenters)
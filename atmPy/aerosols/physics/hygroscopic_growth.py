@@ -3,6 +3,7 @@ from scipy.optimize import fsolve as _fsolve
 import pandas as _pd
 import atmPy.general.timeseries as _timeseries
 import warnings as _warnings
+from atmPy.tools import parallel_tools as _parallel_tools
 
 def kappa_simple(k, RH, refractive_index = None, inverse = False):
     """Returns the growth factor as a function of kappa and RH.
@@ -76,7 +77,8 @@ def kappa_simple(k, RH, refractive_index = None, inverse = False):
     return out
 
 
-def kappa_from_fofrh_and_sizedist(f_of_RH, dist, wavelength, RH, verbose = False, f_of_RH_collumn = None):
+def kappa_from_fofrh_and_sizedist(f_of_RH, dist, wavelength, RH, verbose = False, f_of_RH_collumn = None,
+                                  n_workers = None, chunk_size = None):
     """
     Calculates kappa from f of RH and a size distribution.
     Parameters
@@ -89,14 +91,66 @@ def kappa_from_fofrh_and_sizedist(f_of_RH, dist, wavelength, RH, verbose = False
     column: string
         when f_of_RH has more than one collumn name the one to be used
     verbose: bool
+    n_workers: int, optional
+        If larger than 1, the time stamps are split into chunks which are processed by a pool of n_workers
+        processes. The result is identical to the serial one.
+    chunk_size: int, optional
+        Number of time stamps per chunk. Default is an even split among the workers.
 
     Returns
     -------
     TimeSeries
     """
 
+    # make sure f_of_RH has only one collumn
+    if f_of_RH.data.shape[1] > 1:
+        if not f_of_RH_collumn:
+            txt = 'f_of_RH has multiple collumns (%s). Please name the one you want to use by setting the f_of_RH_collumn argument.'%(f_of_RH.data.columns)
+            raise ValueError(txt)
+        else:
+            f_of_RH = f_of_RH._del_all_columns_but(f_of_RH_collumn)
+
+    n_values = dist.data.shape[0]
+    f_of_RH_aligned = f_of_RH.align_to(dist)
+
+    if type(dist.index_of_refraction).__name__ == 'float':
+        ior = _np.zeros(n_values) + dist.index_of_refraction
+    else:
+        ior = _np.asarray(dist.index_of_refraction.iloc[:, 0].values)
+
+    # all rows are calculated on a copy of a single row of the size distribution, copying the entire
+    # distribution for each row is expensive
+    template = dist.copy()
+    template.data = template.data.iloc[[0], :]
+    arrays = {'data': dist.data.values,
+              'f_of_RH': f_of_RH_aligned.data.values[:, 0],
+              'ior': ior,
+              'index': dist.data.index.values}
+    args = (template, wavelength, RH, verbose)
+
+    if n_workers and n_workers > 1:
+        results = _parallel_tools.map_chunks(_kappa_from_fofrh_chunk, arrays, n_workers, chunk_size=chunk_size,
+                                             args=args)
+        kappa_calc = _np.concatenate([res[0] for res in results])
+        gf_calc = _np.concatenate([res[1] for res in results])
+    else:
+        kappa_calc, gf_calc = _kappa_from_fofrh_chunk(0, n_values, arrays, *args)
+
+    ts_kappa = _timeseries.TimeSeries(_pd.DataFrame(kappa_calc, index = f_of_RH_aligned.data.index, columns= ['kappa']))
+    ts_kappa._data_period = f_of_RH_aligned._data_period
+    ts_kappa._y_label = '$\kappa$'
+
+    ts_gf = _timeseries.TimeSeries(_pd.DataFrame(gf_calc, index = f_of_RH_aligned.data.index, columns= ['growth factor']))
+    ts_kappa._data_period = f_of_RH_aligned._data_period
+    ts_gf._y_label = 'growth factor$'
+    return ts_kappa, ts_gf
+
+
+def _kappa_from_fofrh_chunk(start, stop, arrays, template, wavelength, RH, verbose):
+    """kappa and growth factor for the rows start to stop (see kappa_from_fofrh_and_sizedist)"""
+
     def minimize_this(gf, sr, f_rh_soll, ext, wavelength, verbose = False):
-        gf = float(gf)
+        gf = float(_np.squeeze(gf))
         sr_g = sr.apply_growth(gf, how='shift_bins')
         sr_g_opt = sr_g.calculate_optical_properties(wavelength)
         ext_g = sr_g_opt.extinction_coeff_sum_along_d.data.values[0][0]
@@ -110,36 +164,24 @@ def kappa_from_fofrh_and_sizedist(f_of_RH, dist, wavelength, RH, verbose = False
             print('---------')
         return out
 
-    # make sure f_of_RH has only one collumn
-    if f_of_RH.data.shape[1] > 1:
-        if not f_of_RH_collumn:
-            txt = 'f_of_RH has multiple collumns (%s). Please name the one you want to use by setting the f_of_RH_collumn argument.'%(f_of_RH.data.columns)
-            raise ValueError(txt)
-        else:
-            f_of_RH = f_of_RH._del_all_columns_but(f_of_RH_collumn)
-
-    n_values = dist.data.shape[0]
-    gf_calc = _np.zeros(n_values)
-    kappa_calc = _np.zeros(n_values)
-    f_of_RH_aligned = f_of_RH.align_to(dist)
-    for e in range(n_values):
-        frhsoll = f_of_RH_aligned.data.values[e][0]
+    gf_calc = _np.zeros(stop - start)
+    kappa_calc = _np.zeros(stop - start)
+    for e in range(stop - start):
+        row = start + e
+        frhsoll = arrays['f_of_RH'][row]
         if _np.isnan(frhsoll):
             kappa_calc[e] = _np.nan
             gf_calc[e]  = _np.nan
             continue
 
-        if type(dist.index_of_refraction).__name__ == 'float':
-            ior = dist.index_of_refraction
-        else:
-            ior = dist.index_of_refraction.iloc[e][0]
+        ior = arrays['ior'][row].item()
         if _np.isnan(ior):
             kappa_calc[e] = _np.nan
             gf_calc[e]  = _np.nan
             continue
 
-        sr = dist.copy()
-        sr.data = sr.data.iloc[[e],:]
+        sr = template.copy()
+        sr.data = _pd.DataFrame(arrays['data'][[row]], index=arrays['index'][[row]], columns=template.data.columns)
         sr.index_of_refraction = ior
         sr_opt = sr.calculate_optical_properties(wavelength)
         ext = sr_opt.extinction_coeff_sum_along_d.data.values[0][0]
@@ -155,18 +197,11 @@ def kappa_from_fofrh_and_sizedist(f_of_RH, dist, wavelength, RH, verbose = False
             print('=======')
 
         gf_out = _fsolve(minimize_this, 1, args = (sr, frhsoll, ext, wavelength, verbose), factor=0.5, xtol = 0.005)
-        gf_calc[e] = gf_out
+        gf_calc[e] = gf_out[0]
 
         if verbose:
             print('resulting gf: %s'%gf_out)
             print('=======\n')
 
-        kappa_calc[e] = kappa_simple(gf_out, RH, inverse=True)
-    ts_kappa = _timeseries.TimeSeries(_pd.DataFrame(kappa_calc, index = f_of_RH_aligned.data.index, columns= ['kappa']))
-    ts_kappa._data_period = f_of_RH_aligned._data_period
-    ts_kappa._y_label = '$\kappa$'
-
-    ts_gf = _timeseries.TimeSeries(_pd.DataFrame(gf_calc, index = f_of_RH_aligned.data.index, columns= ['growth factor']))
-    ts_kappa._data_period = f_of_RH_aligned._data_period
-    ts_gf._y_label = 'growth factor$'
-    return ts_kappa, ts_gf
\ No newline at end of file
+        kappa_calc[e] = kappa_simple(gf_out[0], RH, inverse=True)
+    return kappa_calc, gf_calc
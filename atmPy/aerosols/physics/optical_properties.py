@@ -9,131 +9,466 @@ from atmPy.aerosols.size_distribution import \
 from atmPy.general import timeseries
 from atmPy.general import vertical_profile
 from atmPy.radiation.mie_scattering import bhmie
+from atmPy.radiation.mie_scattering import mie_cache as _mie_cache
+from atmPy.radiation.mie_scattering import mie_coated as _mie_coated
+from atmPy.tools import parallel_tools as _parallel_tools
 import warnings as _warnings
 
 
 # Todo: Docstring is wrong
-# todo: This function can be sped up by breaking it apart. Then have OpticalProperties
-#       have properties that call the subfunction on demand
-def size_dist2optical_properties(sd, wavelength, n, aod=False, noOfAngles=100):
+def size_dist2optical_properties(sd, wavelength, n, aod=False, noOfAngles=100, kernel_tolerance=None,
+                                 n_workers=None, chunk_size=None, core_fraction=None, n_shell=None):
     """
     !!!Tis Docstring need fixn
     Calculates the extinction crossection, AOD, phase function, and asymmetry Parameter for each layer.
     plotting the layer and diameter dependent extinction coefficient gives you an idea what dominates the overall AOD.
 
+    Nothing is calculated right away. The quantities are calculated (and kept) when they are first accessed, either
+    through the returned dictionary or the OpticalProperties instance (see MieKernel).
+
     Parameters
     ----------
-    wavelength: float.
-        wavelength of the scattered light, unit: nm
+    wavelength: float or array-like.
+        wavelength of the scattered light, unit: nm. If array-like, the optical properties at all wavelengths are
+        calculated together and an OpticalPropertiesMultiWavelength instance is returned.
     n: float.
-        Index of refraction of the scattering particles
+        Index of refraction of the scattering particles. If wavelength is array-like, this can also be a list with
+        one index of refraction per wavelength.
 
     noOfAngles: int, optional.
         Number of scattering angles to be calculated. This mostly effects calculations which depend on the phase
         function.
+    kernel_tolerance: float, optional.
+        Only used if n is time dependent (DataFrame). If given, Mie calculations are not done for each row but
+        on a grid of refractive indices (see MieKernelGrid) from which the results for each row are
+        interpolated. The grid is refined until the relative interpolation error is below kernel_tolerance. A
+        ValueError is raised if this takes more grid points than MieKernelGrid allows.
+    n_workers: int, optional.
+        If larger than 1, the rows (e.g. time stamps) are split into chunks which are processed in a process pool
+        with n_workers processes. Results are identical to the serial calculation. Note, calculations are done when
+        a quantity is first accessed, that is when the pool is used.
+    chunk_size: int, optional.
+        Number of rows per chunk, default is an even split among the workers.
+    core_fraction: float, optional.
+        If given, particles are treated as coated spheres (e.g. black carbon with a coating): core_fraction is the
+        volume fraction of the core, n is the refractive index of the core and n_shell the one of the shell.
+        Only works with a constant refractive index.
+    n_shell: float or complex, optional.
+        Refractive index of the shell, see core_fraction. If wavelength is array-like this can also be a list with
+        one index of refraction per wavelength.
 
     Returns
     -------
     OpticalProperty instance
 
     """
-    out = {}
-    sdls = sd.convert2numberconcentration()
-    index = sdls.data.index
-    dist_class = type(sdls).__name__
+    dist_class = type(sd).__name__
 
-    if dist_class not in ['SizeDist','SizeDist_TS']:
+    if dist_class not in ['SizeDist','SizeDist_TS','SizeDist_LS']:
         raise TypeError('this distribution class (%s) can not be converted into optical property yet!'%dist_class)
 
-    # determin if index of refraction changes or if it is constant
-    if isinstance(n, pd.DataFrame):
-        n_multi = True
-    else:
-        n_multi = False
-    if not n_multi:
-        mie, angular_scatt_func = _perform_Miecalculations(np.array(sdls.bincenters / 1000.), wavelength / 1000., n,
-                                                       noOfAngles=noOfAngles)
+    if type(core_fraction) != type(None):
+        if type(n_shell) == type(None):
+            txt = 'If core_fraction is given the refractive index of the shell (n_shell) is needed too.'
+            raise ValueError(txt)
+        if not 0 <= core_fraction <= 1:
+            txt = 'core_fraction has to be between 0 and 1 (is %s).' % core_fraction
+            raise ValueError(txt)
+
+    if np.ndim(wavelength) > 0:
+        if isinstance(n, (list, tuple, np.ndarray)):
+            if len(n) != len(wavelength):
+                txt = 'If n is a list it needs one index of refraction per wavelength (%s != %s).' % (len(n),
+                                                                                                     len(wavelength))
+                raise ValueError(txt)
+        else:
+            n = [n] * len(wavelength)
+        if isinstance(n_shell, (list, tuple, np.ndarray)):
+            if len(n_shell) != len(wavelength):
+                txt = 'If n_shell is a list it needs one index of refraction per wavelength (%s != %s).' % (
+                    len(n_shell), len(wavelength))
+                raise ValueError(txt)
+        else:
+            n_shell = [n_shell] * len(wavelength)
+        group = MieKernelGroup(sd, wavelength, n, noOfAngles=noOfAngles, kernel_tolerance=kernel_tolerance,
+                               n_workers=n_workers, chunk_size=chunk_size, core_fraction=core_fraction,
+                               n_shells=n_shell)
+        opt_props = []
+        for kernel in group.kernels:
+            out = _kernel2data(kernel, dist_class, aod)
+            if dist_class == 'SizeDist_TS':
+                opt_props.append(OpticalProperties_TS(out, parent=sd))
+            else:
+                opt_props.append(OpticalProperties(out, parent=sd))
+        return OpticalPropertiesMultiWavelength(opt_props)
 
-    if aod:
-        #todo: use function that does a the interpolation instead of the sum?!? I guess this can lead to errors when layers are very thick, since centers are used instea dof edges?
-        AOD_layer = np.zeros((len(sdls.layercenters)))
+    kernel = MieKernel(sd, wavelength, n, noOfAngles=noOfAngles, kernel_tolerance=kernel_tolerance,
+                       n_workers=n_workers, chunk_size=chunk_size, core_fraction=core_fraction, n_shell=n_shell)
+    out = _kernel2data(kernel, dist_class, aod)
+    if dist_class == 'SizeDist_TS':
+        return OpticalProperties_TS(out,parent = sd)
 
-    extCoeffPerLayer = np.zeros((len(sdls.data.index.values), len(sdls.bincenters)))
-    angular_scatt_func_effective = pd.DataFrame()
-    asymmetry_parameter_LS = np.zeros((len(sdls.data.index.values)))
 
-    for i, lc in enumerate(sdls.data.index.values):
-        laydata = sdls.data.iloc[i].values # picking a size distribution (either a layer or a point in time)
+    return out
 
-        if n_multi:
-            mie, angular_scatt_func = _perform_Miecalculations(np.array(sdls.bincenters / 1000.), wavelength / 1000., n.iloc[i].values[0],
-                                                       noOfAngles=noOfAngles)
-        extinction_coefficient = _get_coefficients(mie.extinction_crossection, laydata)
 
-        if aod:
-            layerThickness = sdls.layerbounderies[i][1] - sdls.layerbounderies[i][0]
-            AOD_perBin = extinction_coefficient * layerThickness
-            AOD_layer[i] = AOD_perBin.values.sum()
+def _kernel2data(kernel, dist_class, aod):
+    """The (lazy) data dictionary of OpticalProperties"""
+    out = OpticalPropertiesData(kernel, aod=aod)
+    sdls = kernel.size_distribution
 
-        extCoeffPerLayer[i] = extinction_coefficient
+    out['parent_type'] = dist_class
+    out['wavelength'] = kernel.wavelength
+    out['index_of_refraction'] = kernel.index_of_refraction
+    out['bin_centers'] = sdls.bincenters
+    out['bins'] = sdls.bins
+    out['binwidth'] = sdls.binwidth
+    out['distType'] = sdls.distributionType
+    return out
 
-        scattering_cross_eff = laydata * mie.scattering_crossection
 
-        pfe = (laydata * angular_scatt_func).sum(axis=1)  # sum of all angular_scattering_intensities
+class MieKernel(object):
+    """Mie results for the bins of a size distribution and the resulting optical coefficients of each row and
+    bin. Nothing is calculated before it is asked for. As long as only the extinction and scattering coefficients
+    are needed the Mie calculations are done at two angles only; the angular scattering function (and what depends
+    on it, e.g. the asymmetry parameter) triggers a calculation at noOfAngles angles.
 
-        x_2p = pfe.index.values
-        y_2p = pfe.values
+    Parameters
+    ----------
+    sd: SizeDist or SizeDist_TS instance
+    wavelength: float
+        in nm
+    n: float, complex, or DataFrame
+        refractive index, a DataFrame if it is time dependent
+    noOfAngles: int
+    kernel_tolerance: float, optional
+        see size_dist2optical_properties
+    group: MieKernelGroup instance, optional
+        The group this kernel belongs to. The size distribution of the group is used and Mie calculations are done
+        for the entire group at once.
+    n_workers: int, optional
+        If larger than 1, the rows are split into chunks, which are processed in a pool of n_workers processes.
+        The result is identical to the serial one.
+    chunk_size: int, optional
+        Number of rows per chunk. Default is an even split among the workers.
+    core_fraction: float, optional
+        Volume fraction of the core of coated particles, n is the refractive index of the core in this case.
+    n_shell: float or complex, optional
+        refractive index of the shell of coated particles
+    """
+    def __init__(self, sd, wavelength, n, noOfAngles=100, kernel_tolerance=None, group=None, n_workers=None,
+                 chunk_size=None, core_fraction=None, n_shell=None):
+        if type(core_fraction) != type(None) and isinstance(n, pd.DataFrame):
+            txt = 'Coated particles (core_fraction) are only supported for a constant refractive index.'
+            raise ValueError(txt)
+        self.group = group
+        if group:
+            self.size_distribution = group.size_distribution
+        else:
+            self.size_distribution = sd.convert2numberconcentration(deep=False)
+        self.wavelength = wavelength
+        self.index_of_refraction = n
+        self.noOfAngles = noOfAngles
+        self.kernel_tolerance = kernel_tolerance
+        self.n_workers = n_workers
+        self.chunk_size = chunk_size
+        self.core_fraction = core_fraction
+        self.n_shell = n_shell
+
+        self.__extinction_coeff_per_bin = None
+        self.__scattering_coeff_per_bin = None
+        self.__angular_scatt_func = None
+        self.__angles = None
+        self.__asymmetry_param = None
 
-        # limit to [0,pi]
-        y_1p = y_2p[x_2p < np.pi]
-        x_1p = x_2p[x_2p < np.pi]
+    @property
+    def extinction_coeff_per_bin(self):
+        """extinction coefficient (rows x bins) in m^-1"""
+        if type(self.__extinction_coeff_per_bin) == type(None):
+            self._calculate(angular=False)
+        return self.__extinction_coeff_per_bin
 
-        y_phase_func = y_1p * 4 * np.pi / scattering_cross_eff.sum()
-        asymmetry_parameter_LS[i] = .5 * integrate.simps(np.cos(x_1p) * y_phase_func * np.sin(x_1p), x_1p)
-        angular_scatt_func_effective[
-            lc] = pfe * 1e-12 * 1e6  # equivalent to extCoeffPerLayer # similar to  _get_coefficients (converts everthing to meter)
+    @property
+    def scattering_coeff_per_bin(self):
+        """scattering coefficient (rows x bins) in m^-1"""
+        if type(self.__scattering_coeff_per_bin) == type(None):
+            self._calculate(angular=False)
+        return self.__scattering_coeff_per_bin
 
-    if aod:
-        out['AOD'] = AOD_layer[~ np.isnan(AOD_layer)].sum()
-        out['AOD_layer'] = pd.DataFrame(AOD_layer, index=sdls.layercenters, columns=['AOD per Layer'])
-        out['AOD_cum'] = out['AOD_layer'].iloc[::-1].cumsum().iloc[::-1]
+    @property
+    def angular_scatt_func(self):
+        """angular scattering function (rows x angles) in m^-1 sr^-1"""
+        if type(self.__angular_scatt_func) == type(None):
+            self._calculate(angular=True)
+        return self.__angular_scatt_func
+
+    @property
+    def angles(self):
+        """scattering angles of the angular scattering function in radians"""
+        if type(self.__angles) == type(None):
+            self._calculate(angular=True)
+        return self.__angles
 
-    extCoeff_perrow_perbin = pd.DataFrame(extCoeffPerLayer, index=index, columns=sdls.data.columns)
+    @property
+    def asymmetry_param(self):
+        if type(self.__asymmetry_param) == type(None):
+            scattering_coeff = np.nansum(self.scattering_coeff_per_bin, axis=1)
+            self.__asymmetry_param = _asymmetry_parameter(self.angular_scatt_func, scattering_coeff, self.angles)
+        return self.__asymmetry_param
+
+    def _calculate(self, angular=True):
+        """Does the Mie calculations and applies them to all rows at once.
+
+        Parameters
+        ----------
+        angular: bool
+            If False, only the crossections are calculated (at two angles)."""
+        noOfAngles = self.noOfAngles if angular else 2
+        diam = np.array(self.size_distribution.bincenters / 1000.)
+        wavelength = self.wavelength / 1000.
+        n = self.index_of_refraction
+
+        if not isinstance(n, pd.DataFrame):
+            if self.group:
+                self.group._calculate(angular=angular)
+            else:
+                mie = _perform_Miecalculations(diam, wavelength, n, noOfAngles=noOfAngles,
+                                               core_fraction=self.core_fraction, n_shell=self.n_shell)
+                self._set_mie_results(mie, angular)
+            return
+
+        n_values = np.asarray(n.iloc[:, 0].values, dtype=np.complex128)
+        if self.kernel_tolerance:
+            grid = MieKernelGrid(diam, wavelength, n_values, noOfAngles=noOfAngles, tolerance=self.kernel_tolerance)
+            self._apply(angular, n_values=n_values, grid=grid)
+        else:
+            self._apply(angular, n_values=n_values)
+
+    def _set_mie_results(self, mie, angular):
+        """Applies the results of _perform_Miecalculations (constant refractive index) to all rows"""
+        self._apply(angular, mie=mie)
+
+    def _apply(self, angular, n_values=None, mie=None, grid=None):
+        """Calculates the optical coefficients of all rows, see _optical_coefficients"""
+        # the memory layout of the results affects the last digits of later sums along the bins, make sure it is
+        # the same with and without the process pool
+        numb = np.ascontiguousarray(self.size_distribution.values, dtype=np.float64)
+        args = (np.array(self.size_distribution.bincenters / 1000.), self.wavelength / 1000.,
+                self.noOfAngles if angular else 2, angular, mie, grid)
+        if self.n_workers and self.n_workers > 1:
+            arrays = {'numb': numb}
+            if type(n_values) != type(None):
+                arrays['n'] = n_values
+            results = _parallel_tools.map_chunks(_optical_coefficients_chunk, arrays, self.n_workers,
+                                                 chunk_size=self.chunk_size, args=args,
+                                                 initializer=_init_worker_mie_cache,
+                                                 initargs=(_get_mie_cache_settings(),))
+            ext = np.concatenate([res[0] for res in results])
+            sca = np.concatenate([res[1] for res in results])
+            angles = None
+            for res in results:
+                if type(res[3]) != type(None):
+                    angles = res[3]
+            asf = None
+            if angular and type(angles) != type(None):
+                asf = []
+                for res in results:
+                    if type(res[2]) == type(None):
+                        # no valid refractive index in this chunk
+                        res_asf = np.zeros((res[0].shape[0], angles.shape[0]))
+                        res_asf[:] = np.nan
+                        asf.append(res_asf)
+                    else:
+                        asf.append(res[2])
+                asf = np.concatenate(asf)
+        else:
+            ext, sca, asf, angles = _optical_coefficients(numb, n_values, *args)
+
+        if type(angles) == type(None):
+            raise ValueError('No valid refractive index given.')
+        self._set_results(ext, sca, asf, angles, angular)
+
+    def _set_results(self, ext, sca, asf, angles, angular):
+        self.__extinction_coeff_per_bin = ext
+        self.__scattering_coeff_per_bin = sca
+        if angular:
+            self.__angular_scatt_func = asf
+            self.__angles = angles
+
+
+def _optical_coefficients(numb, n_values, diam, wavelength, noOfAngles, angular, mie=None, grid=None):
+    """Extinction and scattering coefficients (per bin) and the angular scattering function of the rows of numb.
+    Each row is calculated independently of the others, so the result of a row does not depend on which rows are
+    calculated together.
 
-    # if dist_class == 'SizeDist_TS':
-    #     out['extCoeff_perrow_perbin'] = timeseries.TimeSeries_2D(extCoeff_perrow_perbin)
-    if dist_class == 'SizeDist':
-        out['extCoeff_perrow_perbin'] = timeseries.TimeSeries(extCoeff_perrow_perbin)
+    Parameters
+    ----------
+    numb: 2D array
+        number concentrations (rows x bins), cm^-3
+    n_values: array
+        refractive index of each row (ignored if mie is given)
+    diam: array, um
+    wavelength: float, um
+    noOfAngles: int
+    angular: bool
+        if the angular scattering function is calculated
+    mie: tuple, optional
+        The result of _perform_Miecalculations, if the refractive index is constant.
+    grid: MieKernelGrid instance, optional
+        If given the results are interpolated from the grid.
+
+    Returns
+    -------
+    ext, sca, asf (None if angular is False), angles (None if there is no valid refractive index)
+    """
+    if type(mie) != type(None):
+        mie, angular_scatt_func = mie
+        ext, sca, asf = _kernel2optical_properties(numb, mie.extinction_crossection.values,
+                                                   mie.scattering_crossection.values,
+                                                   angular_scatt_func.values.transpose() if angular else None)
+        return ext, sca, asf, angular_scatt_func.index.values
+
+    if type(grid) != type(None):
+        ext, sca, asf = grid.get_optical_properties(numb, n_values, angular=angular)
+        return ext, sca, asf, grid.angles
+
+    # one Mie calculation for each distinct refractive index, applied to all rows with that refractive index
+    ext = np.zeros(numb.shape)
+    ext[:] = np.nan
+    sca = ext.copy()
+    asf = None
+    angles = None
+    for n_unique in pd.unique(n_values[pd.notnull(n_values)]):
+        rows = n_values == n_unique
+        mie, angular_scatt_func = _perform_Miecalculations(diam, wavelength, n_unique, noOfAngles=noOfAngles)
+        angles = angular_scatt_func.index.values
+        ext[rows], sca[rows], asf_rows = _kernel2optical_properties(
+            numb[rows], mie.extinction_crossection.values, mie.scattering_crossection.values,
+            angular_scatt_func.values.transpose() if angular else None)
+        if angular:
+            if asf is None:
+                asf = np.zeros((numb.shape[0], angles.shape[0]))
+                asf[:] = np.nan
+            asf[rows] = asf_rows
+    return ext, sca, asf, angles
+
+
+def _optical_coefficients_chunk(start, stop, arrays, *args):
+    """_optical_coefficients for the rows start to stop, executed in a worker process"""
+    n_values = arrays['n'][start:stop] if 'n' in arrays else None
+    return _optical_coefficients(arrays['numb'][start:stop], n_values, *args)
+
+
+def _get_mie_cache_settings():
+    cache = _mie_cache.get_default_cache()
+    if not cache:
+        return None
+    return {'path': cache.path, 'maxsize': cache.maxsize, 'x_digits': cache.x_digits,
+            'n_decimals': cache.n_decimals}
+
+
+def _init_worker_mie_cache(settings):
+    """Worker processes use the same Mie cache settings as the main process (results depend on the quantization)"""
+    if settings:
+        _mie_cache.enable(**settings)
     else:
-        out['extCoeff_perrow_perbin'] = extCoeff_perrow_perbin
-    # extCoeff_perrow = pd.DataFrame(extCoeff_perrow_perbin.sum(axis=1), columns=['ext_coeff'])
-    # if index.dtype == '<M8[ns]':
-    #     out['extCoeff_perrow'] = timeseries.TimeSeries(extCoeff_perrow)
-    # else:
-    #     out['extCoeff_perrow'] = extCoeff_perrow
+        _mie_cache.disable()
 
-    out['parent_type'] = dist_class
-    out['asymmetry_param'] = pd.DataFrame(asymmetry_parameter_LS, index=index,
-                                          columns=['asymmetry_param'])
-    # out['asymmetry_param_alt'] = pd.DataFrame(asymmetry_parameter_LS_alt, index=sdls.layercenters, columns = ['asymmetry_param_alt'])
-    # out['OptPropInstance']= OpticalProperties(out, self.bins)
-    out['wavelength'] = wavelength
-    out['index_of_refraction'] = n
-    out['bin_centers'] = sdls.bincenters
-    out['bins'] = sdls.bins
-    out['binwidth'] = sdls.binwidth
-    out['distType'] = sdls.distributionType
-    out['angular_scatt_func'] = angular_scatt_func_effective
-    # opt_properties = OpticalProperties(out, self.bins)
-    # opt_properties.wavelength = wavelength
-    # opt_properties.index_of_refractio = n
-    # opt_properties.angular_scatt_func = angular_scatt_func_effective  # This is the formaer phase_fct, but since it is the angular scattering intensity, i changed the name
-    # opt_properties.parent_dist_LS = self
-    if dist_class == 'SizeDist_TS':
-        return OpticalProperties_TS(out,parent = sd)
 
+class MieKernelGroup(object):
+    """MieKernels of a size distribution at several wavelengths. The size distribution is converted only once and
+    the Mie calculations for all kernels with a constant refractive index are done in a single batch.
 
-    return out
+    Parameters
+    ----------
+    sd: SizeDist, SizeDist_TS, or SizeDist_LS instance
+    wavelengths: array-like
+        in nm
+    ns: list
+        one refractive index (float, complex, or DataFrame) per wavelength
+    noOfAngles: int
+    kernel_tolerance: float, optional
+        see size_dist2optical_properties
+    n_workers, chunk_size: int, optional
+        see MieKernel
+    core_fraction: float, optional
+        see MieKernel
+    n_shells: list, optional
+        one refractive index of the shell per wavelength, see MieKernel
+    """
+    def __init__(self, sd, wavelengths, ns, noOfAngles=100, kernel_tolerance=None, n_workers=None, chunk_size=None,
+                 core_fraction=None, n_shells=None):
+        self.size_distribution = sd.convert2numberconcentration(deep=False)
+        self.noOfAngles = noOfAngles
+        self.core_fraction = core_fraction
+        if type(n_shells) == type(None):
+            n_shells = [None] * len(ns)
+        self.kernels = [MieKernel(sd, wl, n, noOfAngles=noOfAngles, kernel_tolerance=kernel_tolerance, group=self,
+                                  n_workers=n_workers, chunk_size=chunk_size, core_fraction=core_fraction,
+                                  n_shell=n_shell)
+                        for wl, n, n_shell in zip(wavelengths, ns, n_shells)]
+
+    def _calculate(self, angular=True):
+        """Mie calculations for all kernels with a constant refractive index"""
+        kernels = [k for k in self.kernels if not isinstance(k.index_of_refraction, pd.DataFrame)]
+        noOfAngles = self.noOfAngles if angular else 2
+        diam = np.array(self.size_distribution.bincenters / 1000.)
+        results = _perform_Miecalculations_multi(diam, [k.wavelength / 1000. for k in kernels],
+                                                 [k.index_of_refraction for k in kernels], noOfAngles=noOfAngles,
+                                                 core_fraction=self.core_fraction,
+                                                 n_shells=[k.n_shell for k in kernels])
+        for kernel, mie in zip(kernels, results):
+            kernel._set_mie_results(mie, angular)
+
+
+class OpticalPropertiesData(dict):
+    """Dictionary (data_orig of OpticalProperties) that calculates the entries derived from the Mie calculations
+    (extCoeff_perrow_perbin, scattCoeff_perrow_perbin, angular_scatt_func, asymmetry_param and, if aod is True,
+    AOD, AOD_layer, and AOD_cum) when they are first accessed.
+
+    Parameters
+    ----------
+    kernel: MieKernel instance
+    aod: bool
+        If the AOD entries are available (only makes sense for layer series).
+    """
+    def __init__(self, kernel, aod=False):
+        super().__init__()
+        self.kernel = kernel
+        self.aod = aod
+
+    def __missing__(self, key):
+        kernel = self.kernel
+        sdls = kernel.size_distribution
+        index = sdls._get_data_index()
+        if key == 'extCoeff_perrow_perbin':
+            value = pd.DataFrame(kernel.extinction_coeff_per_bin, index=index, columns=sdls._get_data_columns())
+            # if dist_class == 'SizeDist_TS':
+            #     out['extCoeff_perrow_perbin'] = timeseries.TimeSeries_2D(extCoeff_perrow_perbin)
+            if type(sdls).__name__ == 'SizeDist':
+                value = timeseries.TimeSeries(value)
+        elif key == 'scattCoeff_perrow_perbin':
+            value = pd.DataFrame(kernel.scattering_coeff_per_bin, index=index, columns=sdls._get_data_columns())
+            if type(sdls).__name__ == 'SizeDist':
+                value = timeseries.TimeSeries(value)
+        elif key == 'angular_scatt_func':
+            # equivalent to extCoeffPerLayer # similar to  _get_coefficients (converts everthing to meter)
+            value = pd.DataFrame(kernel.angular_scatt_func.transpose(), index=kernel.angles, columns=index)
+            value.index.name = 'angle'
+        elif key == 'asymmetry_param':
+            value = pd.DataFrame(kernel.asymmetry_param, index=index, columns=['asymmetry_param'])
+        elif key in ['AOD', 'AOD_layer', 'AOD_cum'] and self.aod:
+            #todo: use function that does a the interpolation instead of the sum?!? I guess this can lead to errors when layers are very thick, since centers are used instea dof edges?
+            layerThickness = sdls.layerbounderies[:, 1] - sdls.layerbounderies[:, 0]
+            AOD_layer = (kernel.extinction_coeff_per_bin * layerThickness[:, np.newaxis]).sum(axis=1)
+            self['AOD'] = AOD_layer[~ np.isnan(AOD_layer)].sum()
+            self['AOD_layer'] = pd.DataFrame(AOD_layer, index=sdls.layercenters, columns=['AOD per Layer'])
+            self['AOD_cum'] = self['AOD_layer'].iloc[::-1].cumsum().iloc[::-1]
+            return self[key]
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
 
 
 def hemispheric_backscattering(osf_df):
@@ -159,7 +494,7 @@ def hemispheric_backscattering(osf_df):
         f_b = f[x >= np.pi/2.]
         x_b = x[x >= np.pi/2.]
 
-        res_b = 2* np.pi * integrate.simps(f_b * np.sin(x_b),x_b)
+        res_b = 2* np.pi * integrate.simpson(f_b * np.sin(x_b),x_b)
         return res_b
 
     bs = np.zeros(osf_df.shape[0])
@@ -194,7 +529,7 @@ def hemispheric_forwardscattering(osf_df):
         f_f = f[x < np.pi/2.]
         x_f = x[x < np.pi/2.]
 
-        res_f = 2* np.pi * integrate.simps(f_f * np.sin(x_f),x_f)
+        res_f = 2* np.pi * integrate.simpson(f_f * np.sin(x_f),x_f)
         return res_f
 
     fs = np.zeros(osf_df.shape[0])
@@ -216,14 +551,14 @@ def hemispheric_forwardscattering(osf_df):
 # Todo: some functions should be switched of
 # todo: right now this for layer and time series, not ok
 class OpticalProperties(object):
+    """Optical properties of a size distribution. The quantities are calculated when they are first accessed
+    (see MieKernel), so asking for the extinction coefficient does not calculate the angular scattering function."""
     def __init__(self, data, parent = None):
         self.parent_sizedist = parent
 
         self.data_orig = data
         self.wavelength =  data['wavelength']
         self.index_of_refraction = data['index_of_refraction']
-        self.extinction_coeff_per_bin = data['extCoeff_perrow_perbin']
-        self.angular_scatt_func = data['angular_scatt_func']
 
         # self.asymmetry_param = data['asymmetry_param']
 
@@ -237,30 +572,62 @@ class OpticalProperties(object):
         self.bins = data['bins']
         self.binwidth = data['binwidth']
         self.distributionType = data['distType']
-        self._data_period = self.parent_sizedist._data_period
+        # only time series have a data period
+        self._data_period = getattr(self.parent_sizedist, '_data_period', None)
+
+        self.__scattering_coeff = None
+        self.__absorption_coeff = None
+        self.__phase_func = None
+        self.__hemispheric_forwardscattering = None
+        self.__hemispheric_backscattering = None
+        self.__hemispheric_backscattering_ratio = None
+        self.__hemispheric_forwardscattering_ratio = None
 
 
     # @property
     # def mean_effective_diameter(self):
     #     if not self.__mean_effective_diameter:
 
+    @property
+    def extinction_coeff_per_bin(self):
+        return self.data_orig['extCoeff_perrow_perbin']
+
+    @property
+    def scattering_coeff_per_bin(self):
+        return self.data_orig['scattCoeff_perrow_perbin']
+
+    @property
+    def absorption_coeff_per_bin(self):
+        return self.extinction_coeff_per_bin - self.scattering_coeff_per_bin
+
+    @property
+    def angular_scatt_func(self):
+        return self.data_orig['angular_scatt_func']
+
+    @property
+    def asymmetry_param(self):
+        return self.data_orig['asymmetry_param']
+
+    def _sum_along_d(self, per_bin, column):
+        if not isinstance(per_bin, pd.DataFrame):
+            per_bin = per_bin.data
+        data = per_bin.sum(axis=1)
+        df = pd.DataFrame()
+        df[column] = data
+        if self._parent_type == 'SizeDist_TS':
+            out = timeseries.TimeSeries(df)
+        elif self._parent_type in ['SizeDist', 'SizeDist_LS']:
+            out = df
+        else:
+            raise TypeError('not possible for this distribution type')
+        out._data_period = self._data_period
+        return out
 
     # todo: remove
     @property
     def extinction_coeff_sum_along_d(self):
         _warnings.warn('extinction_coeff_sum_along_d is deprecated and will be removed in future versions. Use extingction_coeff instead')
-        if not np.any(self.__extinction_coeff_sum_along_d):
-            data = self.extinction_coeff_per_bin.data.sum(axis = 1)
-            df = pd.DataFrame()
-            df['ext_coeff_m^1'] = data
-            if self._parent_type == 'SizeDist_TS':
-                self.__extinction_coeff_sum_along_d = timeseries.TimeSeries(df)
-            elif self._parent_type == 'SizeDist':
-                self.__extinction_coeff_sum_along_d = df
-            else:
-                raise TypeError('not possible for this distribution type')
-            self.__extinction_coeff_sum_along_d._data_period = self._data_period
-        return self.__extinction_coeff_sum_along_d
+        return self.extinction_coeff
 
     # todo: remove
     @extinction_coeff_sum_along_d.setter
@@ -270,43 +637,55 @@ class OpticalProperties(object):
     @property
     def extinction_coeff(self):
         if not np.any(self.__extinction_coeff_sum_along_d):
-            data = self.extinction_coeff_per_bin.data.sum(axis=1)
-            df = pd.DataFrame()
-            df['ext_coeff_m^1'] = data
-            if self._parent_type == 'SizeDist_TS':
-                self.__extinction_coeff_sum_along_d = timeseries.TimeSeries(df)
-            elif self._parent_type == 'SizeDist':
-                self.__extinction_coeff_sum_along_d = df
-            else:
-                raise TypeError('not possible for this distribution type')
-            self.__extinction_coeff_sum_along_d._data_period = self._data_period
+            self.__extinction_coeff_sum_along_d = self._sum_along_d(self.extinction_coeff_per_bin, 'ext_coeff_m^1')
         return self.__extinction_coeff_sum_along_d
 
     @extinction_coeff.setter
     def extinction_coeff(self, data):
         self.__extinction_coeff_sum_along_d = data
 
+    @property
+    def scattering_coeff(self):
+        if not np.any(self.__scattering_coeff):
+            self.__scattering_coeff = self._sum_along_d(self.scattering_coeff_per_bin, 'scatt_coeff_m^1')
+        return self.__scattering_coeff
+
+    @property
+    def absorption_coeff(self):
+        if not np.any(self.__absorption_coeff):
+            self.__absorption_coeff = self._sum_along_d(self.absorption_coeff_per_bin, 'abs_coeff_m^1')
+        return self.__absorption_coeff
+
+    @property
+    def phase_func(self):
+        """angular scattering function normalized by the scattering coefficient (4 pi sr)"""
+        if not np.any(self.__phase_func):
+            scattering_coeff = self.scattering_coeff.iloc[:, 0].values
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self.__phase_func = self.angular_scatt_func * 4 * np.pi / scattering_coeff
+        return self.__phase_func
+
     @property
     def hemispheric_backscattering(self):
-        if not self.__hemispheric_backscattering:
-            self.__hemispheric_backscattering = hemispheric_backscattering(self.angular_scatt_func)
+        if not np.any(self.__hemispheric_backscattering):
+            self.__hemispheric_backscattering = hemispheric_backscattering(self.angular_scatt_func.transpose())
         return self.__hemispheric_backscattering
 
     @property
     def hemispheric_forwardscattering(self):
-        if not self.__hemispheric_forwardscattering:
-            self.__hemispheric_forwardscattering = hemispheric_forwardscattering(self.angular_scatt_func)
+        if not np.any(self.__hemispheric_forwardscattering):
+            self.__hemispheric_forwardscattering = hemispheric_forwardscattering(self.angular_scatt_func.transpose())
         return self.__hemispheric_forwardscattering
 
     @property
     def hemispheric_backscattering_ratio(self):
-        if not self.__hemispheric_backscattering_ratio:
+        if not np.any(self.__hemispheric_backscattering_ratio):
             self.__hemispheric_backscattering_ratio = self.hemispheric_backscattering / self.extinction_coeff
         return self.__hemispheric_backscattering_ratio
 
     @property
     def hemispheric_forwardscattering_ratio(self):
-        if not self.hemispheric_forwardscattering_ratio:
+        if not np.any(self.__hemispheric_forwardscattering_ratio):
             self.__hemispheric_forwardscattering_ratio = self.hemispheric_forwardscattering / self.extinction_coeff
         return self.__hemispheric_forwardscattering_ratio
 
@@ -321,17 +700,62 @@ class OpticalProperties(object):
 class OpticalProperties_TS(OpticalProperties):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.extinction_coeff_per_bin = timeseries.TimeSeries_2D(self.extinction_coeff_per_bin)
-        self.extinction_coeff_per_bin._data_period = self.parent_sizedist._data_period
-
-        self.angular_scatt_func = timeseries.TimeSeries_2D(self.angular_scatt_func.transpose())
-        self.angular_scatt_func._data_period = self.parent_sizedist._data_period
+        self.__extinction_coeff_per_bin = None
+        self.__scattering_coeff_per_bin = None
+        self.__angular_scatt_func = None
+        self.__asymmetry_param = None
+        self.__phase_func = None
 
         self.__hemispheric_forwardscattering = None
         self.__hemispheric_backscattering = None
         self.__hemispheric_backscattering_ratio = None
         self.__hemispheric_forwardscattering_ratio = None
 
+    def _to_timeseries_2D(self, df):
+        out = timeseries.TimeSeries_2D(df)
+        out._data_period = self.parent_sizedist._data_period
+        return out
+
+    @property
+    def extinction_coeff_per_bin(self):
+        if not self.__extinction_coeff_per_bin:
+            self.__extinction_coeff_per_bin = self._to_timeseries_2D(self.data_orig['extCoeff_perrow_perbin'])
+        return self.__extinction_coeff_per_bin
+
+    @property
+    def scattering_coeff_per_bin(self):
+        if not self.__scattering_coeff_per_bin:
+            self.__scattering_coeff_per_bin = self._to_timeseries_2D(self.data_orig['scattCoeff_perrow_perbin'])
+        return self.__scattering_coeff_per_bin
+
+    @property
+    def absorption_coeff_per_bin(self):
+        return self._to_timeseries_2D(self.data_orig['extCoeff_perrow_perbin'] -
+                                      self.data_orig['scattCoeff_perrow_perbin'])
+
+    @property
+    def angular_scatt_func(self):
+        if not self.__angular_scatt_func:
+            self.__angular_scatt_func = self._to_timeseries_2D(self.data_orig['angular_scatt_func'].transpose())
+        return self.__angular_scatt_func
+
+    @property
+    def asymmetry_param(self):
+        if not self.__asymmetry_param:
+            out = timeseries.TimeSeries(self.data_orig['asymmetry_param'])
+            out._data_period = self.parent_sizedist._data_period
+            self.__asymmetry_param = out
+        return self.__asymmetry_param
+
+    @property
+    def phase_func(self):
+        """angular scattering function normalized by the scattering coefficient (4 pi sr)"""
+        if not self.__phase_func:
+            scattering_coeff = self.scattering_coeff.data.iloc[:, 0].values
+            with np.errstate(invalid='ignore', divide='ignore'):
+                data = self.angular_scatt_func.data * 4 * np.pi / scattering_coeff[:, np.newaxis]
+            self.__phase_func = self._to_timeseries_2D(data)
+        return self.__phase_func
 
     @property
     def hemispheric_backscattering(self):
@@ -376,6 +800,84 @@ class OpticalProperties_TS(OpticalProperties):
 
 
 
+class OpticalPropertiesMultiWavelength(object):
+    """Optical properties of a size distribution at several wavelengths. Indexing with a wavelength returns the
+    OpticalProperties (OpticalProperties_TS) instance of that wavelength. Quantities with a single value per row
+    (e.g. the extinction coefficient) are also available for all wavelengths at once, with one column per
+    wavelength.
+
+    Parameters
+    ----------
+    optical_properties: list
+        OpticalProperties instances, one per wavelength
+    """
+    def __init__(self, optical_properties):
+        self.optical_properties = optical_properties
+        self.wavelengths = np.array([opt.wavelength for opt in optical_properties], dtype=float)
+        self.parent_sizedist = optical_properties[0].parent_sizedist
+        self._parent_type = optical_properties[0]._parent_type
+        self._data_period = optical_properties[0]._data_period
+
+    def __getitem__(self, wavelength):
+        idx = np.where(np.isclose(self.wavelengths, wavelength))[0]
+        if idx.shape[0] == 0:
+            raise KeyError('No optical properties for wavelength %s. Available are: %s' % (wavelength,
+                                                                                             self.wavelengths))
+        return self.optical_properties[idx[0]]
+
+    def __iter__(self):
+        return iter(self.wavelengths)
+
+    def __len__(self):
+        return self.wavelengths.shape[0]
+
+    def items(self):
+        return zip(self.wavelengths, self.optical_properties)
+
+    def _collect(self, attribute):
+        values = []
+        for opt in self.optical_properties:
+            value = getattr(opt, attribute)
+            if not isinstance(value, pd.DataFrame):
+                value = value.data
+            values.append(value.iloc[:, 0].values)
+        df = pd.DataFrame(np.array(values).transpose(), index=value.index, columns=self.wavelengths)
+        df.columns.name = 'wavelength'
+        if self._parent_type == 'SizeDist_TS':
+            df = timeseries.TimeSeries(df)
+            df._data_period = self._data_period
+        return df
+
+    @property
+    def extinction_coeff(self):
+        return self._collect('extinction_coeff')
+
+    @property
+    def scattering_coeff(self):
+        return self._collect('scattering_coeff')
+
+    @property
+    def absorption_coeff(self):
+        return self._collect('absorption_coeff')
+
+    @property
+    def asymmetry_param(self):
+        return self._collect('asymmetry_param')
+
+    @property
+    def AOD(self):
+        """AOD at each wavelength (only if calculated with AOD = True)"""
+        return pd.Series([opt.data_orig['AOD'] for opt in self.optical_properties], index=self.wavelengths)
+
+    @property
+    def AOD_layer(self):
+        """AOD of each layer (rows) at each wavelength (columns) (only if calculated with AOD = True)"""
+        df = pd.concat([opt.data_orig['AOD_layer'].iloc[:, 0] for opt in self.optical_properties], axis=1)
+        df.columns = self.wavelengths
+        df.columns.name = 'wavelength'
+        return df
+
+
 #Todo: bins are redundand
 # Todo: some functions should be switched of
 # todo: right now this for layer and time series, not ok
@@ -471,7 +973,286 @@ class ExtinctionCoeffVerticlProfile(vertical_profile.VerticalProfile):
         return a
 
 
-def _perform_Miecalculations(diam, wavelength, n, noOfAngles=100.):
+class MieKernelGrid(object):
+    """Mie results on a grid of refractive indices, from which the results for arbitrary refractive indices
+    (within the grid) are linearly interpolated. This makes optical property calculations with a time dependent
+    refractive index (e.g. after hygroscopic growth) a matter of a few matrix multiplications.
+
+    The grid covers the range of the given refractive indices. Its first axis is aligned with the direction in the
+    complex plane along which the refractive indices vary. If they all lie on a straight line (which is the case
+    for the volume mixing rule used in apply_hygro_growth) the grid is one dimensional. The grid is refined
+    (doubled) along each axis until the interpolation error at the new grid points is smaller than the tolerance.
+
+    Parameters
+    ----------
+    diam: array
+        diameters in um
+    wavelength: float
+        wavelength in um
+    n: array-like
+        the refractive indices which the grid has to cover
+    noOfAngles: int
+    tolerance: float
+        Maximum relative interpolation error of the extinction and scattering crossections and the angular
+        scattering function (relative to its maximum for each diameter).
+    max_grid_points: int
+        Maximum total number of grid points. A ValueError is raised if the tolerance can not be met with this
+        number of grid points.
+
+    Attributes
+    ----------
+    interpolation_error: list
+        The interpolation error along each axis. It is measured at the grid points added by the last refinement,
+        that is, it is the error of the grid before the last refinement and an upper estimate of the error of the
+        final grid.
+    """
+    def __init__(self, diam, wavelength, n, noOfAngles=100, tolerance=1e-3, max_grid_points=513):
+        self.diameter = np.asarray(diam)
+        self.wavelength = wavelength
+        self.noOfAngles = noOfAngles
+        self.tolerance = tolerance
+        self.max_grid_points = max_grid_points
+
+        n = np.asarray(n, dtype=np.complex128)
+        n = n[np.isfinite(n)]
+        if n.shape[0] == 0:
+            raise ValueError('No finite refractive index given.')
+
+        # direction of the first grid axis
+        far = n[np.argmax(np.abs(n - n[0]))]
+        if far == n[0]:
+            self.direction = 1. + 0j
+        else:
+            self.direction = (far - n[0]) / np.abs(far - n[0])
+            deviation = np.abs(((n - n[0]) * np.conj(self.direction)).imag)
+            if deviation.max() > 1e-9 * np.abs(far - n[0]):
+                # not on a line, fall back to a grid over the real and imaginary part
+                self.direction = 1. + 0j
+
+        coords = self._get_coordinates(n)
+        self.grid = [self._initial_axis(coords[0]), self._initial_axis(coords[1])]
+        self.interpolation_error = [np.inf if axis.shape[0] > 1 else 0. for axis in self.grid]
+        self.extinction_crossection, self.scattering_crossection, self.angular_scatt_func = self._calculate(
+            *self.grid)
+        self._refine(0)
+        self._refine(1)
+
+    def _get_coordinates(self, n):
+        rotated = n * np.conj(self.direction)
+        return rotated.real, rotated.imag
+
+    @staticmethod
+    def _initial_axis(values):
+        if values.max() - values.min() <= 1e-12 * max(1, abs(values.max())):
+            return np.array([values.min()])
+        else:
+            return np.linspace(values.min(), values.max(), 3)
+
+    def _calculate(self, axis_0, axis_1):
+        """Mie calculations for all diameters at all grid points.
+
+        Returns
+        -------
+        extinction and scattering crossections (shape = (diameters, axis_0, axis_1)) and the angular scattering
+        function (shape = (diameters, angles, axis_0, axis_1))"""
+        nodes = ((axis_0[:, np.newaxis] + 1j * axis_1[np.newaxis, :]) * self.direction).ravel()
+        no_d = self.diameter.shape[0]
+        x = np.pi * self.diameter / self.wavelength
+
+        ext = np.zeros((no_d, nodes.shape[0]))
+        sca = np.zeros((no_d, nodes.shape[0]))
+        asf = None
+        # limit the number of particles per batch to keep the memory footprint small
+        chunk = max(1, 20000 // no_d)
+        for start in range(0, nodes.shape[0], chunk):
+            sub = nodes[start: start + chunk]
+            mie = bhmie.bhmie_hagen_batch(np.tile(x, sub.shape[0]), np.repeat(sub, no_d), self.noOfAngles,
+                                          diameter=np.tile(self.diameter, sub.shape[0]),
+                                          cache=_mie_cache.get_default_cache())
+            if asf is None:
+                self.angles = mie.angles
+                asf = np.zeros((no_d, self.angles.shape[0], nodes.shape[0]))
+            ext[:, start: start + chunk] = mie.cext.reshape(sub.shape[0], no_d).transpose()
+            sca[:, start: start + chunk] = mie.csca.reshape(sub.shape[0], no_d).transpose()
+            asf[:, :, start: start + chunk] = np.moveaxis(
+                mie.natural.reshape(sub.shape[0], no_d, self.angles.shape[0]), 0, 2)
+
+        shape = (axis_0.shape[0], axis_1.shape[0])
+        return ext.reshape((no_d,) + shape), sca.reshape((no_d,) + shape), asf.reshape((no_d, self.angles.shape[0]) + shape)
+
+    def _refine(self, axis):
+        """Doubles the grid along axis until the tolerance is met. Raises a ValueError if this needs more than
+        max_grid_points grid points."""
+        while self.grid[axis].shape[0] > 1:
+            new_axis = np.linspace(self.grid[axis][0], self.grid[axis][-1], self.grid[axis].shape[0] * 2 - 1)
+            if new_axis.shape[0] * self.grid[1 - axis].shape[0] > self.max_grid_points:
+                txt = ('Maximum number of grid points (%s) reached before the tolerance (%s) was met, the '
+                       'interpolation error is %s. Increase the tolerance or do the Mie calculations for each '
+                       'refractive index (no kernel_tolerance).' % (self.max_grid_points, self.tolerance,
+                                                                     self.interpolation_error[axis]))
+                raise ValueError(txt)
+            mid_points = list(self.grid)
+            mid_points[axis] = new_axis[1::2]
+            ext, sca, asf = self._calculate(*mid_points)
+
+            errors = []
+            merged = []
+            for new, old in zip([ext, sca, asf],
+                                [self.extinction_crossection, self.scattering_crossection, self.angular_scatt_func]):
+                ax = new.ndim - 2 + axis
+
+                # linear interpolation to the new grid points is the mean of the neighbouring old grid points
+                interpolated = (np.take(old, np.arange(old.shape[ax] - 1), axis=ax) +
+                                np.take(old, np.arange(1, old.shape[ax]), axis=ax)) / 2.
+                norm = np.abs(new)
+                if new.ndim == 4:
+                    norm = norm.max(axis=1, keepdims=True)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    errors.append(np.nanmax(np.abs(interpolated - new) / norm))
+
+                # merge old and new grid points
+                shape = list(old.shape)
+                shape[ax] = new_axis.shape[0]
+                both = np.zeros(shape)
+                idx = [slice(None)] * new.ndim
+                idx[ax] = slice(0, None, 2)
+                both[tuple(idx)] = old
+                idx[ax] = slice(1, None, 2)
+                both[tuple(idx)] = new
+                merged.append(both)
+            self.extinction_crossection, self.scattering_crossection, self.angular_scatt_func = merged
+            self.grid[axis] = new_axis
+            self.interpolation_error[axis] = max(errors)
+
+            if self.interpolation_error[axis] < self.tolerance:
+                break
+        return
+
+    def get_weights(self, n):
+        """Returns the (bilinear) interpolation weights of the refractive indices n and the grid points they refer
+        to (index of the flattened grid), both shape = (len(n), 4). Weights of non-finite n are nan."""
+        n = np.asarray(n, dtype=np.complex128)
+        index = []
+        fraction = []
+        for grid, values in zip(self.grid, self._get_coordinates(n)):
+            if grid.shape[0] == 1:
+                index.append(np.zeros(values.shape, dtype=int))
+                fraction.append(np.zeros(values.shape))
+                continue
+            step = grid[1] - grid[0]
+            idx = np.clip(np.floor((values - grid[0]) / step), 0, grid.shape[0] - 2)
+            idx[~np.isfinite(idx)] = 0
+            idx = idx.astype(int)
+            index.append(idx)
+            fraction.append((values - grid[idx]) / step)
+
+        no_0, no_1 = self.grid[0].shape[0], self.grid[1].shape[0]
+        nodes = np.zeros((n.shape[0], 4), dtype=int)
+        weights = np.zeros((n.shape[0], 4))
+        for k, (d0, d1) in enumerate([(0, 0), (0, 1), (1, 0), (1, 1)]):
+            w0 = fraction[0] if d0 else 1 - fraction[0]
+            w1 = fraction[1] if d1 else 1 - fraction[1]
+            i0 = np.minimum(index[0] + d0, no_0 - 1)
+            i1 = np.minimum(index[1] + d1, no_1 - 1)
+            nodes[:, k] = i0 * no_1 + i1
+            weights[:, k] = w0 * w1
+        weights[~np.isfinite(n)] = np.nan
+        return nodes, weights
+
+    def get_optical_properties(self, numb, n, angular=True):
+        """Extinction and scattering coefficients (per bin) and the effective angular scattering function for each
+        row of a number concentration matrix.
+
+        Parameters
+        ----------
+        numb: 2D array
+            number concentration, shape = (rows, diameters), unit: cm^-3
+        n: array
+            refractive index of each row
+        angular: bool
+            If False the angular scattering function is not calculated (None is returned instead).
+
+        Returns
+        -------
+        extinction and scattering coefficient per bin (rows x diameters) and angular scattering function
+        (rows x angles)
+        """
+        nodes, weights = self.get_weights(n)
+        no_nodes = self.extinction_crossection[0].size
+        ext = self.extinction_crossection.reshape(self.diameter.shape[0], no_nodes)
+        sca = self.scattering_crossection.reshape(self.diameter.shape[0], no_nodes)
+        asf = self.angular_scatt_func.reshape(self.diameter.shape[0], self.angles.shape[0], no_nodes)
+        return _kernel2optical_properties(numb, ext, sca, asf if angular else None, weights=weights, nodes=nodes)
+
+
+def _kernel2optical_properties(numb, ext, sca, asf=None, weights=None, nodes=None):
+    """Optical coefficients for each row of the number concentration matrix numb from the Mie results at one or
+    more refractive index nodes.
+
+    Parameters
+    ----------
+    numb: 2D array, shape = (rows, diameters), unit: cm^-3
+    ext, sca: arrays, crossections, shape = (diameters,) or (diameters, nodes), unit: um^2
+    asf: array, optional
+        angular scattering function, shape = (diameters, angles) or (diameters, angles, nodes)
+    weights: 2D array, optional
+        Weights of the nodes given in nodes for each row, shape = (rows, nodes per row). If None, there is only a
+        single node (a single refractive index).
+    nodes: 2D int array, optional
+        The nodes the weights refer to, same shape as weights.
+
+    Returns
+    -------
+    extinction and scattering coefficient per bin (rows x diameters) in m^-1 and the angular scattering function
+    (rows x angles, None if asf is None)
+    """
+    # nan are ignored in the sums below (like pandas does)
+    numb_nn = np.nan_to_num(numb)
+    pfe = None
+    if weights is None:
+        # like in _get_coefficients
+        extinction_coeff = numb * 1e6 * (ext * 1e-12)
+        scattering_coeff = numb * 1e6 * (sca * 1e-12)
+        if type(asf) != type(None):
+            pfe = _rowwise_dot(numb_nn, asf)
+    else:
+        extinction_coeff = numb * 1e6 * ((weights[:, :, np.newaxis] * ext.transpose()[nodes]).sum(axis=1) * 1e-12)
+        scattering_coeff = numb * 1e6 * ((weights[:, :, np.newaxis] * sca.transpose()[nodes]).sum(axis=1) * 1e-12)
+        if type(asf) != type(None):
+            asf_nodes = np.moveaxis(asf, 2, 0)
+            pfe = np.zeros((numb.shape[0], asf.shape[1]))
+            # the angular scattering functions of the nodes are gathered for each row, limit the rows per step to
+            # keep the memory footprint small
+            chunk = max(1, 2 ** 20 // (asf.shape[0] * asf.shape[1]))
+            for start in range(0, numb.shape[0], chunk):
+                rows = slice(start, start + chunk)
+                for k in range(nodes.shape[1]):
+                    pfe[rows] += weights[rows, k:k + 1] * np.matmul(numb_nn[rows, np.newaxis, :],
+                                                                    asf_nodes[nodes[rows, k]])[:, 0, :]
+
+    if type(pfe) != type(None):
+        pfe = pfe * 1e-12 * 1e6
+    return extinction_coeff, scattering_coeff, pfe
+
+
+def _rowwise_dot(a, b):
+    """Same as a.dot(b), but as a stack of vector matrix products. The matrix product of BLAS can differ in the last
+    digits depending on the number of rows, while here the result of a row does not depend on the other rows (which
+    makes results of chunks of rows identical to the result of all rows at once)."""
+    return np.matmul(a[:, np.newaxis, :], b)[:, 0, :]
+
+
+def _asymmetry_parameter(angular_scatt_func, scattering_coeff, angles):
+    """Asymmetry parameter from the angular scattering function (rows x angles) and the scattering coefficient
+    (rows)"""
+    y_1p = angular_scatt_func[:, angles < np.pi]
+    x_1p = angles[angles < np.pi]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y_phase_func = y_1p * 4 * np.pi / scattering_coeff[:, np.newaxis]
+    return .5 * integrate.simpson(np.cos(x_1p) * y_phase_func * np.sin(x_1p), x_1p, axis=1)
+
+
+def _perform_Miecalculations(diam, wavelength, n, noOfAngles=100., core_fraction=None, n_shell=None):
     """
     Performs Mie calculations
 
@@ -483,6 +1264,11 @@ def _perform_Miecalculations(diam, wavelength, n, noOfAngles=100.):
                 Wavelength of light in um for which to perform calculations
     n:          complex
                 Ensemble complex index of refraction
+    core_fraction: float, optional
+                If given, particles are coated spheres with a core of this volume fraction. n is the refractive
+                index of the core in this case.
+    n_shell:    complex, optional
+                Refractive index of the shell (only with core_fraction)
 
     Returns
         panda DataTable with the diameters as the index and the mie_scattering results in the different collumns
@@ -490,66 +1276,73 @@ def _perform_Miecalculations(diam, wavelength, n, noOfAngles=100.):
                                       meter. This is in principle the AOD of an L
 
     """
+    return _perform_Miecalculations_multi(diam, [wavelength], [n], noOfAngles=noOfAngles,
+                                          core_fraction=core_fraction, n_shells=[n_shell])[0]
 
 
-    diam = np.asarray(diam)
-
-    extinction_efficiency = np.zeros(diam.shape)
-    scattering_efficiency = np.zeros(diam.shape)
-    absorption_efficiency = np.zeros(diam.shape)
-
-    extinction_crossection = np.zeros(diam.shape)
-    scattering_crossection = np.zeros(diam.shape)
-    absorption_crossection = np.zeros(diam.shape)
-
-    # phase_function_natural = pd.DataFrame()
-    angular_scattering_natural = pd.DataFrame()
-    # extinction_coefficient = np.zeros(diam.shape)
-    # scattering_coefficient = np.zeros(diam.shape)
-    # absorption_coefficient = np.zeros(diam.shape)
+def _perform_Miecalculations_multi(diam, wavelengths, ns, noOfAngles=100., core_fraction=None, n_shells=None):
+    """Same as _perform_Miecalculations for several wavelengths (and refractive indices). All wavelengths are done
+    in a single batch.
 
+    Parameters
+    ----------
+    diam: array, um
+    wavelengths: array-like, um
+    ns: list of complex
+        one refractive index per wavelength
+    noOfAngles: int
+    core_fraction: float, optional
+        see _perform_Miecalculations
+    n_shells: list of complex, optional
+        one refractive index of the shell per wavelength (only with core_fraction)
 
+    Returns
+    -------
+    list of tuples, one for each wavelength, with the results of _perform_Miecalculations
+    """
+    diam = np.asarray(diam)
+    no_d = diam.shape[0]
 
     # Function for calculating the size parameter for wavelength l and radius r
     sp = lambda r, l: 2. * np.pi * r / l
-    for e, d in enumerate(diam):
-        radius = d / 2.
-
-        # print('sp(radius, wavelength)', sp(radius, wavelength))
-        # print('n', n)
-        # print('d', d)
-
-        mie = bhmie.bhmie_hagen(sp(radius, wavelength), n, noOfAngles, diameter=d)
-        values = mie.return_Values_as_dict()
-        extinction_efficiency[e] = values['extinction_efficiency']
 
-        # print("values['extinction_crosssection']",values['extinction_crosssection'])
-
-
-        scattering_efficiency[e] = values['scattering_efficiency']
-        absorption_efficiency[e] = values['extinction_efficiency'] - values['scattering_efficiency']
-
-        extinction_crossection[e] = values['extinction_crosssection']
-        scattering_crossection[e] = values['scattering_crosssection']
-        absorption_crossection[e] = values['extinction_crosssection'] - values['scattering_crosssection']
-
-        # phase_function_natural[d] = values['phaseFct_natural']['Phase_function_natural'].values
-        angular_scattering_natural[d] = mie.get_angular_scatt_func().natural.values
-
-        # print('\n')
-
-    # phase_function_natural.index = values['phaseFct_natural'].index
-    angular_scattering_natural.index = mie.get_angular_scatt_func().index
-
-    out = pd.DataFrame(index=diam)
-    out['extinction_efficiency'] = pd.Series(extinction_efficiency, index=diam)
-    out['scattering_efficiency'] = pd.Series(scattering_efficiency, index=diam)
-    out['absorption_efficiency'] = pd.Series(absorption_efficiency, index=diam)
-
-    out['extinction_crossection'] = pd.Series(extinction_crossection, index=diam)
-    out['scattering_crossection'] = pd.Series(scattering_crossection, index=diam)
-    out['absorption_crossection'] = pd.Series(absorption_crossection, index=diam)
-    return out, angular_scattering_natural
+    # all diameters (and wavelengths) are calculated at once, if the Mie cache is enabled results are taken from there
+    x = np.concatenate([sp(diam / 2., wl) for wl in wavelengths])
+    n = np.repeat(np.asarray(ns, dtype=np.complex128), no_d)
+    if type(core_fraction) != type(None):
+        n_shell = np.repeat(np.asarray(n_shells, dtype=np.complex128), no_d)
+        mie = _mie_coated.MieCoatedBatch(x * core_fraction ** (1. / 3.), x, n, n_shell, noOfAngles,
+                                         diameter=np.tile(diam, len(wavelengths)),
+                                         cache=_mie_cache.get_default_cache())
+    else:
+        mie = bhmie.bhmie_hagen_batch(x, n, noOfAngles, diameter=np.tile(diam, len(wavelengths)),
+                                      cache=_mie_cache.get_default_cache())
+    angular_scatt_func = mie.natural
+    angles = mie.angles
+
+    results = []
+    for e in range(len(wavelengths)):
+        part = slice(e * no_d, (e + 1) * no_d)
+        extinction_efficiency = mie.qext[part]
+        scattering_efficiency = mie.qsca[part]
+        absorption_efficiency = mie.qext[part] - mie.qsca[part]
+
+        extinction_crossection = mie.cext[part]
+        scattering_crossection = mie.csca[part]
+        absorption_crossection = mie.cext[part] - mie.csca[part]
+
+        angular_scattering_natural = pd.DataFrame(angular_scatt_func[part].transpose(), index=angles, columns=diam)
+        angular_scattering_natural.index.name = 'angle'
+
+        out = pd.DataFrame({'extinction_efficiency': extinction_efficiency,
+                            'scattering_efficiency': scattering_efficiency,
+                            'absorption_efficiency': absorption_efficiency,
+                            'extinction_crossection': extinction_crossection,
+                            'scattering_crossection': scattering_crossection,
+                            'absorption_crossection': absorption_crossection},
+                           index=diam)
+        results.append((out, angular_scattering_natural))
+    return results
 
 
 def _get_coefficients(crossection, cn):
@@ -598,7 +1391,7 @@ def vertical_profile2accumulative_AOD(timeseries):
         # for e,i in enumerate(x):
         for e in range(x.shape[0]):
             end = e+1
-            accu_aod[e][col] = -integrate.simps(y[st:end],x[st:end])
+            accu_aod[e][col] = -integrate.simpson(y[st:end],x[st:end])
 
     accu_aod = pd.DataFrame(accu_aod, index = x, columns=data.keys())
     accu_aod = vertical_profile.VerticalProfile(accu_aod)
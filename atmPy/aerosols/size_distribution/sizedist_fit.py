@@ -0,0 +1,205 @@
+"""Batched fitting of (multi-modal) normal distributions to the rows of a size distribution. All rows are fitted
+together with a vectorized Levenberg-Marquardt, the initial guesses are derived from the moments of each row.
+Used by SizeDist.fit_normal."""
+import numpy as _np
+
+
+def gauss_modes(x, params):
+    """Sum of normal distributions (see math_functions.gauss) for each row of params
+
+    Parameters
+    ----------
+    x: 1D array
+    params: 2D array
+        rows x (3 * no_of_modes), for each mode amp, pos, sigma
+
+    Returns
+    -------
+    2D array: rows x len(x)"""
+    return _model_and_jacobian(x, params, jacobian=False)
+
+
+def get_moment_guess(x, data, modes=1):
+    """Initial guesses of the parameters from the moments of each row (NaNs are ignored).
+
+    For one mode the position and width are the mean and standard deviation of x weighted with the data (the
+    geometric mean and geometric standard deviation if x is log10 of the diameter) and the amplitude follows from
+    the integral. For several modes the positions and amplitudes are those of the highest peaks of the smoothed
+    row (window of about a tenth of the bins), if there are not enough peaks the positions are placed at evenly
+    spaced quantiles of the row. The widths are the standard deviation divided by the number of modes.
+
+    Parameters
+    ----------
+    x: 1D array
+    data: 2D array, rows x len(x)
+    modes: int
+
+    Returns
+    -------
+    2D array: rows x (3 * modes), nan for rows without positive values
+    """
+    data = _np.where(_np.isnan(data), 0, data)
+    data = _np.clip(data, 0, None)
+    dx = _np.abs(_np.gradient(x))
+    weights = data * dx
+    total = weights.sum(axis=1)
+    with _np.errstate(invalid='ignore', divide='ignore'):
+        mean = weights.dot(x) / total
+        std = _np.sqrt((weights * (x[_np.newaxis, :] - mean[:, _np.newaxis]) ** 2).sum(axis=1) / total)
+        amp = total / (std * _np.sqrt(2 * _np.pi))
+
+    params = _np.zeros((data.shape[0], 3 * modes))
+    if modes == 1:
+        params[:, 0] = amp
+        params[:, 1] = mean
+        params[:, 2] = std
+    else:
+        with _np.errstate(invalid='ignore', divide='ignore'):
+            cdf = weights.cumsum(axis=1) / total[:, _np.newaxis]
+        rows = _np.arange(data.shape[0])
+        smoothed = _smooth(data, max(3, x.shape[0] // 10))
+        padded = _np.pad(smoothed, ((0, 0), (1, 1)), constant_values=-_np.inf)
+        peaks = (smoothed >= padded[:, :-2]) & (smoothed > padded[:, 2:]) & (smoothed > 0)
+        score = _np.where(peaks, smoothed, -_np.inf)
+        highest = _np.argsort(-score, axis=1)[:, :modes]
+        # modes without peak go to the quantiles
+        no_peak = ~_np.isfinite(score[rows[:, _np.newaxis], highest])
+        for i in range(modes):
+            idx = _np.where(no_peak[:, i], _np.argmax(cdf >= (i + 0.5) / modes, axis=1), highest[:, i])
+            params[:, 3 * i] = _np.where(no_peak[:, i], data[rows, idx], smoothed[rows, idx])
+            params[:, 3 * i + 1] = x[idx]
+            params[:, 3 * i + 2] = std / modes
+    params[~(total > 0)] = _np.nan
+    return params
+
+
+def fit_normal_batch(x, data, modes=1, p0=None, max_iter=1000, ftol=1e-10, xtol=1e-10, chunk_size=10000):
+    """Least square fit of the sum of modes normal distributions to each row of data.
+
+    Parameters
+    ----------
+    x: 1D array
+    data: 2D array, rows x len(x)
+        NaNs are ignored
+    modes: int
+    p0: array-like, optional
+        Initial parameters (amp, pos, sigma for each mode) used for all rows. If None, they are derived from the
+        moments of each row (see get_moment_guess).
+    max_iter: int
+        Rows which did not converge after max_iter iterations are set to nan.
+    ftol, xtol: float
+        Relative tolerance of the sum of squares and of the parameters
+    chunk_size: int
+        Number of rows fitted at once (limits the memory of the jacobian).
+
+    Returns
+    -------
+    2D array: rows x (3 * modes), for each mode amp, pos, sigma (sigma is positive). The modes are sorted by
+        position, rows where the fit failed are nan.
+    """
+    x = _np.asarray(x, dtype=_np.float64)
+    data = _np.asarray(data, dtype=_np.float64)
+    if type(p0) == type(None):
+        params = get_moment_guess(x, data, modes=modes)
+    else:
+        p0 = _np.asarray(p0, dtype=_np.float64)
+        if p0.shape != (3 * modes,):
+            txt = 'p0 has to have 3 values (amp, pos, sigma) per mode, it has %s' % (p0.shape,)
+            raise ValueError(txt)
+        params = _np.repeat(p0[_np.newaxis, :], data.shape[0], axis=0)
+
+    out = _np.full(params.shape, _np.nan)
+    for start in range(0, data.shape[0], chunk_size):
+        stop = min(start + chunk_size, data.shape[0])
+        out[start:stop] = _levenberg_marquardt(x, data[start:stop], params[start:stop], max_iter, ftol, xtol)
+
+    # sort the modes by position
+    if modes > 1:
+        order = _np.argsort(out[:, 1::3], axis=1)
+        idx = (3 * order[:, :, _np.newaxis] + _np.arange(3)).reshape(out.shape[0], -1)
+        out = _np.take_along_axis(out, idx, axis=1)
+    return out
+
+
+def _smooth(data, window):
+    """Running mean along the rows (the edge values are repeated)"""
+    csum = _np.cumsum(_np.pad(data, ((0, 0), (window // 2 + 1, window // 2)), mode='edge'), axis=1)
+    return (csum[:, window:] - csum[:, :-window]) / window
+
+
+def _model_and_jacobian(x, params, jacobian=True):
+    amp = params[:, 0::3, _np.newaxis]
+    pos = params[:, 1::3, _np.newaxis]
+    sigma = params[:, 2::3, _np.newaxis]
+    diff = x[_np.newaxis, _np.newaxis, :] - pos
+    expo = _np.exp(-diff ** 2 / (2. * sigma ** 2))
+    model = (amp * expo).sum(axis=1)
+    if not jacobian:
+        return model
+    # rows x modes x 3 x bins -> rows x bins x parameters
+    d_pos = amp * expo * diff / sigma ** 2
+    d_sigma = d_pos * diff / sigma
+    jac = _np.stack([expo, d_pos, d_sigma], axis=2)
+    jac = jac.reshape(params.shape[0], params.shape[1], x.shape[0]).transpose(0, 2, 1)
+    return model, jac
+
+
+def _cost(x, data, mask, params):
+    with _np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        res = _np.where(mask, data - _model_and_jacobian(x, params, jacobian=False), 0)
+    return (res ** 2).sum(axis=1)
+
+
+def _levenberg_marquardt(x, data, params, max_iter, ftol, xtol):
+    mask = ~_np.isnan(data)
+    data = _np.where(mask, data, 0)
+    no_params = params.shape[1]
+    params = params.copy()
+
+    active = _np.all(_np.isfinite(params), axis=1) & (mask.sum(axis=1) >= no_params)
+    converged = _np.zeros(params.shape[0], dtype=bool)
+    cost = _cost(x, data, mask, params)
+    damping = _np.full(params.shape[0], 1e-3)
+    eye = _np.eye(no_params)
+
+    for i in range(max_iter):
+        idx = _np.nonzero(active)[0]
+        if idx.shape[0] == 0:
+            break
+        p = params[idx]
+        with _np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            model, jac = _model_and_jacobian(x, p)
+        m = mask[idx]
+        res = _np.where(m, data[idx] - model, 0)
+        jac = _np.where(m[:, :, _np.newaxis], jac, 0)
+        jtj = _np.einsum('nmi,nmj->nij', jac, jac)
+        grad = _np.einsum('nmi,nm->ni', jac, res)
+        diag = _np.diagonal(jtj, axis1=1, axis2=2)
+        scale = _np.maximum(diag, 1e-12 * diag.max(axis=1, initial=0)[:, _np.newaxis] + 1e-300)
+        lhs = jtj + damping[idx, _np.newaxis, _np.newaxis] * scale[:, :, _np.newaxis] * eye
+        bad = ~_np.all(_np.isfinite(lhs), axis=(1, 2)) | ~_np.all(_np.isfinite(grad), axis=1)
+        lhs[bad] = eye
+        grad[bad] = 0
+        try:
+            step = _np.linalg.solve(lhs, grad[:, :, _np.newaxis])[:, :, 0]
+        except _np.linalg.LinAlgError:
+            step = _np.stack([_np.linalg.lstsq(l, g, rcond=None)[0] for l, g in zip(lhs, grad)])
+
+        p_new = p + step
+        cost_new = _cost(x, data[idx], m, p_new)
+        better = cost_new < cost[idx]
+
+        params[idx[better]] = p_new[better]
+        small_step = _np.all(_np.abs(step) <= xtol * (_np.abs(p) + xtol), axis=1)
+        small_gain = better & (cost[idx] - cost_new <= ftol * cost[idx])
+        cost[idx[better]] = cost_new[better]
+        damping[idx[better]] /= 10.
+        damping[idx[~better]] *= 10.
+
+        done = small_step | small_gain | (cost[idx] == 0) | (damping[idx] > 1e16)
+        converged[idx[done]] = True
+        active[idx[done | bad]] = False
+
+    params[~converged] = _np.nan
+    params[:, 2::3] = _np.abs(params[:, 2::3])
+    return params
@@ -1,3 +1,4 @@
+import copy as _copy
 import warnings as _warnings
 import numpy as _np
 
@@ -7,95 +8,68 @@ moments = {'log normal': ['dNdlogDp', 'dSdlogDp', 'dVdlogDp'],
              'surface': ['dSdlogDp', 'dSdDp'],
              'volume': ['dVdlogDp', 'dVdDp']}
 
-def convert(dist, to_type, verbose=False):
+def convert(dist, to_type, verbose=False, deep=True):
+    """Converts the size distribution into another moment (distribution type).
 
-    dist = dist.copy()
+    The conversion is a single per-bin scale vector (see get_conversion_factor) which is applied once to the data.
+
+    Parameters
+    ----------
+    dist: SizeDist instance (or of a subclass)
+    to_type: str
+        'numberConcentration' or one of the types in moments
+    deep: bool
+        If True the result is a deep copy of dist. If False the result is a lightweight copy (see SizeDist.copy)
+        which shares the memory of housekeeping, fit results, etc. with dist.
+
+    Returns
+    -------
+    SizeDist instance of the same type as dist
+    """
     from_type = dist.distributionType
     if from_type == to_type:
         if verbose:
             _warnings.warn(
                 'Distribution type is already %s. Output is an unchanged copy of the distribution' % to_type)
-        return dist
-
-    if from_type == 'numberConcentration':
-        pass
-    elif to_type == 'numberConcentration':
-        pass
-    elif from_type in moments['log normal']:
-        if to_type in moments['log normal']:
-            if verbose:
-                print('both log normal')
+        if deep:
+            return _copy.deepcopy(dist)
         else:
-            dist.data = dist.data / _normal2log(dist)
+            return _copy.copy(dist)
 
-    elif from_type in moments['natural']:
-        if to_type in moments['natural']:
-            if verbose:
-                print('both natural')
+    trans = get_conversion_factor(dist, to_type)
+    if dist._array_only():
+        # array storage (see SizeDist_TS), no DataFrame is created
+        values = dist.values * trans
+        if deep:
+            memo = {id(dist.values): values}
+            dist = _copy.deepcopy(dist, memo)
         else:
-            dist.data = dist.data * _normal2log(dist)
+            dist = _copy.copy(dist)
+        dist._set_array(values, dist.index_values)
     else:
-        raise ValueError('%s is not an option' % to_type)
-
-    if from_type == 'numberConcentration':
-        pass
-
-    elif to_type == 'numberConcentration':
-        pass
-    elif from_type in moments['number']:
-        if to_type in moments['number']:
-            if verbose:
-                print('both number')
+        data = dist.data * trans
+        if deep:
+            # the data is replaced anyway, so it does not need to be copied
+            memo = {id(dist.data): data}
+            dist = _copy.deepcopy(dist, memo)
         else:
-            if to_type in moments['surface']:
-                dist.data *= _2Surface(dist)
-            elif to_type in moments['volume']:
-                dist.data *= _2Volume(dist)
-            else:
-                raise ValueError('%s is not an option' % to_type)
-
-    elif from_type in moments['surface']:
-        if to_type in moments['surface']:
-            if verbose:
-                print('both surface')
-        else:
-            if to_type in moments['number']:
-                dist.data /= _2Surface(dist)
-            elif to_type in moments['volume']:
-                dist.data *= _2Volume(dist) / _2Surface(dist)
-            else:
-                raise ValueError('%s is not an option' % to_type)
-
-    elif from_type in moments['volume']:
-        if to_type in moments['volume']:
-            if verbose:
-                print('both volume')
-        else:
-            if to_type in moments['number']:
-                dist.data /= _2Volume(dist)
-            elif to_type in moments['surface']:
-                dist.data *= _2Surface(dist) / _2Volume(dist)
-            else:
-                raise ValueError('%s is not an option' % to_type)
-    else:
-        raise ValueError('%s is not an option' % to_type)
-
-    if to_type == 'numberConcentration':
-        dist = convert(dist,'dNdDp')
-        # dist = dist.convert2dNdDp()
-        dist.data *= dist.binwidth
-
-    elif from_type == 'numberConcentration':
-        dist.data = dist.data / dist.binwidth
-        dist.distributionType = 'dNdDp'
-        dist = convert(dist,to_type)
-        # dist = dist._convert2otherDistribution(to_type)
-
+            dist = _copy.copy(dist)
+        dist.data = data
     dist.distributionType = to_type
     if verbose:
         print('converted from %s to %s' % (from_type, to_type))
     return dist
 
+def get_conversion_factor(dist, to_type, from_type=None):
+    """Per-bin scale vector which converts data of the type from_type (default: dist.distributionType) into to_type
+
+    Returns
+    -------
+    1D array"""
+    if not from_type:
+        from_type = dist.distributionType
+    return _2NumberConcentration(dist, from_type) / _2NumberConcentration(dist, to_type)
+
 def _normal2log(dist):
     trans = (dist.bincenters * _np.log(10.))
     return trans
@@ -106,4 +80,42 @@ def _2Surface(dist):
 
 def _2Volume(dist):
     trans = 4. / 3. * _np.pi * (dist.bincenters / 2.) ** 3
-    return trans
\ No newline at end of file
+    return trans
+
+def _2NumberConcentration(dist, from_type=None):
+    """Factor that converts the data of each bin into the number concentration in that bin"""
+    if not from_type:
+        from_type = dist.distributionType
+    if from_type == 'numberConcentration':
+        return _np.ones(dist.bincenters.shape)
+
+    if from_type in moments['log normal']:
+        trans = dist.binwidth / _normal2log(dist)
+    elif from_type in moments['natural']:
+        trans = dist.binwidth.copy()
+    else:
+        raise ValueError('%s is not an option' % from_type)
+
+    if from_type in moments['surface']:
+        trans /= _2Surface(dist)
+    elif from_type in moments['volume']:
+        trans /= _2Volume(dist)
+    return trans
+
+def integrate_moments(dist):
+    """Number, surface, and volume concentration of each row of dist.data in one pass over the data
+
+    Returns
+    -------
+    dict of 1D arrays: 'number' (#/cm^3), 'surface' (nm^2/cm^3), 'volume' (nm^3/cm^3). NaNs are ignored (as in
+        pandas sum)."""
+    data = dist.values.astype(_np.float64)
+    data[_np.isnan(data)] = 0
+    trans = _2NumberConcentration(dist)
+    weights = _np.array([trans, trans * _2Surface(dist), trans * _2Volume(dist)]).transpose()
+    moms = data.dot(weights)
+    out = {}
+    out['number'] = moms[:, 0]
+    out['surface'] = moms[:, 1]
+    out['volume'] = moms[:, 2]
+    return out
@@ -13,10 +13,12 @@ import warnings as _warnings
 import datetime
 import scipy.optimize as optimization
 from scipy import stats
+from scipy import special as _special
 from atmPy.aerosols.physics import hygroscopic_growth as hg, optical_properties
 from atmPy.tools import pandas_tools
 from atmPy.aerosols.physics import optical_properties
 from atmPy.aerosols.size_distribution import sizedist_moment_conversion
+from atmPy.aerosols.size_distribution import sizedist_fit
 from atmPy.gases import physics as _gas_physics
 
 import pdb as _pdb
@@ -152,6 +154,82 @@ def get_label(distType):
         raise ValueError('%s is not really an option!?!' % distType)
     return label
 
+
+def _grow_shift_data(data, bins, growth_factor):
+    """Moves the particles of each row (e.g. time stamp) into the bins that correspond to their grown diameter.
+    All rows are done at once: the bins are multiplied by the growth factor of the row and the content of each
+    grown bin is distributed over the bins it overlaps with (linear in diameter). The number of particles is
+    conserved.
+
+    Parameters
+    ----------
+    data: 2D array
+        number concentration (rows x bins), not normalized to the bin width
+    bins: 1D array
+        bin edges
+    growth_factor: float or 1D array
+        one growth factor per row. Values smaller than 1 are set to 1. Rows with a nan growth factor are set to
+        nan.
+
+    Returns
+    -------
+    data_new: 2D array
+        rows x (bins + extra bins)
+    bins_new: 1D array
+        bins extended by extra bins (same logarithmic width as the last bin) so that the largest grown particles fit
+    no_extra_bins: int
+    """
+    data = _np.atleast_2d(_np.asarray(data, dtype=float))
+    bins = _np.asarray(bins, dtype=float)
+    gf = _np.array(_np.broadcast_to(_np.asarray(growth_factor, dtype=float).ravel(), (data.shape[0],)))
+
+    too_small = gf < 1
+    if too_small.any():
+        txt = 'Growth facotor smaller than 1 in %s rows (smallest is %s). Values adjusted to 1!!' % (too_small.sum(),
+                                                                                                   gf[too_small].min())
+        gf[too_small] = 1.
+        _warnings.warn(txt)
+    gf_nan = _np.isnan(gf)
+    gf[gf_nan] = 1.
+
+    ######### Add bins to shift data into
+    gf_max = gf.max() if gf.shape[0] else 1.
+    if gf_max > 1:
+        step_width = _np.log10(bins[-1]) - _np.log10(bins[-2])
+        no_extra_bins = max(int((bins * gf_max >= bins[-1]).sum()), int(_np.ceil(_np.log10(gf_max) / step_width)))
+        new_bins = _np.log10(bins[-1]) + (_np.arange(no_extra_bins) + 1) * step_width
+        bins_new = _np.append(bins, 10 ** new_bins)
+    else:
+        no_extra_bins = 0
+        bins_new = bins.copy()
+
+    ######### overlap of the grown bins with the new bins
+    no_rows = data.shape[0]
+    no_bins_new = bins_new.shape[0] - 1
+    lower = bins[:-1] * gf[:, _np.newaxis]
+    upper = bins[1:] * gf[:, _np.newaxis]
+    width = upper - lower
+    first = _np.searchsorted(bins_new, lower, side='right') - 1
+    last = _np.minimum(_np.searchsorted(bins_new, upper, side='left') - 1, no_bins_new - 1)
+
+    offset = (_np.arange(no_rows) * no_bins_new)[:, _np.newaxis]
+    data_new = _np.zeros(no_rows * no_bins_new)
+    span = int((last - first).max()) + 1 if data.size else 0
+    for i in range(span):
+        target = _np.minimum(first + i, no_bins_new - 1)
+        fract = (_np.minimum(upper, bins_new[target + 1]) - _np.maximum(lower, bins_new[target])) / width
+        weights = _np.where(first + i <= last, fract * data, 0.)
+        data_new += _np.bincount((offset + target).ravel(), weights=weights.ravel(), minlength=data_new.shape[0])
+    data_new = data_new.reshape(no_rows, no_bins_new)
+
+    # rows without any data are returned as they are, rows without a growth factor are nan
+    no_data = _np.all(_np.isnan(data), axis=1)
+    data_new[no_data, :data.shape[1]] = data[no_data]
+    data_new[no_data, data.shape[1]:] = 0
+    data_new[gf_nan, :data.shape[1]] = _np.nan
+    data_new[gf_nan, data.shape[1]:] = 0
+    return data_new, bins_new, no_extra_bins
+
 class SizeDist(object):
     """
     Object defining a log normal aerosol size distribution
@@ -185,10 +263,18 @@ class SizeDist(object):
     """
     # todo: write setters and getters for bins and bincenter, so when one is changed the otherone is automatically
     #  changed too
+
+    # attributes which a lightweight copy shares with the original (see __copy__)
+    _shared_on_copy = ()
+
     def __init__(self, data, bins, distType,
                  # bincenters=False,
                  fixGaps=False):
 
+        self._version = 0
+        self.__moments = None
+        self.__moments_version = None
+        self.__cache = {}
         if type(data).__name__ == 'NoneType':
             self.data = pd.DataFrame()
         else:
@@ -197,10 +283,6 @@ class SizeDist(object):
         self.bins = bins
         self.__index_of_refraction = None
         self.__growth_factor = None
-        self.__particle_number_concentration = None
-        self.__particle_mass_concentration = None
-        self.__particle_surface_concentration = None
-        self.__particle_volume_concentration = None
         self.__housekeeping = None
         self.__physical_property_density = None
         # if type(bincenters) == np.ndarray:
@@ -252,6 +334,38 @@ class SizeDist(object):
         elif type(value).__name__ not in ['int', 'float']:
             raise ValueError('%s is not an excepted type'%(type(value).__name__))
         self.__physical_property_density = value
+        self._update()
+
+    @property
+    def data(self):
+        """setter: changing data (including in place operations like dist.data *= 2) invalidates the cached
+        moments. If values are changed via data.loc, data.iloc, etc. call _update()."""
+        return self.__data
+
+    @data.setter
+    def data(self, value):
+        self.__data = value
+        self._update()
+
+    @property
+    def values(self):
+        """The data as 2D numpy array (rows x bins), without copying. Do not change it in place."""
+        return self.data.values
+
+    @property
+    def index_values(self):
+        """The index of data (e.g. time stamps) as numpy array"""
+        return self.data.index.values
+
+    def _get_data_index(self):
+        return self.data.index
+
+    def _get_data_columns(self):
+        return self.data.columns
+
+    def _array_only(self):
+        """True if the data is only kept as array (see storage of SizeDist_TS)"""
+        return False
 
     @property
     def housekeeping(self):
@@ -260,6 +374,7 @@ class SizeDist(object):
     @housekeeping.setter
     def housekeeping(self, value):
         self.__housekeeping = value.align_to(self)
+        self._update()
 
     @property
     def bins(self):
@@ -279,6 +394,10 @@ class SizeDist(object):
         self.__bins = array
         self.__bincenters = (array[1:] + array[:-1]) / 2.
         self.__binwidth = (array[1:] - array[:-1])
+        self._set_data_columns()
+        self._update()
+
+    def _set_data_columns(self):
         self.data.columns = self.bincenters
         self.data.columns.name = 'bincenters_(nm)'
 
@@ -332,16 +451,11 @@ sizedistribution.align to align the index of the new array."""
 
     @property
     def particle_number_concentration(self):
-        if not _np.any(self.__particle_number_concentration) or not self._uptodate_particle_number_concentration:
-            self.__particle_number_concentration = self._get_particle_concentration()
-        return self.__particle_number_concentration
+        return self._get_cached('particle_number_concentration', self._get_particle_concentration)
 
     @property
     def particle_mass_concentration(self):
-        if not _np.any(self.__particle_mass_concentration) or not self._uptodate_particle_mass_concentration:
-            self.__particle_mass_concentration = self._get_mass_concentration()
-            self._uptodate_particle_mass_concentration = True
-        return self.__particle_mass_concentration
+        return self._get_cached('particle_mass_concentration', self._get_mass_concentration)
 
     @property
     def particle_mass_mixing_ratio(self):
@@ -353,17 +467,11 @@ sizedistribution.align to align the index of the new array."""
 
     @property
     def particle_volume_concentration(self):
-        if not _np.any(self.__particle_volume_concentration) or not self._uptodate_particle_volume_concentration:
-            self.__particle_volume_concentration = self._get_volume_concentration()
-            self._uptodate_particle_volume_concentration = True
-        return self.__particle_volume_concentration
+        return self._get_cached('particle_volume_concentration', self._get_volume_concentration)
 
     @property
     def particle_surface_concentration(self):
-        if not _np.any(self.__particle_surface_concentration) or not self._uptodate_particle_surface_concentration:
-            self.__particle_surface_concentration = self._get_surface_concentration()
-            self._uptodate_particle_surface_concentration = True
-        return self.__particle_surface_concentration
+        return self._get_cached('particle_surface_concentration', self._get_surface_concentration)
 
     def apply_hygro_growth(self, kappa, RH, how = 'shift_bins', adjust_refractive_index = True):
         """Note kappa values are !!NOT!! aligned to self in case its timesersies
@@ -451,8 +559,8 @@ sizedistribution.align to align the index of the new array."""
 
         elif how == 'shift_data':
             if isinstance(growth_factor, (float, int)):
-                pass
-            elif type(growth_factor).__name__ == 'ndarray':
+                growth_factor = _np.zeros(dist_g.data.shape[0]) + growth_factor
+            if type(growth_factor).__name__ == 'ndarray':
                 growth_factor = _timeseries.TimeSeries(growth_factor)
 
             elif type(growth_factor).__name__ == 'Series':
@@ -469,22 +577,12 @@ sizedistribution.align to align the index of the new array."""
                 txt = 'Make sure type of growthfactor is int,float,TimeSeries, Series or ndarray. It currently is: %s.'%(type(growth_factor).__name__)
                 raise TypeError(txt)
 
-            test = dist_g._hygro_growht_shift_data(dist_g.data.values[0], dist_g.bins, float(_np.nanmax(growth_factor.data)), ignore_data_nan = True)
-            bin_num = test['data'].shape[0]
-            data_new = _np.zeros((dist_g.data.shape[0],bin_num))
-            #todo: it would be nicer to have _hygro_growht_shift_data take the TimeSeries directly
             gf = growth_factor.data.values.transpose()[0]
-            for e,i in enumerate(dist_g.data.values):
-                out = dist_g._hygro_growht_shift_data(i, dist_g.bins, gf[e])
-                dt = out['data']
-                diff = bin_num - dt.shape[0]
-
-                dt = _np.append(dt, _np.zeros(diff))
-                data_new[e] = dt
+            data_new, bins_new, no_extra_bins = _grow_shift_data(dist_g.values, dist_g.bins, gf)
             df = pd.DataFrame(data_new)
             df.index = dist_g.data.index
             dp = dist_g._data_period
-            dist_g = SizeDist(df, test['bins'], dist_g.distributionType)
+            dist_g = SizeDist(df, bins_new, dist_g.distributionType)
             dist_g._data_period = dp
 
         else:
@@ -522,13 +620,19 @@ sizedistribution.align to align the index of the new array."""
     #     return out
 
     # todo: this function appears multiple times, can easily be inherited
-    def calculate_optical_properties(self, wavelength, n = None, AOD = False, noOfAngles=100):
+    def calculate_optical_properties(self, wavelength, n = None, AOD = False, noOfAngles=100, kernel_tolerance=None,
+                                     core_fraction=None, n_shell=None):
         if not _np.any(n):
             n = self.index_of_refraction
         if not _np.any(n):
             txt = 'Refractive index is not specified. Either set self.index_of_refraction or set optional parameter n.'
             raise ValueError(txt)
-        out = optical_properties.size_dist2optical_properties(self, wavelength, n, aod = AOD, noOfAngles=noOfAngles)
+        out = optical_properties.size_dist2optical_properties(self, wavelength, n, aod = AOD, noOfAngles=noOfAngles,
+                                                              kernel_tolerance=kernel_tolerance,
+                                                              core_fraction=core_fraction, n_shell=n_shell)
+        if _np.ndim(wavelength) > 0:
+            # OpticalPropertiesMultiWavelength instance
+            return out
         opt_properties = optical_properties.OpticalProperties(out, parent = self)
         # opt_properties.wavelength = wavelength #should be set in OpticalProperty class
         # opt_properties.index_of_refractio = n
@@ -563,15 +667,27 @@ sizedistribution.align to align the index of the new array."""
             self.data = self.data.sort_index()
         return
 
-    def fit_normal(self, log=True, p0=[10, 180, 0.2]):
-        """ Fits a single normal distribution to each line in the data frame.
+    def fit_normal(self, log=True, p0=None, modes=1):
+        """ Fits a single (or multi-modal) normal distribution to each line in the data frame. All lines are
+        fitted together (see sizedist_fit.fit_normal_batch).
+
+        Parameters
+        ----------
+        log: bool
+            If True the normal distribution is fitted on the log10 of the diameters (log-normal distribution).
+        p0: list, optional
+            Initial parameters [amp, pos (nm), sigma] for each mode (e.g. [10, 180, 0.2]), the same for all lines.
+            If None (default) the initial parameters are derived from the moments of each line.
+        modes: int
+            Number of modes. For more than one mode the columns are numbered by mode (Amp_1, Pos_1, ..., Amp_2,
+            ...) in order of the position.
 
         Returns
         -------
         pandas DataFrame instance (also added to namespace as data_fit_normal)
 
         """
-        sd = self.copy()
+        sd = self
 
         if sd.distributionType != 'dNdlogDp':
             if sd.distributionType == 'calibration':
@@ -579,31 +695,37 @@ sizedistribution.align to align the index of the new array."""
             else:
                 _warnings.warn(
                     "Size distribution is not in 'dNdlogDp'. I temporarily converted the distribution to conduct the fitting. If that is not what you want, change the code!")
-                sd = sd.convert2dNdlogDp()
-
-        n_lines = sd.data.shape[0]
-        amp = _np.zeros(n_lines)
-        pos = _np.zeros(n_lines)
-        sigma = _np.zeros(n_lines)
-        sigma_high = _np.zeros(n_lines)
-        sigma_low = _np.zeros(n_lines)
-        for e, lay in enumerate(sd.data.values):
-            try:
-                fit_res = fit_normal_dist(sd.bincenters, lay, log=log, p0=p0)
-            except (ValueError, RuntimeError):
-                fit_res = [_np.nan, _np.nan, _np.nan, _np.nan, _np.nan]
-            amp[e] = fit_res[0]
-            pos[e] = fit_res[1]
-            sigma[e] = fit_res[2]
-            sigma_high[e] = fit_res[3]
-            sigma_low[e] = fit_res[4]
+                sd = sd.convert2dNdlogDp(deep=False)
+
+        x = sd.bincenters
+        if type(p0) != type(None):
+            p0 = _np.array(p0, dtype=float)
+        if log:
+            x = _np.log10(x)
+            if type(p0) != type(None):
+                p0[1::3] = _np.log10(p0[1::3])
+
+        params = sizedist_fit.fit_normal_batch(x, sd.values, modes=modes, p0=p0)
 
         df = pd.DataFrame()
-        df['Amp'] = pd.Series(amp)
-        df['Pos'] = pd.Series(pos)
-        df['Sigma'] = pd.Series(sigma)
-        df['Sigma_high'] = pd.Series(sigma_high)
-        df['Sigma_low'] = pd.Series(sigma_low)
+        for i in range(modes):
+            amp = params[:, 3 * i]
+            pos = params[:, 3 * i + 1]
+            sigma = params[:, 3 * i + 2]
+            if log:
+                with _np.errstate(over='ignore'): # fits which ran away
+                    sigma_high = 10 ** (pos + sigma)
+                    sigma_low = 10 ** (pos - sigma)
+                    pos = 10 ** pos
+            else:
+                sigma_high = pos + sigma
+                sigma_low = pos - sigma
+            suffix = '' if modes == 1 else '_%i' % (i + 1)
+            df['Amp' + suffix] = pd.Series(amp)
+            df['Pos' + suffix] = pd.Series(pos)
+            df['Sigma' + suffix] = pd.Series(sigma)
+            df['Sigma_high' + suffix] = pd.Series(sigma_high)
+            df['Sigma_low' + suffix] = pd.Series(sigma_low)
         # df.index = self.layercenters
         self.data_fit_normal = df
         return self.data_fit_normal
@@ -671,29 +793,51 @@ sizedistribution.align to align the index of the new array."""
         return f, a
 
 
-    def convert2dNdDp(self):
-        return self._convert2otherDistribution('dNdDp')
+    def convert2dNdDp(self, deep=True):
+        return self._convert2otherDistribution('dNdDp', deep=deep)
+
+    def convert2dNdlogDp(self, deep=True):
+        return self._convert2otherDistribution('dNdlogDp', deep=deep)
 
-    def convert2dNdlogDp(self):
-        return self._convert2otherDistribution('dNdlogDp')
+    def convert2dSdDp(self, deep=True):
+        return self._convert2otherDistribution('dSdDp', deep=deep)
 
-    def convert2dSdDp(self):
-        return self._convert2otherDistribution('dSdDp')
+    def convert2dSdlogDp(self, deep=True):
+        return self._convert2otherDistribution('dSdlogDp', deep=deep)
 
-    def convert2dSdlogDp(self):
-        return self._convert2otherDistribution('dSdlogDp')
+    def convert2dVdDp(self, deep=True):
+        return self._convert2otherDistribution('dVdDp', deep=deep)
 
-    def convert2dVdDp(self):
-        return self._convert2otherDistribution('dVdDp')
+    def convert2dVdlogDp(self, deep=True):
+        return self._convert2otherDistribution('dVdlogDp', deep=deep)
 
-    def convert2dVdlogDp(self):
-        return self._convert2otherDistribution('dVdlogDp')
+    def convert2numberconcentration(self, deep=True):
+        return self._convert2otherDistribution('numberConcentration', deep=deep)
 
-    def convert2numberconcentration(self):
-        return self._convert2otherDistribution('numberConcentration')
+    def copy(self, deep=False):
+        """Returns a copy of the size distribution
 
-    def copy(self):
-        return deepcopy(self)
+        Parameters
+        ----------
+        deep: bool
+            If False, the copy is lightweight: data, housekeeping, fit results, etc. share their memory with the
+            original until one of them is changed (copy-on-write, see pandas_tools.lightweight_copy). If True,
+            everything is copied right away. Note, this needs copy-on-write to be enabled in pandas (always the
+            case with pandas >= 3, see pandas_tools.copy_on_write_enabled), otherwise the pandas objects are
+            copied right away, too, and the lightweight copy saves no memory (the array storage of SizeDist_TS is
+            shared in any case)."""
+        if deep:
+            return deepcopy(self)
+        else:
+            return self.__copy__()
+
+    def __copy__(self):
+        """Lightweight copy (see copy), the cached moments are not shared."""
+        out = _panda_tools.lightweight_copy(self, share=self._shared_on_copy)
+        out.__moments = None
+        out.__moments_version = None
+        out.__cache = {}
+        return out
 
     def save_csv(self, fname, header=True):
         if header:
@@ -764,33 +908,28 @@ sizedistribution.align to align the index of the new array."""
         self._update()
         return sd
 
-    def _convert2otherDistribution(self, distType, verbose=False):
-        return sizedist_moment_conversion.convert(self, distType, verbose = verbose)
+    def _convert2otherDistribution(self, distType, verbose=False, deep=True):
+        """deep: if False, the result shares everything but the data with self (see
+        sizedist_moment_conversion.convert)"""
+        return sizedist_moment_conversion.convert(self, distType, verbose = verbose, deep = deep)
 
     def _get_mass_concentration(self):
         """'Mass concentration ($\mu g/m^{3}$)'"""
-        dist = self.convert2dVdDp()
-        volume_conc = dist.data * dist.binwidth
-
-        vlc_all = volume_conc.sum(axis = 1) # nm^3/cm^3
-
         if not self.physical_property_density:
             raise ValueError('Please set the physical_property_density variable in g/cm^3')
 
-
+        vlc_all = self._get_moments()['volume'] # nm^3/cm^3
 
         if type(self.physical_property_density).__name__ in ['TimeSeries', 'VerticalProfile']:
-            # density = self.physical_property_density.data.values
-            density = self.physical_property_density.copy()
-            density = density.data['density']
+            density = self.physical_property_density.data['density'].values
         else:
             density = self.physical_property_density #1.8 # g/cm^3
 
-        density *= 1e-21 # g/nm^3
+        density = density * 1e-21 # g/nm^3
         mass_conc = vlc_all * density # g/cm^3
         mass_conc *= 1e6 # g/m^3
         mass_conc *= 1e6 # mug/m^3
-        return mass_conc
+        return pd.Series(mass_conc, index = self._get_data_index())
 
     def _get_mass_mixing_ratio(self):
         if not _panda_tools.ensure_column_exists(self.housekeeping.data, 'air_density_$g/m^3$', raise_error=False):
@@ -833,37 +972,23 @@ sizedistribution.align to align the index of the new array."""
         -------
         int: if data has only one line
         pandas.DataFrame: else """
-        sd = self.convert2numberconcentration()
-
-        particles = sd.data.sum(axis = 1)
+        particles = self._get_moments()['number']
 
-        # The code below is old and lead to problems when df contained NaNs
-        # particles = _np.zeros(sd.data.shape[0])
-        # for e, line in enumerate(sd.data.values):
-        #     particles[e] = line.sum()
-        if sd.data.shape[0] == 1:
+        if particles.shape[0] == 1:
             return particles[0]
         else:
             df = pd.DataFrame(particles,
-                              # index=sd.data.index,
+                              index=self._get_data_index(),
                               columns=['Particle number concentration #/$cm^3$'])
-
-            # not sure what the purpose of the argument below was, however, it can
-            # result in errors. If desired in future us: df = df.reindex(df.index.drop_duplicates())
-            # df = df.drop_duplicates()
             return df
 
     def _get_surface_concentration(self):
         """ volume of particles per volume air"""
 
-        sd = self.convert2dSdDp()
-
-        surface_conc = sd.data * sd.binwidth
-
-        sfc_all = surface_conc.sum(axis = 1) # nm^2/cm^3
+        sfc_all = self._get_moments()['surface'] # nm^2/cm^3
         sfc_all = sfc_all * 1e-6 # um^2/cm^3
         label = 'Surface concentration $\mu m^2 / cm^{-3}$'
-        sfc_df = pd.DataFrame(sfc_all, columns = [label])
+        sfc_df = pd.DataFrame(sfc_all, index = self._get_data_index(), columns = [label])
         if type(self).__name__ == 'SizeDist':
             return sfc_df
         elif type(self).__name__ == 'SizeDist_TS':
@@ -881,13 +1006,9 @@ sizedistribution.align to align the index of the new array."""
     def _get_volume_concentration(self):
         """ volume of particles per volume air"""
 
-        sd = self.convert2dVdDp()
-
-        volume_conc = sd.data * sd.binwidth
-
-        vlc_all = volume_conc.sum(axis = 1) # nm^3/cm^3
+        vlc_all = self._get_moments()['volume'] # nm^3/cm^3
         vlc_all = vlc_all * 1e-9 # um^3/cm^3
-        vlc_df = pd.DataFrame(vlc_all, columns = ['volume concentration $\mu m^3 / cm^{3}$'])
+        vlc_df = pd.DataFrame(vlc_all, index = self._get_data_index(), columns = ['volume concentration $\mu m^3 / cm^{3}$'])
         if type(self).__name__ == 'SizeDist':
             return  vlc_df
         elif type(self).__name__ == 'SizeDist_TS':
@@ -900,104 +1021,53 @@ sizedistribution.align to align the index of the new array."""
         out._y_label = 'volume concentration $\mu m^3 / cm^{-3}$'
         return out
 
+    def _get_moments(self):
+        """Number, surface, and volume concentration of each row (see
+        sizedist_moment_conversion.integrate_moments). They are computed together and cached until the next
+        _update. Do not change the returned arrays in place."""
+        if self.__moments_version != self._version:
+            self.__moments = sizedist_moment_conversion.integrate_moments(self)
+            self.__moments_version = self._version
+        return self.__moments
+
+    def _get_cached(self, name, func):
+        """Returns the cached result of func or calls it if data, bins, or the density changed since (or _update
+        was called)."""
+        version, value = self.__cache.get(name, (None, None))
+        if version != self._version:
+            value = func()
+            self.__cache[name] = (self._version, value)
+        return value
+
 
     def _hygro_growht_shift_data(self, data, bins, gf, ignore_data_nan = False):
         """data: 1D array
         bins: 1D array
-        gf: float"""
+        gf: float
 
-        if _np.any(gf < 1):
-            # _pdb.set_trace()
-            txt = 'Growth facotor smaller than 1 (is %s). Value adjusted to 1!!'%gf
-            gf = 1.
-            _warnings.warn(txt)
+        Single row version of _grow_shift_data."""
 
-        # no shift if gf is 1
-        if gf == 1.:
-            out = {}
-            out['bins'] = bins
-            out['data'] = data
-            out['num_extr_bins'] = 0
-            return out
-        # all data nan if gf is nan
-        elif _np.isnan(gf):
+        # return as is if all data is nan
+        if _np.all(_np.isnan(data)) and not ignore_data_nan:
             out = {}
             out['bins'] = bins
-            data = data.copy()
-            data[:] = _np.nan
             out['data'] = data
             out['num_extr_bins'] = 0
             return out
-        # return as is if all data is nan
-        elif _np.all(_np.isnan(data)):
-            if not ignore_data_nan:
-                out = {}
-                out['bins'] = bins
-                out['data'] = data
-                out['num_extr_bins'] = 0
-                return out
-
-
-        bins_new = bins.copy()
-        shifted = bins_new * gf
-
-        ml = array_tools.find_closest(bins_new, shifted, how='closest_low')
-        mh = array_tools.find_closest(bins_new, shifted, how='closest_high')
 
-        if _np.any((mh - ml) > 1):
-            raise ValueError('shifted bins spans over more than two of the original bins, programming required ;-)')
-
-        no_extra_bins = bins_new[ml].shape[0] - bins_new[ml][bins_new[ml] != bins_new[ml][-1]].shape[0]
-
-        ######### Ad bins to shift data into
-        last_two = _np.log10(bins_new[- (no_extra_bins + 1):])
-        step_width = last_two[-1] - last_two[-2]
-        new_bins = _np.zeros(no_extra_bins)
-        for i in range(no_extra_bins):
-            new_bins[i] = _np.log10(bins_new[-1]) + ((i + 1) * step_width)
-        newbins = 10**new_bins
-        bins_new = _np.append(bins_new, newbins)
-        shifted = (bins_new * gf)[:-no_extra_bins]
-
-        ######## and again ########################
-
-        ml = array_tools.find_closest(bins_new, shifted, how='closest_low')
-        mh = array_tools.find_closest(bins_new, shifted, how='closest_high')
-
-        if _np.any((mh - ml) > 1):
-            raise ValueError('shifted bins spans over more than two of the original bins, programming required ;-)')
-
-
-        ##### percentage of particles moved to next bin ...')
-
-        shifted_w = shifted[1:] - shifted[:-1]
-
-        fract_first = (bins_new[mh] - shifted)[:-1] / shifted_w
-        fract_last = (shifted - bins_new[ml])[1:] / shifted_w
-
-        data_new = _np.zeros(data.shape[0]+ no_extra_bins)
-        data_new[no_extra_bins - 1:-1] += fract_first * data
-        data_new[no_extra_bins:] += fract_last * data
-
-        # print('data.shape',data.shape)
-        # print('data_new.shape',data_new.shape)
-
-        # if data_new.shape[0] == 131:
-        # pdb.set_trace()
-    #     data = _np.append(data, _np.zeros(no_extra_bins))
+        data_new, bins_new, no_extra_bins = _grow_shift_data(data, bins, gf)
         out = {}
         out['bins'] = bins_new
-        out['data'] = data_new
+        out['data'] = data_new[0]
         out['num_extr_bins'] = no_extra_bins
         return out
 
 
 
     def _update(self):
-        self._uptodate_particle_number_concentration = False
-        self._uptodate_particle_mass_concentration = False
-        self._uptodate_particle_surface_concentration = False
-        self._uptodate_particle_volume_concentration = False
+        """Invalidates the cached moments and derived quantities. Called whenever data, bins, or the density are
+        set, call it after changing data in place (e.g. via data.iloc)."""
+        self._version += 1
 
 
 class SizeDist_TS(SizeDist):
@@ -1017,29 +1087,136 @@ class SizeDist_TS(SizeDist):
          number: 'dNdlogDp', 'dNdDp', 'numberConcentration'
          surface: 'dSdlogDp','dSdDp'
          volume: 'dVdlogDp','dVdDp'
+    storage: 'pandas' or 'array'
+        'pandas': data is kept as DataFrame.
+        'array': data is kept as contiguous 2D numpy array (see values) with a separate index array. The DataFrame
+         (data) is only created when needed (e.g. for plotting or saving) as a view of the array, from then on the
+         DataFrame holds the data. Lightweight copies (copy, zoom_time, convert2*, ...) share the array with the
+         original and stay array backed.
+    dtype: numpy dtype, optional
+        only used with storage = 'array', e.g. numpy.float32 to half the memory of long data sets.
        """
-    def __init__(self, *args, **kwargs):
+    _shared_on_copy = ('_SizeDist_TS__values', '_SizeDist_TS__index_values')
+
+    def __init__(self, *args, storage='pandas', dtype=None, **kwargs):
+        self.__frame = None
+        self.__values = None
+        self.__index_values = None
+        self.__index_name = None
+        self.__columns = None
+        self.__shared = False
+        self._check_storage(storage)
+        self._storage = storage
+        self._dtype = dtype
         super(SizeDist_TS,self).__init__(*args,**kwargs)
 
         self._data_period = None
+        if self._array_only():
+            if not self.__index_name:
+                self.__index_name = 'Time'
+        elif not self.data.index.name:
+            self.data.index.name = 'Time'
 
-        self.__particle_number_concentration = None
-        self.__particle_mass_concentration = None
-        self.__particle_mass_mixing_ratio = None
-        self.__particle_number_mixing_ratio = None
+    @property
+    def data(self):
+        if self._storage == 'pandas':
+            return SizeDist.data.fget(self)
+        if type(self.__frame) == type(None):
+            index = pd.Index(self.__index_values, name=self.__index_name)
+            values = self.__values
+            if self.__shared:
+                # the DataFrame can be changed in place, so it gets its own copy of a shared array
+                values = values.copy()
+            self.__frame = pd.DataFrame(values, index=index, columns=self.__columns, copy=False)
+            self.__values = None
+            self.__index_values = None
+            self.__shared = False
+        return self.__frame
+
+    @data.setter
+    def data(self, value):
+        if self._storage == 'pandas':
+            SizeDist.data.fset(self, value)
+            return
+        self.__index_name = value.index.name
+        self.__columns = value.columns
+        self._set_array(value.values, value.index.values)
+
+    def _set_array(self, values, index_values, shared=False):
+        """Sets the data of the array storage without creating a DataFrame. The columns stay the same.
+
+        Parameters
+        ----------
+        values: 2D array
+        index_values: array
+        shared: bool
+            If values (or its memory) is shared with another instance, e.g. a slice of the array of the
+            original in zoom_time."""
+        self.__values = _np.ascontiguousarray(values, dtype=self._dtype)
+        self.__index_values = index_values
+        self.__frame = None
+        self.__shared = shared
         self._update()
-        if not self.data.index.name:
-            self.data.index.name = 'Time'
+
+    @property
+    def values(self):
+        """The data as 2D numpy array (rows x bins), without copying. Do not change it in place."""
+        if self._array_only():
+            return self.__values
+        return self.data.values
+
+    @property
+    def index_values(self):
+        """The time stamps as numpy array"""
+        if self._array_only():
+            return self.__index_values
+        return self.data.index.values
+
+    def _get_data_index(self):
+        if self._array_only():
+            return pd.Index(self.__index_values, name=self.__index_name)
+        return self.data.index
+
+    def _get_data_columns(self):
+        if self._array_only():
+            return self.__columns
+        return self.data.columns
+
+    def set_storage(self, storage, dtype=None):
+        """Changes how the data is kept, see storage and dtype in the class docstring"""
+        self._check_storage(storage)
+        data = self.data
+        SizeDist.data.fset(self, None)
+        self.__frame = None
+        self._storage = storage
+        self._dtype = dtype
+        self.data = data
+
+    def _check_storage(self, storage):
+        if storage not in ['pandas', 'array']:
+            txt = "storage has to be 'pandas' or 'array'. It is %s" % storage
+            raise ValueError(txt)
+
+    def _array_only(self):
+        """True if the data is only kept as array (the DataFrame has not been created yet)"""
+        return self._storage == 'array' and type(self.__frame) == type(None)
+
+    def _set_data_columns(self):
+        if self._array_only():
+            self.__columns = pd.Index(self.bincenters, name='bincenters_(nm)')
+        else:
+            super(SizeDist_TS, self)._set_data_columns()
+
+    def __copy__(self):
+        """Lightweight copy (see copy). If the data is only kept as array, the array is shared with the copy and
+        copied once the DataFrame of one of them is created."""
+        out = super(SizeDist_TS, self).__copy__()
+        if self._array_only():
+            self.__shared = out.__shared = True
+        return out
 
     close_gaps = _timeseries.close_gaps
 
-    def _update(self):
-        self._uptodate_particle_number_concentration = False
-        self._uptodate_particle_mass_concentration = False
-        self._uptodate_particle_mass_mixing_ratio = False
-        self._uptodate_particle_number_mixing_ratio = False
-        self._uptodate_particle_surface_concentration = False
-        self._uptodate_particle_volume_concentration = False
 
     # todo: declared deprecated on 2016-04-29
     def convert2layerseries(self, hk, layer_thickness=10, force=False):
@@ -1104,41 +1281,60 @@ class SizeDist_TS(SizeDist):
         return lays
 
     def convert2verticalprofile(self, laythick=2):
-        sd = self.copy()
-        # if not np.array_equal(sd.data.index.values, sd.housekeeping.data.index.values): raise ValueError()
-        # if not np.array_equal(sd.data.index.values, sd.housekeeping.data.index.values): raise ValueError()
-
-        sd.data.index = sd.housekeeping.data.Altitude
-        sd.data.sort_index(inplace=True)
+        """Averages the size distribution and the housekeeping over layers of the altitude (housekeeping column
+        Altitude). All rows are assigned to their layer at once (np.digitize) and averaged in a single pass, nan
+        values are ignored.
 
-        sd.housekeeping.data.index = sd.housekeeping.data.Altitude
-        sd.housekeeping.data.sort_index(inplace=True)
+        Parameters
+        ----------
+        laythick: float
+            Thickness of the layers. A sample belongs to a layer if its altitude is >= the lower and < the upper
+            boundary (the highest boundary is included in the highest layer). The layers start at the floor of
+            the lowest altitude and as many are used as needed to cover the highest altitude.
 
-        start = _np.floor(sd.housekeeping.data.Altitude.min())
-        end = _np.ceil(sd.housekeeping.data.Altitude.max())
+        Returns
+        -------
+        SizeDist_LS instance with the housekeeping as VerticalProfile. Additionally:
+            data_std: pandas DataFrame
+                standard deviation of the size distribution in each layer
+            sample_count: pandas Series
+                number of samples (time stamps) in each layer. The averages of layers without samples are nan.
+        """
+        altitude = self.housekeeping.data.Altitude.values.astype(float)
+        data = self.values
+        if altitude.shape[0] != data.shape[0]:
+            txt = 'The housekeeping has %i rows, the size distribution %i.' % (altitude.shape[0], data.shape[0])
+            raise ValueError(txt)
 
-        layerbounderies = _np.arange(start, end + 1, laythick)
-        layerbounderies = _np.array([layerbounderies[0:-1], layerbounderies[1:]]).transpose()
+        start = _np.floor(_np.nanmin(altitude))
+        end = _np.ceil(_np.nanmax(altitude))
 
-        index = _np.apply_along_axis(lambda x: x.sum(), 1, layerbounderies) / 2.
-        df = pd.DataFrame(_np.zeros((layerbounderies.shape[0], sd.data.shape[1])), index=index, columns=sd.data.columns)
+        # the highest layer reaches (at least) up to the highest altitude
+        no_of_layers = max(1, int(_np.ceil((end - start) / laythick)))
+        edges = start + _np.arange(no_of_layers + 1) * laythick
+        layerbounderies = _np.array([edges[0:-1], edges[1:]]).transpose()
+        index = layerbounderies.sum(axis=1) / 2.
 
-        dfhk = pd.DataFrame(_np.zeros((layerbounderies.shape[0], sd.housekeeping.data.shape[1])), index=index, columns=sd.housekeeping.data.columns)
+        layer = _np.digitize(altitude, edges) - 1
+        layer[altitude >= edges[-1]] = no_of_layers - 1
+        layer[_np.isnan(altitude)] = -1
 
-        for l in layerbounderies:
-            where = _np.where(_np.logical_and(sd.data.index > l[0], sd.data.index < l[1]))[0]
-            mean = sd.data.iloc[where, :].mean()
-            df.loc[(l[0] + l[1]) / 2] = mean
+        stats_sd = array_tools.grouped_stats(data, layer, no_of_layers)
+        stats_hk = array_tools.grouped_stats(self.housekeeping.data.values, layer, no_of_layers)
 
-            mean = sd.housekeeping.data.iloc[where, :].mean()
-            dfhk.loc[(l[0] + l[1]) / 2] = mean
+        df = pd.DataFrame(stats_sd['mean'], index=index, columns=self._get_data_columns())
+        dfhk = pd.DataFrame(stats_hk['mean'], index=index, columns=self.housekeeping.data.columns)
 
-        dist_ls = SizeDist_LS(df, sd.bins, sd.distributionType, layerbounderies)
+        dist_ls = SizeDist_LS(df, self.bins, self.distributionType, layerbounderies)
         dist_ls.housekeeping = _vertical_profile.VerticalProfile(dfhk)
+        dist_ls.data_std = pd.DataFrame(stats_sd['std'], index=index, columns=self._get_data_columns())
+        dist_ls.sample_count = pd.Series(_np.bincount(layer[layer >= 0], minlength=no_of_layers), index=index,
+                                         name='sample_count')
         return dist_ls
 
-    def fit_normal(self, log=True, p0=[10, 180, 0.2]):
-        """ Fits a single normal distribution to each line in the data frame.
+    def fit_normal(self, log=True, p0=None, modes=1):
+        """ Fits a single (or multi-modal) normal distribution to each line in the data frame. See
+        SizeDist.fit_normal for the parameters.
 
         Returns
         -------
@@ -1146,8 +1342,8 @@ class SizeDist_TS(SizeDist):
 
         """
 
-        super(SizeDist_TS, self).fit_normal(log=log, p0=p0)
-        self.data_fit_normal.index = self.data.index
+        super(SizeDist_TS, self).fit_normal(log=log, p0=p0, modes=modes)
+        self.data_fit_normal.index = self._get_data_index()
         return self.data_fit_normal
 
 
@@ -1190,7 +1386,39 @@ class SizeDist_TS(SizeDist):
         # out['size_distribution'] = sd_LS
         return sd_TS
 
-    def calculate_optical_properties(self, wavelength, n = None, noOfAngles=100):
+    def calculate_optical_properties(self, wavelength, n = None, noOfAngles=100, kernel_tolerance=None, n_workers=None,
+                                     chunk_size=None, core_fraction=None, n_shell=None):
+        """Calculates the optical properties of the size distribution.
+
+        Parameters
+        ----------
+        wavelength: float or array-like
+            in nm. If array-like all wavelengths are calculated in one go and an OpticalPropertiesMultiWavelength
+            instance is returned.
+        n: float, complex, or DataFrame, optional
+            Refractive index. If None the index_of_refraction attribute is used. If wavelength is array-like this
+            can also be a list with one refractive index per wavelength.
+        noOfAngles: int
+        kernel_tolerance: float, optional
+            Only applies if the refractive index is time dependent. Instead of doing the Mie calculations for
+            each time stamp, results are interpolated from a grid of refractive indices, which is refined until
+            the relative interpolation error is below kernel_tolerance (e.g. 1e-3). A ValueError is raised if
+            the tolerance can not be met with the maximum number of grid points.
+        n_workers: int, optional
+            For long time series. If larger than 1, the time axis is split into chunks which are processed by a
+            pool of n_workers processes. The result is identical to the serial one.
+        chunk_size: int, optional
+            Number of time stamps per chunk. Default is an even split among the workers.
+        core_fraction: float, optional
+            Volume fraction of the core if the particles are coated spheres (e.g. black carbon with a coating). n
+            is the refractive index of the core in this case.
+        n_shell: float or complex, optional
+            Refractive index of the shell of coated particles, see core_fraction.
+
+        Returns
+        -------
+        OpticalProperties_TS or OpticalPropertiesMultiWavelength instance
+        """
         # opt = super(SizeDist_TS,self).calculate_optical_properties(wavelength, n = None, AOD = False, noOfAngles=100)
         if not _np.any(n):
             n = self.index_of_refraction
@@ -1200,7 +1428,12 @@ class SizeDist_TS(SizeDist):
 
         out = optical_properties.size_dist2optical_properties(self, wavelength, n,
                                                               aod=False,
-                                                              noOfAngles=noOfAngles)
+                                                              noOfAngles=noOfAngles,
+                                                              kernel_tolerance=kernel_tolerance,
+                                                              n_workers=n_workers,
+                                                              chunk_size=chunk_size,
+                                                              core_fraction=core_fraction,
+                                                              n_shell=n_shell)
         # opt_properties = optical_properties.OpticalProperties(out, self.bins)
         # opt._data_period = self._data_period
         return out
@@ -1369,7 +1602,11 @@ class SizeDist_TS(SizeDist):
         2014-11-24 16:02:30
         """
         dist = self.copy()
-        dist.data = dist.data.truncate(before=start, after=end)
+        if dist._array_only():
+            rows = dist._get_data_index().slice_indexer(start, end)
+            dist._set_array(dist.values[rows], dist.index_values[rows], shared=True)
+        else:
+            dist.data = dist.data.truncate(before=start, after=end)
         if dist.housekeeping:
             dist.housekeeping = self.housekeeping.zoom_time(start=start, end=end)
 
@@ -1410,75 +1647,68 @@ class SizeDist_TS(SizeDist):
 
     def average_overAllTime(self):
         """
-        averages over the entire dataFrame and returns a single sizedistribution (numpy.ndarray)
+        averages over the entire dataFrame and returns a single sizedistribution (numpy.ndarray). To average over
+        data which does not fit into memory add the chunks to a timeseries.RunningStatistics instance.
         """
-        singleHist = _np.zeros(self.data.shape[1])
-
-        for i in range(self.data.shape[1]):
-            line = self.data.values[:, i]
-            singleHist[i] = _np.average(line[~_np.isnan(line)])
+        stats = _timeseries.RunningStatistics()
+        stats.add(self)
 
-        data = pd.DataFrame(_np.array([singleHist]), columns=self.data.columns)
+        data = pd.DataFrame(stats.mean.values, columns=self._get_data_columns())
         avgDist = SizeDist(data, self.bins, self.distributionType)
         # self._update()
         return avgDist
 
     @property
     def particle_number_concentration(self):
-        if not _np.any(self.__particle_number_concentration) or not self._uptodate_particle_number_concentration:
-            self.__particle_number_concentration = _timeseries.TimeSeries(self._get_particle_concentration())
-            self.__particle_number_concentration._y_label = 'Particle number concentration #/$cm^3$'
-            self.__particle_number_concentration._x_label = 'Time'
-            self._uptodate_particle_number_concentration = True
-            self.__particle_number_concentration._data_period = self._data_period
-        return self.__particle_number_concentration
+        return self._get_cached('particle_number_concentration', self._get_particle_number_concentration_ts)
 
     @property
     def particle_mass_concentration(self):
-        if not _np.any(self.__particle_mass_concentration) or not self._uptodate_particle_mass_concentration:
-            mass_conc = self._get_mass_concentration()
-            mass_conc = pd.DataFrame(mass_conc, columns = ['Mass concentration ($\mu g/m^{3}$)'])
-            self.__particle_mass_concentration = _timeseries.TimeSeries(mass_conc)
-            self.__particle_mass_concentration._y_label = 'Mass concentration ($\mu g/m^{3}$)'
-            self.__particle_mass_concentration._x_label =  'Time'
-            self.__particle_mass_concentration._data_period = self._data_period
-            self._uptodate_particle_mass_concentration = True
-        return self.__particle_mass_concentration
-
+        return self._get_cached('particle_mass_concentration', self._get_particle_mass_concentration_ts)
 
     @property
     def particle_mass_mixing_ratio(self):
-        if not _np.any(self.__particle_mass_mixing_ratio) or not self._uptodate_particle_mass_mixing_ratio:
-            mass_mix = self._get_mass_mixing_ratio()
-            # pdb.set_trace()
-            ylabel = 'Particle mass mixing ratio'
-            mass_mix = pd.DataFrame(mass_mix)
-            # pdb.set_trace()
-            self.__particle_mass_mixing_ratio = _timeseries.TimeSeries(mass_mix)
-            # pdb.set_trace()
-            self.__particle_mass_mixing_ratio._data_period = self._data_period
-            self.__particle_mass_mixing_ratio._y_label = ylabel
-            self.__particle_mass_mixing_ratio._x_label = 'Time'
-            self._uptodate_particle_mass_mixing_ratio = True
-        # pdb.set_trace()
-        return self.__particle_mass_mixing_ratio
+        return self._get_cached('particle_mass_mixing_ratio', self._get_particle_mass_mixing_ratio_ts)
 
     @property
     def particle_number_mixing_ratio(self):
-        if not _np.any(self.__particle_number_mixing_ratio) or not self._uptodate_particle_number_mixing_ratio:
-            number_mix = self._get_number_mixing_ratio()
-            # pdb.set_trace()
-            ylabel = 'Particle number mixing ratio'
-            number_mix = pd.DataFrame(number_mix)
-            # pdb.set_trace()
-            self.__particle_number_mixing_ratio = _timeseries.TimeSeries(number_mix)
-            self.__particle_number_mixing_ratio._data_period = self._data_period
-            # pdb.set_trace()
-            self.__particle_number_mixing_ratio._y_label = ylabel
-            self.__particle_number_mixing_ratio._x_label = 'Time'
-            self._uptodate_particle_number_mixing_ratio = True
-        # pdb.set_trace()
-        return self.__particle_number_mixing_ratio
+        return self._get_cached('particle_number_mixing_ratio', self._get_particle_number_mixing_ratio_ts)
+
+    def _get_particle_number_concentration_ts(self):
+        out = _timeseries.TimeSeries(self._get_particle_concentration())
+        out._y_label = 'Particle number concentration #/$cm^3$'
+        out._x_label = 'Time'
+        out._data_period = self._data_period
+        return out
+
+    def _get_particle_mass_concentration_ts(self):
+        mass_conc = self._get_mass_concentration()
+        mass_conc = pd.DataFrame(mass_conc, columns = ['Mass concentration ($\mu g/m^{3}$)'])
+        out = _timeseries.TimeSeries(mass_conc)
+        out._y_label = 'Mass concentration ($\mu g/m^{3}$)'
+        out._x_label =  'Time'
+        out._data_period = self._data_period
+        return out
+
+    def _get_particle_mass_mixing_ratio_ts(self):
+        mass_mix = self._get_mass_mixing_ratio()
+        ylabel = 'Particle mass mixing ratio'
+        mass_mix = pd.DataFrame(mass_mix)
+        out = _timeseries.TimeSeries(mass_mix)
+        out._data_period = self._data_period
+        out._y_label = ylabel
+        out._x_label = 'Time'
+        return out
+
+    def _get_particle_number_mixing_ratio_ts(self):
+        number_mix = self._get_number_mixing_ratio()
+        ylabel = 'Particle number mixing ratio'
+        number_mix = pd.DataFrame(number_mix)
+        out = _timeseries.TimeSeries(number_mix)
+        out._data_period = self._data_period
+        out._y_label = ylabel
+        out._x_label = 'Time'
+        return out
 
 class SizeDist_LS(SizeDist):
     """
@@ -1514,18 +1744,6 @@ class SizeDist_LS(SizeDist):
         else:
             self.layerbounderies = layerbounderies
 
-        self.__particle_number_concentration = None
-        self.__particle_mass_concentration = None
-        self.__particle_mass_mixing_ratio = None
-        self.__particle_number_mixing_ratio = None
-        self._update()
-
-    def _update(self):
-        self._uptodate_particle_number_concentration = False
-        self._uptodate_particle_mass_concentration = False
-        self._uptodate_particle_mass_mixing_ratio = False
-        self._uptodate_particle_number_mixing_ratio = False
-
 
     @property
     def layercenters(self):
@@ -1542,62 +1760,57 @@ class SizeDist_LS(SizeDist):
         # self.__layercenters = (newlb[1:] + newlb[:-1]) / 2.
         self.__layercenters = (self.layerbounderies[:,0] + self.layerbounderies[:,1]) / 2.
         self.data.index = self.layercenters
+        self._update()
 
 
     @property
     def particle_number_concentration(self):
-        if not _np.any(self.__particle_number_concentration) or not self._uptodate_particle_number_concentration:
-            self.__particle_number_concentration = _vertical_profile.VerticalProfile(self._get_particle_concentration())
-            self.__particle_number_concentration._x_label = 'Particle number concentration (#/$cm^3#)'
-            self._uptodate_particle_number_concentration = True
-        return self.__particle_number_concentration
+        return self._get_cached('particle_number_concentration', self._get_particle_number_concentration_ls)
 
     @property
     def particle_mass_concentration(self):
-        if not _np.any(self.__particle_mass_concentration) or not self._uptodate_particle_mass_concentration:
-            mass_conc = self._get_mass_concentration()
-            mass_conc = pd.DataFrame(mass_conc, columns = ['Mass concentration ($\mu g/m^{3}$)'])
-            self.__particle_mass_concentration = _vertical_profile.VerticalProfile(mass_conc)
-            self.__particle_mass_concentration._x_label = 'Mass concentration ($\mu g/m^{3}$)'
-            self.__particle_mass_concentration._y_label =  'Altitde'
-
-            self._uptodate_particle_mass_concentration = True
-        return self.__particle_mass_concentration
+        return self._get_cached('particle_mass_concentration', self._get_particle_mass_concentration_ls)
 
     @property
     def particle_mass_mixing_ratio(self):
-        if not _np.any(self.__particle_mass_mixing_ratio) or not self._uptodate_particle_mass_mixing_ratio:
-            mass_mix = self._get_mass_mixing_ratio()
-            # pdb.set_trace()
-            ylabel = 'Particle mass mixing ratio'
-            mass_mix = pd.DataFrame(mass_mix, columns = [ylabel])
-            # pdb.set_trace()
-            self.__particle_mass_mixing_ratio = _vertical_profile.VerticalProfile(mass_mix)
-
-            self.__particle_mass_mixing_ratio.data.index.name = 'Altitude'
-            # pdb.set_trace()
-            self.__particle_mass_mixing_ratio._x_label = ylabel
-            self.__particle_mass_mixing_ratio._y_label = 'Altitude'
-            self._uptodate_particle_mass_mixing_ratio = True
-        # pdb.set_trace()
-        return self.__particle_mass_mixing_ratio
+        return self._get_cached('particle_mass_mixing_ratio', self._get_particle_mass_mixing_ratio_ls)
 
     @property
     def particle_number_mixing_ratio(self):
-        if not _np.any(self.__particle_number_mixing_ratio) or not self._uptodate_particle_number_mixing_ratio:
-            number_mix = self._get_number_mixing_ratio()
-            # pdb.set_trace()
-            ylabel = 'Particle number mixing ratio'
-            number_mix = pd.DataFrame(number_mix, columns = [ylabel])
-            # pdb.set_trace()
-            self.__particle_number_mixing_ratio = _vertical_profile.VerticalProfile(number_mix)
-            # pdb.set_trace()
-            self.__particle_number_mixing_ratio.data.index.name = 'Altitude'
-            self.__particle_number_mixing_ratio._x_label = ylabel
-            self.__particle_number_mixing_ratio._y_label = 'Altitude'
-            self._uptodate_particle_number_mixing_ratio = True
-        # pdb.set_trace()
-        return self.__particle_number_mixing_ratio
+        return self._get_cached('particle_number_mixing_ratio', self._get_particle_number_mixing_ratio_ls)
+
+    def _get_particle_number_concentration_ls(self):
+        out = _vertical_profile.VerticalProfile(self._get_particle_concentration())
+        out._x_label = 'Particle number concentration (#/$cm^3#)'
+        return out
+
+    def _get_particle_mass_concentration_ls(self):
+        mass_conc = self._get_mass_concentration()
+        mass_conc = pd.DataFrame(mass_conc, columns = ['Mass concentration ($\mu g/m^{3}$)'])
+        out = _vertical_profile.VerticalProfile(mass_conc)
+        out._x_label = 'Mass concentration ($\mu g/m^{3}$)'
+        out._y_label =  'Altitde'
+        return out
+
+    def _get_particle_mass_mixing_ratio_ls(self):
+        mass_mix = self._get_mass_mixing_ratio()
+        ylabel = 'Particle mass mixing ratio'
+        mass_mix = pd.DataFrame(mass_mix, columns = [ylabel])
+        out = _vertical_profile.VerticalProfile(mass_mix)
+        out.data.index.name = 'Altitude'
+        out._x_label = ylabel
+        out._y_label = 'Altitude'
+        return out
+
+    def _get_particle_number_mixing_ratio_ls(self):
+        number_mix = self._get_number_mixing_ratio()
+        ylabel = 'Particle number mixing ratio'
+        number_mix = pd.DataFrame(number_mix, columns = [ylabel])
+        out = _vertical_profile.VerticalProfile(number_mix)
+        out.data.index.name = 'Altitude'
+        out._x_label = ylabel
+        out._y_label = 'Altitude'
+        return out
 
     def apply_hygro_growth(self, kappa, RH = None, how='shift_data'):
         """ see docstring of atmPy.sizedistribution.SizeDist for more information
@@ -1662,23 +1875,19 @@ class SizeDist_LS(SizeDist):
             angstrom exponent as a function of altitude
         """
 
-        AOD_list = []
+        # all wavelengths in one go
+        opt = self.calculate_optical_properties(_np.array(wavelengths, dtype=float), n)
         AOD_dict = {}
-        for w in wavelengths:
-            AOD = self.calculate_optical_properties(w, n)  # calculate_AOD(wavelength=w, n=n)
-            #     opt= sizedistribution.OpticalProperties(AOD, dist_LS.bins)
-            AOD_list.append({'wavelength': w, 'opt_inst': AOD})
-            AOD_dict['%.1f' % w] = AOD
-
-        eg = AOD_dict[list(AOD_dict.keys())[0]]
+        for w, opt_w in opt.items():
+            AOD_dict['%.1f' % w] = opt_w
 
-        wls = AOD_dict.keys()
-        wls_a = _np.array(list(AOD_dict.keys())).astype(float)
+        wls_a = opt.wavelengths
+        AOD_layer = opt.AOD_layer.values
         ang_exp = []
         ang_exp_std = []
         ang_exp_r_value = []
-        for e, el in enumerate(eg.layercenters):
-            AODs = _np.array([AOD_dict[wl].data_orig['AOD_layer'].values[e][0] for wl in wls])
+        for e, el in enumerate(self.layercenters):
+            AODs = AOD_layer[e]
             slope, intercept, r_value, p_value, std_err = stats.linregress(_np.log10(wls_a), _np.log10(AODs))
             ang_exp.append(-slope)
             ang_exp_std.append(std_err)
@@ -1688,8 +1897,8 @@ class SizeDist_LS(SizeDist):
         ang_exp_std = _np.array(ang_exp_std)
         ang_exp_r_value = _np.array(ang_exp_r_value)
 
-        tmp = _np.array([[float(i), AOD_dict[i].AOD] for i in AOD_dict.keys()])
-        wavelength, AOD = tmp[_np.argsort(tmp[:, 0])].transpose()
+        AOD = opt.AOD.sort_index()
+        wavelength, AOD = AOD.index.values, AOD.values
         slope, intercept, r_value, p_value, std_err = stats.linregress(_np.log10(wavelength), _np.log10(AOD))
 
         self.angstromexp = -slope
@@ -1719,8 +1928,10 @@ class SizeDist_LS(SizeDist):
     #     opt_properties.parent_dist_LS = self
     #     return opt_properties
 
-    def calculate_optical_properties(self, wavelength, n = None, AOD = True, noOfAngles=100):
-        opt = super(SizeDist_LS,self).calculate_optical_properties(wavelength, n = None, AOD = True, noOfAngles=100)
+    def calculate_optical_properties(self, wavelength, n = None, AOD = True, noOfAngles=100, core_fraction=None,
+                                     n_shell=None):
+        opt = super(SizeDist_LS,self).calculate_optical_properties(wavelength, n = n, AOD = AOD, noOfAngles=noOfAngles,
+                                                                   core_fraction=core_fraction, n_shell=n_shell)
         return opt
 
     def add_layer(self, sd, layerboundery):
@@ -2058,40 +2269,139 @@ class SizeDist_LS(SizeDist):
 #            singleHist[i] = _np.average(line[~_np.isnan(line)])
 #        return singleHist
 
+def simulate_sizedistribution_modes(N, Dg, sigma_g, bins=None, diameter=[10, 2500], numberOfDiameters=100,
+                                    index=None, layerbounderies=None, noise=None, sample_volume=1., seed=None):
+    """Simulates log-normal size distributions with any number of modes for many rows (time stamps or layers) in
+    one go.
+
+    Parameters
+    ----------
+    N, Dg, sigma_g: float or array-like
+        Number concentration (#/cm^3), geometric mean diameter (nm), and geometric standard deviation (e.g. 1.6)
+        of the modes. Each is broadcast to (rows, modes): a float is one mode for all rows, a 1D array has one value
+        per mode, and a 2D array one value per row and mode (e.g. for parameter sweeps).
+    bins: array, optional
+        Bin edges (nm). If None, numberOfDiameters log-spaced edges between diameter[0] and diameter[1].
+    index: pandas.DatetimeIndex, optional
+        Time stamps of the rows, the result is a SizeDist_TS.
+    layerbounderies: array, optional
+        shape(rows, 2), the result is a SizeDist_LS.
+        If neither index nor layerbounderies is given the result is a SizeDist (only one row allowed).
+    noise: None or 'poisson'
+        'poisson': counting statistics of an optical particle counter (e.g. POPS, UHSAS). The number of particles
+        counted in each bin is drawn from a Poisson distribution with the mean N_bin * sample_volume.
+    sample_volume: float or array
+        Volume (cm^3) sampled for each row (e.g. flow rate times integration time), only used with noise.
+    seed: int or numpy.random.Generator, optional
+        For reproducible noise.
+
+    Returns
+    -------
+    SizeDist, SizeDist_TS, or SizeDist_LS instance (dNdlogDp). The number concentration is the integral of the
+    modes over each bin, particles outside the bins are lost.
+
+    Examples
+    --------
+    1000 time stamps with a bimodal distribution whose accumulation mode grows:
+    >>> index = pd.date_range('2016-01-01', periods=1000, freq='10s')
+    >>> Dg = _np.array([_np.full(1000, 30.), _np.linspace(150, 300, 1000)]).transpose()
+    >>> dist = simulate_sizedistribution_modes([2000, 500], Dg, [1.5, 1.6], index=index, noise='poisson', seed=1)
+    """
+    if type(bins) == type(None):
+        bins = _np.logspace(_np.log10(diameter[0]), _np.log10(diameter[1]), numberOfDiameters)
+    bins = _np.asarray(bins, dtype=float)
+
+    params = []
+    for value in (N, Dg, sigma_g):
+        value = _np.asarray(value, dtype=float)
+        if value.ndim < 2:
+            value = value.reshape(1, -1)
+        params.append(value)
+    shape = _np.broadcast_shapes(*[p.shape for p in params])
+
+    if type(index) != type(None):
+        no_rows = len(index)
+    elif type(layerbounderies) != type(None):
+        layerbounderies = _np.asarray(layerbounderies, dtype=float)
+        no_rows = layerbounderies.shape[0]
+    else:
+        no_rows = shape[0]
+        if no_rows != 1:
+            txt = 'For more than one row either index (SizeDist_TS) or layerbounderies (SizeDist_LS) has to be given.'
+            raise ValueError(txt)
+    if shape[0] not in (1, no_rows):
+        txt = 'The parameters have %i rows, but there are %i time stamps or layers.' % (shape[0], no_rows)
+        raise ValueError(txt)
+    N, Dg, sigma_g = [_np.broadcast_to(p, (no_rows, shape[1])) for p in params]
+    if _np.any(sigma_g <= 1):
+        raise ValueError('The geometric standard deviation sigma_g has to be larger than 1.')
+
+    log_bins = _np.log10(bins)
+    numb = _np.zeros((no_rows, bins.shape[0] - 1))
+    for i in range(shape[1]):
+        cdf = _special.ndtr((log_bins[_np.newaxis, :] - _np.log10(Dg[:, [i]])) / _np.log10(sigma_g[:, [i]]))
+        numb += N[:, [i]] * (cdf[:, 1:] - cdf[:, :-1])
+
+    if noise == 'poisson':
+        rng = _np.random.default_rng(seed)
+        sample_volume = _np.broadcast_to(_np.asarray(sample_volume, dtype=float).reshape(-1, 1), (no_rows, 1))
+        numb = rng.poisson(numb * sample_volume) / sample_volume
+    elif noise:
+        raise ValueError("noise has to be None or 'poisson'. It is %s" % noise)
+
+    data = numb / (log_bins[1:] - log_bins[:-1])
+
+    if type(index) != type(None):
+        dist = SizeDist_TS(pd.DataFrame(data, index=index), bins, 'dNdlogDp')
+        if len(index) > 1:
+            dist._data_period = _np.median(_np.diff(index.values) / _np.timedelta64(1, 's'))
+    elif type(layerbounderies) != type(None):
+        data = pd.DataFrame(data, index=layerbounderies.mean(axis=1))
+        dist = SizeDist_LS(data, bins, 'dNdlogDp', layerbounderies)
+    else:
+        dist = SizeDist(pd.DataFrame(data), bins, 'dNdlogDp')
+    return dist
+
+
+def _simulate_normalized_modes(diameter, numberOfDiameters, centerOfAerosolMode, widthOfAerosolMode,
+                               numberOfParticsInMode):
+    """Normal distributions in log10(Dp) (width in log10) for each center, scaled so the number of particles
+    within the diameter range equals numberOfParticsInMode.
+
+    Returns
+    -------
+    dN/dDp (rows x bins), bin edges (nm)"""
+    bins = _np.linspace(_np.log10(diameter[0]), _np.log10(diameter[1]), numberOfDiameters)
+    binwidth = bins[1:] - bins[:-1]
+    bincenters = (bins[1:] + bins[:-1]) / 2.
+    centers = _np.atleast_1d(_np.asarray(centerOfAerosolMode, dtype=float))
+    dNDlogDp = stats.norm.pdf(bincenters[_np.newaxis, :], _np.log10(centers)[:, _np.newaxis], widthOfAerosolMode)
+    NumberConcent = dNDlogDp * binwidth
+    NumberConcent *= (_np.asarray(numberOfParticsInMode, dtype=float).reshape(-1, 1)
+                      / NumberConcent.sum(axis=1, keepdims=True))
+
+    binEdges = 10 ** bins
+    diameterBinwidth = binEdges[1:] - binEdges[:-1]
+    return NumberConcent / diameterBinwidth, binEdges
+
+
 def simulate_sizedistribution(diameter=[10, 2500], numberOfDiameters=100, centerOfAerosolMode=200,
                               widthOfAerosolMode=0.2, numberOfParticsInMode=1000):
     """generates a numberconcentration of an aerosol layer which has a gaussian shape when plottet in dN/log(Dp). 
     However, returned is a numberconcentrations (simply the number of particles in each bin, no normalization)
+    See simulate_sizedistribution_modes for multiple modes and rows.
     Returns
         Number concentration (#)
         bin edges (nm)"""
 
-    start = diameter[0]
-    end = diameter[1]
-    noOfD = numberOfDiameters
-    centerDiameter = centerOfAerosolMode
-    width = widthOfAerosolMode
-    bins = _np.linspace(_np.log10(start), _np.log10(end), noOfD)
-    binwidth = bins[1:] - bins[:-1]
-    bincenters = (bins[1:] + bins[:-1]) / 2.
-    dNDlogDp = plt.mlab.normpdf(bincenters, _np.log10(centerDiameter), width)
-    extraScale = 1
-    scale = 1
-    while 1:
-        NumberConcent = dNDlogDp * binwidth * scale * extraScale
-        if scale != 1:
-            break
-        else:
-            scale = float(numberOfParticsInMode) / NumberConcent.sum()
-
-    binEdges = 10 ** bins
-    diameterBinwidth = binEdges[1:] - binEdges[:-1]
+    data, binEdges = _simulate_normalized_modes(diameter, numberOfDiameters, centerOfAerosolMode,
+                                                widthOfAerosolMode, numberOfParticsInMode)
 
     cols = []
     for e, i in enumerate(binEdges[:-1]):
         cols.append(str(i) + '-' + str(binEdges[e + 1]))
 
-    data = pd.DataFrame(_np.array([NumberConcent / diameterBinwidth]), columns=cols)
+    data = pd.DataFrame(data, columns=cols)
 
     return SizeDist(data, binEdges, 'dNdDp')
 
@@ -2103,21 +2413,18 @@ def simulate_sizedistribution_timeseries(diameter=[10, 2500], numberOfDiameters=
                                          frequency=10):
     delta = datetime.datetime.strptime(endDate, '%Y-%m-%d %H:%M:%S') - datetime.datetime.strptime(startDate,
                                                                                                   '%Y-%m-%d %H:%M:%S')
-    periods = delta.total_seconds() / float(frequency)
+    periods = int(delta.total_seconds() / float(frequency))
     rng = pd.date_range(startDate, periods=periods, freq='%ss' % frequency)
 
     noOfOsz = 5
     ampOfOsz = 100
 
     oszi = _np.linspace(0, noOfOsz * 2 * _np.pi, periods)
-    sdArray = _np.zeros((periods, numberOfDiameters - 1))
-    for e, i in enumerate(rng):
-        sdtmp = simulate_sizedistribution(diameter=diameter,
-                                          numberOfDiameters=numberOfDiameters,
-                                          centerOfAerosolMode=centerOfAerosolMode + (ampOfOsz * _np.sin(oszi[e])))
-        sdArray[e] = sdtmp.data
-    sdts = pd.DataFrame(sdArray, index=rng, columns=sdtmp.data.columns)
-    ts = SizeDist_TS(sdts, sdtmp.bins, sdtmp.distributionType)
+    sdArray, binEdges = _simulate_normalized_modes(diameter, numberOfDiameters,
+                                                   centerOfAerosolMode + (ampOfOsz * _np.sin(oszi)),
+                                                   widthOfAerosolMode, numberOfParticsInMode)
+    sdts = pd.DataFrame(sdArray, index=rng)
+    ts = SizeDist_TS(sdts, binEdges, 'dNdDp')
     ts._data_period = frequency
     return ts
 
@@ -2131,19 +2438,15 @@ def simulate_sizedistribution_layerseries(diameter=[10, 2500], numberOfDiameters
     layerbounderies = _np.array([lbt[:-1], lbt[1:]]).transpose()
     layercenter = (lbt[1:] + lbt[:-1]) / 2.
 
-    # strata = _np.linspace(heightlimits[0],heightlimits[1],noOflayers+1)
-
-    layerArray = _np.zeros((noOflayers, numberOfDiameters - 1))
-
-    for e, stra in enumerate(layercenter):
-        for i, lay in enumerate(layerHeight):
-            sdtmp = simulate_sizedistribution(diameter=diameter, numberOfDiameters=numberOfDiameters,
-                                              widthOfAerosolMode=widthOfAerosolMode, centerOfAerosolMode=layerModecenter[i],
-                                              numberOfParticsInMode=layerDensity[i])
-            layerArray[e] += sdtmp.data.values[0] * gaussian(stra, layerHeight[i], layerThickness[i])
+    # one row per layer
+    modes, binEdges = _simulate_normalized_modes(diameter, numberOfDiameters, layerModecenter, widthOfAerosolMode,
+                                                 layerDensity)
+    weights = gaussian(layercenter[:, _np.newaxis], _np.asarray(layerHeight)[_np.newaxis, :],
+                       _np.asarray(layerThickness)[_np.newaxis, :])
+    layerArray = weights.dot(modes)
 
-    sdls = pd.DataFrame(layerArray, index=layercenter, columns=sdtmp.data.columns)
-    return SizeDist_LS(sdls, sdtmp.bins, sdtmp.distributionType, layerbounderies)
+    sdls = pd.DataFrame(layerArray, index=layercenter)
+    return SizeDist_LS(sdls, binEdges, 'dNdDp', layerbounderies)
 
 
 def generate_aerosolLayer(diameter=[.01, 2.5], numberOfDiameters=30, centerOfAerosolMode=0.6,
@@ -2154,45 +2457,16 @@ def generate_aerosolLayer(diameter=[.01, 2.5], numberOfDiameters=30, centerOfAer
         Number concentration (#)
         bin edges (nm)"""
 
-    layerBoundery = _np.array(layerBoundery)
-    start = diameter[0]
-    end = diameter[1]
-    noOfD = numberOfDiameters
-    centerDiameter = centerOfAerosolMode
-    width = widthOfAerosolMode
-    bins = _np.linspace(_np.log10(start), _np.log10(end), noOfD)
-    binwidth = bins[1:] - bins[:-1]
-    bincenters = (bins[1:] + bins[:-1]) / 2.
-    dNDlogDp = plt.mlab.normpdf(bincenters, _np.log10(centerDiameter), width)
-    extraScale = 1
-    scale = 1
-    while 1:
-        NumberConcent = dNDlogDp * binwidth * scale * extraScale
-        if scale != 1:
-            break
-        else:
-            scale = float(numberOfParticsInMode) / NumberConcent.sum()
-
-    binEdges = 10 ** bins
-    # diameterBinCenters = (binEdges[1:] + binEdges[:-1])/2.
-    diameterBinwidth = binEdges[1:] - binEdges[:-1]
+    data, binEdges = _simulate_normalized_modes(diameter, numberOfDiameters, centerOfAerosolMode,
+                                                widthOfAerosolMode, numberOfParticsInMode)
 
     cols = []
     for e, i in enumerate(binEdges[:-1]):
         cols.append(str(i) + '-' + str(binEdges[e + 1]))
 
-    layerBoundery = _np.array([0., 10000.])
-    # layerThickness = layerBoundery[1:] - layerBoundery[:-1]
+    layerBoundery = _np.array([[0., 10000.]])
     layerCenter = [5000.]
-    data = pd.DataFrame(_np.array([NumberConcent / diameterBinwidth]), index=layerCenter, columns=cols)
-    # return data
-
-    #     atmosAerosolNumberConcentration = pd.DataFrame()
-    # atmosAerosolNumberConcentration['bin_center'] = pd.Series(diameterBinCenters)
-    #     atmosAerosolNumberConcentration['bin_start'] = pd.Series(binEdges[:-1])
-    #     atmosAerosolNumberConcentration['bin_end'] = pd.Series(binEdges[1:])
-    #     atmosAerosolNumberConcentration['numberConcentration'] = pd.Series(NumberConcent)
-    #     return atmosAerosolNumberConcentration
+    data = pd.DataFrame(data, index=layerCenter, columns=cols)
 
     return SizeDist_LS(data, binEdges, 'dNdDp', layerBoundery)
 
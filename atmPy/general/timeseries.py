@@ -144,43 +144,52 @@ def load_netCDF(fname):
 
 #### Tools
 def close_gaps(ts, verbose = False):
+    """Fills gaps (time steps larger than twice the data period) with time stamps at the data period, the data
+    at these time stamps is nan. The time stamps of all gaps are computed at once, followed by a single reindex.
+
+    Returns
+    -------
+    copy of ts with the closed gaps. The attribute gap_summary is a pandas DataFrame with the start (last time
+    stamp before the gap), end (first time stamp after the gap), and number of missing points of each gap.
+    """
     ts = ts.copy()
     ts.data = ts.data.sort_index()
     if type(ts.data).__name__ == 'Panel':
-        data = ts.data.items.values
         index = ts.data.items
     else:
-        data = ts.data.index.values
         index = ts.data.index
 
-    index_df = _pd.DataFrame(index = index)
-
-    dt = data[1:] - data[:-1]
-    dt = dt / _np.timedelta64(1,'s')
+    times = index.values
+    dt = (times[1:] - times[:-1]) / _np.timedelta64(1,'s')
 
     median = _np.median(dt)
 
     if median > (1.1 * ts._data_period) or median < (0.9 * ts._data_period):
         _warnings.warn('There is a periode and median missmatch (%0.1f,%0.1f), this is either due to an error in the assumed period or becuase there are too many gaps in the _timeseries.'%(median,ts._data_period))
 
-    point_dist = (index.values[1:] - index.values[:-1]) / _np.timedelta64(1, 's')
-    where = point_dist > 2 * ts._data_period
-    off_periods = _np.array([index[:-1][where], index[1:][where]]).transpose()
+    period = _np.timedelta64(int(round(ts._data_period * 1e9)), 'ns')
+    where = _np.nonzero(dt > 2 * ts._data_period)[0]
+    missing = _np.round((times[where + 1] - times[where]) / period).astype(_np.int64) - 1
+    missing = _np.clip(missing, 0, None)
+    ts.gap_summary = _pd.DataFrame({'start': index[where], 'end': index[where + 1], 'missing_points': missing})
     if verbose:
-        print('found %i gaps'%(off_periods.shape[0]))
-    for i, op in enumerate(off_periods):
-        no_periods = round((op[1] - op[0])/ _np.timedelta64(1,'s')) / ts._data_period
-        out = _pd.date_range(start = op[0], periods= no_periods, freq= '%i s'%ts._data_period)
-        out = out[1:]
-        out = _pd.DataFrame(index = out)
-        index_df = _pd.concat([index_df, out])
-
-    index_df.sort_index(inplace=True)
-    ts.data = ts.data.reindex(index_df.index)
+        print('found %i gaps'%(where.shape[0]))
+
+    # k-th new time stamp of each gap: start + k * period
+    total = missing.sum()
+    if total > 0:
+        offsets = _np.repeat(_np.cumsum(missing) - missing, missing)
+        k = _np.arange(1, total + 1) - offsets
+        new = (_np.repeat(times[where], missing) + k * period).astype(times.dtype)
+        times_new = _np.insert(times, _np.repeat(where + 1, missing), new)
+        index_new = _pd.DatetimeIndex(times_new, name=index.name)
+        if index.tz is not None:
+            index_new = index_new.tz_localize('UTC').tz_convert(index.tz)
+        ts.data = ts.data.reindex(index_new)
     return ts
 
 
-def align_to(ts, ts_other, verbose= False):
+def align_to(ts, ts_other, verbose= False, how = 'auto', max_missing=3):
     """
     Main change, timestamp at beginning!
     Align the TimeSeries ts to another time_series by interpolating (linearly). If
@@ -196,6 +205,15 @@ def align_to(ts, ts_other, verbose= False):
     ----------
     ts: original time series
     ts_other: timeseries to align to
+    how: str
+        'auto': as described above (rolling mean over a number of points, then interpolation).
+        'interval_mean': the mean of all data points of ts in the interval of each time stamp of ts_other, from
+            the time stamp to the next one but at most ts_other._data_period (or the median time step if that
+            is not set). As the intervals are defined by time, not by a number of points, this is exact for
+            irregular or gappy time series (e.g. a 20 Hz instrument aligned to minute data). Intervals without
+            data are nan.
+    max_missing: int
+        only for how='auto', see merge.
 
     Returns
     -------
@@ -212,6 +230,12 @@ def align_to(ts, ts_other, verbose= False):
             print('indeces are identical, returning original time series.')
         return ts
 
+    if how == 'interval_mean':
+        return _align_to_interval_mean(ts, ts_other, verbose = verbose)
+    elif how != 'auto':
+        txt = "how has to be 'auto' or 'interval_mean', not %s" % how
+        raise ValueError(txt)
+
     window = ts_other._data_period / ts._data_period
     if window < 0.5:
         _warnings.warn('Time period of other time series is smaller (ratio: %s). You might want '
@@ -239,7 +263,7 @@ def align_to(ts, ts_other, verbose= False):
     ts_other.data.columns.name = None # if this is not empty it will give an error
     if verbose:
         print('performing merge with empty index of other time series')
-    ts_t =  merge(ts_other, tsrm, verbose = verbose)
+    ts_t =  merge(ts_other, tsrm, verbose = verbose, max_missing = max_missing)
     tsrm.data = ts_t.data
 
     tsrm._data_period = ts_other._data_period
@@ -249,6 +273,34 @@ def align_to(ts, ts_other, verbose= False):
 
     return tsrm
 
+def _align_to_interval_mean(ts, ts_other, verbose = False):
+    """see align_to"""
+    data = ts.data
+    if not data.index.is_monotonic_increasing:
+        data = data.sort_index()
+    index_other = ts_other.data.index
+    starts = index_other.values
+    if type(ts_other._data_period) != type(None):
+        period = _np.timedelta64(int(round(ts_other._data_period * 1e9)), 'ns')
+    elif starts.shape[0] > 1:
+        period = _np.median(_np.diff(starts))
+    else:
+        txt = 'The data period of the time series to align to is unknown.'
+        raise ValueError(txt)
+    ends = starts + period
+    ends[:-1] = _np.minimum(ends[:-1], starts[1:])
+    if verbose:
+        print('averaging into %i intervals' % starts.shape[0])
+
+    means = _array_tools.interval_mean(starts, ends, data.index.values, data.values)
+    ts.data = _pd.DataFrame(means, index=index_other, columns=data.columns)
+    ts._data_period = ts_other._data_period
+    if verbose:
+        print('=====  alignment done ========')
+        print('=================================')
+    return ts
+
+
 def align_to_old(ts, ts_other, verbose= False):
     """
     Align the TimeSeries ts to another time_series by interpolating (linearly). If
@@ -316,9 +368,13 @@ def align_to_old(ts, ts_other, verbose= False):
     return tsrm
 
 
-def merge(ts, ts_other, verbose = False):
+def merge(ts, ts_other, verbose = False, max_missing = 3):
     """ Merges current with other timeseries. The returned timeseries has the same time-axes as the current
     one (as opposed to the one merged into it). Missing or offset data points are linearly interpolated.
+    Gaps of max_missing or more missing points are not bridged (see array_tools.interp_gaps for details).
+
+    The time stamps of both are assumed to be sorted (they are sorted if not), so each column is aligned with
+    binary searches instead of concatenating, sorting, and grouping the data (see benchmarks.merge_old).
 
     Argument
     --------
@@ -338,30 +394,47 @@ def merge(ts, ts_other, verbose = False):
 
     ts_this = ts.copy()
 
-    # if _np.all(ts_this.data.index == ts_other.data.index):
     if _np.array_equal(ts_this.data.index, ts_other.data.index):
         ts_this.data = _pd.concat([ts_this.data, ts_other.data], axis=1)
 
     else:
-        ts_data_list = [ts_this.data, ts_other.data]
-        # catsortinterp = _pd.concat(ts_data_list).sort_index().interpolate(method='index')
-        # merged = catsortinterp.groupby(catsortinterp.index).mean().reindex(ts_data_list[0].index)
-        # ts_this.data = merged
-
-        # ts_data_list = [data.data, correlant_nocol]
-        catsort = _pd.concat(ts_data_list).sort_index()  # .interpolate(method='index')
-
-        mask = catsort.copy()
-        grp = ((mask.notnull() != mask.shift().notnull()).cumsum())
-        grp['ones'] = 1
-        for i in catsort.columns:
-            mask[i] = (grp.groupby(i)['ones'].transform('count') < 3) | catsort[i].notnull()
-
-        catsortinterp = catsort.interpolate(method='index')
-        catsortinterpmasked = catsortinterp[mask]
+        this = ts_this.data
+        other = ts_other.data
+        if not this.index.is_monotonic_increasing:
+            this = this.sort_index()
+        if not other.index.is_monotonic_increasing:
+            other = other.sort_index()
+        index_this = this.index.values
+        index_other = other.index.values
+
+        columns = list(this.columns) + [col for col in other.columns if col not in this.columns]
+        if any(col in other.columns for col in this.columns):
+            # the merged order of the time stamps is the same for all columns found in both
+            order = _np.argsort(_np.concatenate((index_this, index_other)), kind='stable')
+            index_both = _np.concatenate((index_this, index_other))[order]
+            rank_both = _np.concatenate((_np.zeros(index_this.shape[0], dtype=int),
+                                         _np.ones(index_other.shape[0], dtype=int)))[order]
+        out = _np.zeros((index_this.shape[0], len(columns)))
+        for e, col in enumerate(columns):
+            in_this = col in this.columns
+            in_other = col in other.columns
+            if in_this and not in_other:
+                values = this[col].values.astype(_np.float64)
+                if not _np.isnan(values).any():
+                    out[:, e] = values
+                    continue
+                xp, fp, rank, missing, missing_rank = index_this, values, 0, [index_other], [1]
+            elif in_other and not in_this:
+                xp, fp, rank, missing, missing_rank = index_other, other[col].values, 1, [index_this], [0]
+            else:
+                fp = _np.concatenate((this[col].values.astype(_np.float64),
+                                      other[col].values.astype(_np.float64)))[order]
+                xp, rank, missing, missing_rank = index_both, rank_both, [], []
+            # rows of this come first at identical time stamps (rank)
+            out[:, e] = _array_tools.interp_gaps(index_this, xp, fp, missing=missing, max_missing=max_missing,
+                                                 rank=rank, missing_rank=missing_rank)
 
-        merged = catsortinterpmasked.groupby(catsortinterpmasked.index).mean().reindex(ts_data_list[0].index)
-        ts_this.data = merged
+        ts_this.data = _pd.DataFrame(out, index=this.index, columns=columns)
 
     if verbose:
         print('=====  merge done ========')
@@ -402,43 +475,266 @@ def correlate(data,correlant, data_column = False, correlant_column = False, rem
 
 def rolling_correlation(data, correlant, window, data_column = False, correlant_column = False,  min_good_ratio = 0.67, verbose = True):
     "time as here: http://docs.scipy.org/doc/numpy/reference/arrays.datetime.html#datetime-units"
+    stats = rolling_stats(data, correlant, window, data_column=data_column, correlant_column=correlant_column,
+                          min_good_ratio=min_good_ratio, verbose=verbose)
+    pear_r_ts = TimeSeries(stats.data.loc[:, ['pearson_r']])
+    pear_r_ts._data_period = stats._data_period
+    pear_r_ts._y_label = 'r'
+    return pear_r_ts
 
-    if correlant_column:
-        correlant = correlant._del_all_columns_but(correlant_column)
+def rolling_stats(data, correlant, window, data_column = False, correlant_column = False, min_good_ratio = 0.67,
+                  remove_zeros = True, verbose = False):
+    """Correlation statistics of data and correlant in windows sliding by one data point (see
+    array_tools.rolling_regression, the sums are updated in constant time per step). The correlant is aligned to
+    data first.
 
-    if data_column:
-        data = data._del_all_columns_but(data_column)
+    Parameters
+    ----------
+    window: tuple
+        tuple[0]: periods, tuple[1]: unit (see
+        http://docs.scipy.org/doc/numpy/reference/arrays.datetime.html#datetime-units)
+    data_column, correlant_column: str
+        Column to be used if there is more than one.
+    min_good_ratio: float
+        Windows in which less than this fraction of the points are valid (data and correlant not nan) are nan.
+    remove_zeros: bool
+        Points where data or correlant is zero are not used (as in correlate).
 
-    correlant = correlant.align_to(data) # I do align before merge, because it is more suffisticated!
-    merged = data.copy()
-    merged.data['correlant'] = correlant.data
+    Returns
+    -------
+    TimeSeries with the columns pearson_r, slope, intercept (correlant = slope * data + intercept),
+    slope_zero_intercept, and no_of_points. The time stamp is the center of each window.
+    """
+    if data_column:
+        data_values = data.data[data_column].values
+    elif data.data.shape[1] > 1:
+        raise ValueError('Data contains more than 1 column. Specify which to correlate. Options: %s'%(list(data.data.keys())))
+    else:
+        data_values = data.data.iloc[:,0].values
+    correlant_aligned = correlant.align_to(data)
+    if correlant_column:
+        correlant_values = correlant_aligned.data[correlant_column].values
+    elif correlant.data.shape[1] > 1:
+        raise ValueError('Correlant contains more than 1 column. Specify which to correlate. Options: %s'%(list(correlant_aligned.data.keys())))
+    else:
+        correlant_values = correlant_aligned.data.iloc[:,0].values
 
-    data_period = _np.timedelta64(int(merged._data_period), 's')
-    window = _np.timedelta64(window[0], window[1])
-    window = int(window/data_period)
+    data_period = _np.timedelta64(int(round(data._data_period * 1e9)), 'ns')
+    window = int(_np.timedelta64(window[0], window[1]) / data_period)
+    min_good = int(_np.ceil(window * min_good_ratio))
     if verbose:
-        print('Each window contains %s data points of which at least %s are not nan.'%(window, int(window * min_good_ratio)))
-
-    min_good = window * min_good_ratio
-    size = merged.data.shape[0]-window + 1
-    timestamps = _pd.TimeSeries(_pd.to_datetime(_pd.Series(_np.zeros(size))))
-    pear_r = _np.zeros(size)
-    for i in range(size):
-        secment = TimeSeries(merged.data.iloc[i:i+window,:])
-        secment._data_period = merged._data_period
-    #     print(secment.data.dropna().shape[0] < min_good)
-        if secment.data.dropna().shape[0] < min_good:
-            pear_r[i]= _np.nan
+        print('Each window contains %s data points of which at least %s are not nan.'%(window, min_good))
+
+    stats = _array_tools.rolling_regression(data_values, correlant_values, window, min_periods=min_good,
+                                            remove_zeros=remove_zeros)
+    # only complete windows, the time stamp is the center of the window
+    index = data.data.index
+    start = index[:index.shape[0] - window + 1]
+    end = index[window - 1:]
+    timestamps = start + (end - start) / 2.
+    out = _pd.DataFrame({key: value[window - 1:] for key, value in stats.items()}, index=timestamps)
+    out = out.loc[:, ['pearson_r', 'slope', 'intercept', 'slope_zero_intercept', 'no_of_points']]
+    out_ts = TimeSeries(out)
+    out_ts._data_period = data._data_period
+    return out_ts
+
+
+class RunningStatistics(object):
+    """Streaming reducer which accumulates the number of values, mean, sum of squared deviations from the mean,
+    minimum, and maximum of each column in time windows as chunks of data arrive (e.g. while reading files one by
+    one). Only the statistics of the windows are kept, so averages over archives larger than the memory can be
+    built. nan values are ignored. Chunks are combined with the parallel algorithm of Chan et al., which is
+    numerically stable also when the variance is small compared to the mean.
+
+    Parameters
+    ----------
+    window: tuple, optional
+        tuple[0]: periods, tuple[1]: unit (D,h,m,s...) as in TimeSeries.average_time. The windows start at
+        multiples of the window since 1970-01-01 (like pandas resample for windows which fit into a day). If
+        None, all data is reduced into a single window (e.g. for average_overAllTime).
+
+    Attributes
+    ----------
+    count, mean, std, min, max: pandas DataFrame
+        index: start of each window that contains data, columns: columns of the data. std has one delta degree
+        of freedom (like pandas).
+
+    Examples
+    --------
+    >>> stats = RunningStatistics(window=(1, 'h'))
+    >>> for fname in fnames:
+    ...     stats.add(read_file(fname))
+    >>> hourly = stats.get_timeseries(std=True)
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        if type(window) == type(None):
+            self._window_ns = None
         else:
-            corr = secment.correlate_to(secment, data_column=merged.data.columns[0], correlant_column=merged.data.columns[1])
-            pear_r[i] = corr.pearson_r[0]
-        timestamps.iloc[i] = secment.data.index[0] + ((secment.data.index[-1] - secment.data.index[0])/2.)
-    #     break
+            try:
+                self._window_ns = int(_np.timedelta64(window[0], window[1]) / _np.timedelta64(1, 'ns'))
+            except TypeError:
+                txt = 'The window has to have a fixed length (e.g. seconds, hours, days). It is %s' % (window,)
+                raise ValueError(txt)
+        self.columns = None
 
-    pear_r_ts = TimeSeries(_pd.DataFrame(pear_r, index = timestamps, columns = ['pearson_r']))
-    pear_r_ts._data_period = merged._data_period
-    pear_r_ts._y_label = 'r'
-    return pear_r_ts
+    def add(self, data):
+        """Adds a chunk of data
+
+        Parameters
+        ----------
+        data: pandas DataFrame or Series with a DatetimeIndex, TimeSeries, or SizeDist_TS
+        """
+        if hasattr(data, '_get_data_index'):
+            index = data._get_data_index()
+            columns = data._get_data_columns()
+            values = data.values
+        else:
+            if isinstance(data, TimeSeries):
+                data = data.data
+            if isinstance(data, _pd.Series):
+                data = data.to_frame()
+            index = data.index
+            columns = data.columns
+            values = data.values
+        values = _np.asarray(values, dtype=_np.float64)
+
+        if type(self.columns) == type(None):
+            self._init_columns(columns)
+        elif not self.columns.equals(columns):
+            txt = 'The columns of the chunk differ from the columns of the previous chunks.'
+            raise ValueError(txt)
+        if values.shape[0] == 0:
+            return
+
+        if type(self._window_ns) == type(None):
+            keys = _np.zeros(values.shape[0], dtype=_np.int64)
+        else:
+            times = _np.asarray(index.values).astype('datetime64[ns]').view(_np.int64)
+            keys = times // self._window_ns * self._window_ns
+
+        # statistics of the chunk, rows sorted by window
+        order = _np.argsort(keys, kind='stable')
+        keys = keys[order]
+        values = values[order]
+        starts = _np.concatenate(([0], _np.nonzero(keys[1:] != keys[:-1])[0] + 1))
+        valid = ~_np.isnan(values)
+        count = _np.add.reduceat(valid, starts, axis=0).astype(_np.float64)
+        with _np.errstate(invalid='ignore', divide='ignore'):
+            mean = _np.add.reduceat(_np.where(valid, values, 0), starts, axis=0) / count
+            lengths = _np.diff(_np.append(starts, values.shape[0]))
+            dev = _np.where(valid, values - _np.repeat(mean, lengths, axis=0), 0)
+        m2 = _np.add.reduceat(dev ** 2, starts, axis=0)
+        vmin = _np.minimum.reduceat(_np.where(valid, values, _np.inf), starts, axis=0)
+        vmax = _np.maximum.reduceat(_np.where(valid, values, -_np.inf), starts, axis=0)
+
+        self._combine(keys[starts], count, mean, m2, vmin, vmax)
+
+    def merge(self, other):
+        """Adds the statistics of another RunningStatistics instance with the same window and columns (e.g. from
+        another process or another part of the archive)."""
+        if other.window != self.window:
+            raise ValueError('The windows of the two RunningStatistics instances differ.')
+        if type(other.columns) == type(None):
+            return
+        if type(self.columns) == type(None):
+            self._init_columns(other.columns)
+        elif not self.columns.equals(other.columns):
+            raise ValueError('The columns of the two RunningStatistics instances differ.')
+        self._combine(*other._get_state())
+
+    def _init_columns(self, columns):
+        self.columns = columns
+        self.__keys = _np.zeros(0, dtype=_np.int64)
+        self.__count, self.__mean, self.__m2, self.__min, self.__max = [_np.zeros((0, len(columns)))
+                                                                        for i in range(5)]
+
+    def _get_state(self):
+        return self.__keys, self.__count, self.__mean, self.__m2, self.__min, self.__max
+
+    def _combine(self, keys, count, mean, m2, vmin, vmax):
+        """Combines the statistics of (unique, sorted) windows with the windows which are already there"""
+        all_keys = _np.union1d(self.__keys, keys)
+        if all_keys.shape[0] != self.__keys.shape[0]:
+            pos = _np.searchsorted(all_keys, self.__keys)
+            stats = []
+            for old, fill in [(self.__count, 0), (self.__mean, 0), (self.__m2, 0), (self.__min, _np.inf),
+                              (self.__max, -_np.inf)]:
+                new = _np.full((all_keys.shape[0], old.shape[1]), fill, dtype=_np.float64)
+                new[pos] = old
+                stats.append(new)
+            self.__count, self.__mean, self.__m2, self.__min, self.__max = stats
+            self.__keys = all_keys
+
+        pos = _np.searchsorted(self.__keys, keys)
+        count_a = self.__count[pos]
+        count_ab = count_a + count
+        with _np.errstate(invalid='ignore', divide='ignore'):
+            delta = _np.where(count > 0, mean, 0) - self.__mean[pos]
+            frac = _np.where(count_ab > 0, count / count_ab, 0)
+        self.__mean[pos] += delta * frac
+        self.__m2[pos] += _np.where(count > 0, m2, 0) + delta ** 2 * count_a * frac
+        self.__count[pos] = count_ab
+        self.__min[pos] = _np.minimum(self.__min[pos], vmin)
+        self.__max[pos] = _np.maximum(self.__max[pos], vmax)
+
+    def _get_frame(self, values):
+        if type(self._window_ns) == type(None):
+            index = None
+        else:
+            index = _pd.DatetimeIndex(self.__keys.view('datetime64[ns]'), name='Time')
+        return _pd.DataFrame(values, index=index, columns=self.columns)
+
+    @property
+    def count(self):
+        return self._get_frame(self.__count)
+
+    @property
+    def mean(self):
+        return self._get_frame(_np.where(self.__count > 0, self.__mean, _np.nan))
+
+    @property
+    def std(self):
+        with _np.errstate(invalid='ignore', divide='ignore'):
+            std = _np.sqrt(self.__m2 / (self.__count - 1))
+        return self._get_frame(_np.where(self.__count > 1, std, _np.nan))
+
+    @property
+    def min(self):
+        return self._get_frame(_np.where(self.__count > 0, self.__min, _np.nan))
+
+    @property
+    def max(self):
+        return self._get_frame(_np.where(self.__count > 0, self.__max, _np.nan))
+
+    def get_timeseries(self, std=False, envelope=False):
+        """The mean of each window as TimeSeries, like TimeSeries.average_time.
+
+        Parameters
+        ----------
+        std: bool
+            Adds the column std (standard deviation of the first column).
+        envelope: bool
+            Adds the columns envelope_low and envelope_high (mean -/+ std of the first column). See min and max
+            for the full range of the values.
+
+        Returns
+        -------
+        TimeSeries instance
+        """
+        data = self.mean
+        if std or envelope:
+            std_tmp = self.std
+            if std:
+                data['std'] = std_tmp.iloc[:, 0]
+            if envelope:
+                data['envelope_low'] = data.iloc[:, 0] - std_tmp.iloc[:, 0]
+                data['envelope_high'] = data.iloc[:, 0] + std_tmp.iloc[:, 0]
+        ts = TimeSeries(data)
+        if type(self._window_ns) != type(None):
+            ts._data_period = self._window_ns / 1e9
+        return ts
 
 
 class Rolling(_pd.core.window.Rolling):
@@ -481,18 +777,34 @@ class Rolling(_pd.core.window.Rolling):
         return corr_res_ts
 
     def corr_timelag(self, other, dt=(5, 'm'), no_of_steps=10, center=0, normalize=True, **kwargs):
-        """dt: tuple
-                first arg of tuple can be int or array-like of dtype int. Second arg is unit. if array-like no_of... is ignored"""
+        """Rolling correlation with other shifted by a range of time lags.
+
+        Other is aligned only once, to a regular grid that covers the time stamps of this series shifted by all
+        lags. Its step is the data period if all lags are multiples of it, otherwise the greatest common divisor
+        of the data period and the lags (but at least 1/16 of the data period). The shifted series are taken
+        from the aligned one (interpolated linearly between grid points if the time stamps are irregular), and
+        the correlations of all lags are calculated from cumulative sums (see array_tools.rolling_corr). So
+        the cost hardly depends on the number of lags.
+
+        With a regular time axis and lags that are multiples of the data period, the result is the same as
+        aligning the shifted other to this series for each lag, except at the edges: no value is carried forward
+        beyond the last time stamp of other, the shifted values there are nan (aligning per lag carried the
+        last value forward, following the gap rule of merge). With a finer grid, the gap rule of merge (max_missing) is scaled with the
+        refinement, gaps with nan values of other are therefore not bridged exactly as by aligning per lag.
+
+        dt: tuple
+                first arg of tuple can be int or array-like of dtype int. Second arg is unit. if array-like no_of... is ignored
+
+        Returns
+        -------
+        TimeSeries_2D: correlation (normalized to the maximum of each time stamp if normalize) for each lag
+        TimeSeries: lag of the maximum correlation, nan if more than 30% of the lags are nan
+        """
         if other.data.columns.shape[0] == 1:
             other_column = other.data.columns[0]
         else:
             txt = 'please make sure the timeseries has only one collumn'
             raise ValueError(txt)
-        # other =  acsm.copy()
-        #         dt = (5, 'm')
-        #         no_of_seps = 10
-        #         center = 0
-
 
         if hasattr(dt[0], '__len__'):
             if type(dt[0]).__name__ == 'list':
@@ -506,41 +818,51 @@ class Rolling(_pd.core.window.Rolling):
 
         if center:
             dt_array += int(center)
-        out = False
-        for dtt in dt_array:
-            tst = other.copy()
-            tst.data.index += _np.timedelta64(int(dtt), dt[1])
-            corr = self.corr(tst)
-            if not out:
-                out = corr
-                out.data.columns = [dtt]
-            else:
-                out.data[dtt] = corr.data  # [self._data_column]
-
-        if normalize:
-            out = TimeSeries_2D(out.data.apply(lambda line: line / line.max(), axis=1))
-        else:
-            out = TimeSeries_2D(out.data)
-
-        def aaa(line):
-            if (_np.isnan(line)).sum() > ((~_np.isnan(line)).sum() * 0.3):
-                return _np.nan
-            col_t = cols.copy()
-            lt = line[~ _np.isnan(line)]
 
-            col_t = col_t[~ _np.isnan(line)]
-            argmax = lt.argmax()
-            realMax = col_t[argmax]
-            return realMax
+        index = self.data.data.index
+        x = self.data.data[self._data_column].values
+        times = index.values.astype('datetime64[ns]').view(_np.int64)
+        period = int(round(self.data._data_period * 1e9))
+        lags = _np.array([_np.timedelta64(int(dtt), dt[1]) / _np.timedelta64(1, 'ns') for dtt in dt_array],
+                         dtype=_np.int64)
+
+        # other aligned to a regular grid covering all shifted time stamps
+        step = max(int(_np.gcd.reduce(_np.append(lags, period))), period // 16, 1)
+        first = times[0] - lags.max()
+        no_of_points = int((times[-1] - lags.min() - first) // step) + 2
+        grid = TimeSeries(_pd.DataFrame(index=_pd.DatetimeIndex((first + step * _np.arange(no_of_points))
+                                                                .astype('datetime64[ns]'))))
+        grid._data_period = self.data._data_period
+        # the finer the grid, the more grid points are counted as missing in gaps of other (see merge)
+        aligned = other.align_to(grid, max_missing=3 * (period // step)).data[other_column].values
+
+        # column k at row i is other at times[i] - lags[k]
+        position = (times[:, _np.newaxis] - lags[_np.newaxis, :] - first) / step
+        lower = _np.floor(position).astype(_np.int64)
+        fraction = position - lower
+        y = aligned[lower]
+        between = fraction > 0
+        y[between] = (y[between] * (1 - fraction[between]) +
+                      aligned[_np.minimum(lower + 1, no_of_points - 1)][between] * fraction[between])
+        # the last value of other is not carried forward
+        last = other.data.index.values.astype('datetime64[ns]').view(_np.int64).max()
+        y[times[:, _np.newaxis] - lags[_np.newaxis, :] > last] = _np.nan
+        corr = _array_tools.rolling_corr(x, y, self.window, min_periods=self.min_periods, center=self.center)
 
-        cols = out.data.columns
-        dt_max = _np.apply_along_axis(aaa, 1, out.data.values)
-
-
-
-        # cols = out.data.columns
-        # dt_max = _np.apply_along_axis(lambda arr: cols[arr.argmax()], 1, out.data.values)
-        dt_max = TimeSeries(_pd.DataFrame(dt_max, index=out.data.index))
+        if normalize:
+            with _warnings.catch_warnings():
+                _warnings.simplefilter('ignore', RuntimeWarning)
+                corr = corr / _np.nanmax(corr, axis=1)[:, _np.newaxis]
+        out = TimeSeries_2D(_pd.DataFrame(corr, index=index, columns=dt_array))
+        out._data_period = self.data._data_period
+
+        # lag of the maximum, nan if more than 30 % of the lags are nan
+        valid = ~_np.isnan(corr)
+        argmax = _np.argmax(_np.where(valid, corr, -_np.inf), axis=1)
+        dt_max = _np.asarray(dt_array, dtype=float)[argmax]
+        dt_max[(~valid).sum(axis=1) > valid.sum(axis=1) * 0.3] = _np.nan
+        dt_max = TimeSeries(_pd.DataFrame(dt_max, index=index))
+        dt_max._data_period = self.data._data_period
         if dt[1] == 'm':
             ylt = 'min.'
         else:
@@ -1197,10 +1519,28 @@ class TimeSeries(object):
     correlate_to = correlate
 
     rolling_correlation = rolling_correlation
+    rolling_stats = rolling_stats
 
     merge = merge
 
-    copy = _deepcopy
+    def copy(self, deep=False):
+        """Returns a copy of the time series
+
+        Parameters
+        ----------
+        deep: bool
+            If False, the copy is lightweight: the data (and other pandas objects) share their memory with the
+            original until one of them is changed (copy-on-write, see pandas_tools.lightweight_copy). If True,
+            everything is copied right away. Note, this needs copy-on-write to be enabled in pandas (always the
+            case with pandas >= 3, see pandas_tools.copy_on_write_enabled), otherwise the pandas objects are
+            copied right away, too, and the lightweight copy saves no memory."""
+        if deep:
+            return _deepcopy(self)
+        else:
+            return self.__copy__()
+
+    def __copy__(self):
+        return _pandas_tools.lightweight_copy(self)
 
     # rollingR = Rolling
 
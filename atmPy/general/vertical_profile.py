@@ -4,6 +4,7 @@ from copy import deepcopy as _deepcopy
 
 import atmPy.general.timeseries
 from atmPy.tools import plt_tools
+from atmPy.tools import pandas_tools as _pandas_tools
 
 
 class VerticalProfile(object):
@@ -40,8 +41,15 @@ class VerticalProfile(object):
     def save(self, fname):
         self.data.to_csv(fname)
 
-    def copy(self):
-        return _deepcopy(self)
+    def copy(self, deep=False):
+        """deep: if False, the copy is lightweight (see TimeSeries.copy)"""
+        if deep:
+            return _deepcopy(self)
+        else:
+            return self.__copy__()
+
+    def __copy__(self):
+        return _pandas_tools.lightweight_copy(self)
 
     def convert2timeseries(self, ts):
         """merges a vertical profile with a timeseries that contains height data
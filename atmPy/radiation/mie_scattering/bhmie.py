@@ -28,6 +28,9 @@ class bhmie_hagen():
          gsca   - asymmetry parameter"""
 
     def __init__(self, x, refrel, noOfAngles, diameter=False):
+        self.__angles = None
+        self.__phase_func = None
+        self.__angular_scatt_func = None
         self.diameter = diameter
         self.noOfAngles = noOfAngles
         self.sizeParameter = x
@@ -241,6 +244,52 @@ class bhmie_hagen():
         -> it is the same!! -> fixed"""
         self.qback = 4*(abs(self.s1[-1])/self.sizeParameter)**2
 
+    @property
+    def angles(self):
+        """Angle grid of the phase functions and the angular scattering functions in the interval [0,2*pi]"""
+        if type(self.__angles) == type(None):
+            self.__angles = np.linspace(0, np.pi * 2, 2 * self.s1.shape[0] - 1)
+        return self.__angles
+
+    @property
+    def perpendicular(self):
+        """Angular scattering function for perpendicular scattering geometry (numpy array, see angles)"""
+        return self._get_angular_scatt_func_values()[0]
+
+    @property
+    def parallel(self):
+        """Angular scattering function for parallel scattering geometry (numpy array, see angles)"""
+        return self._get_angular_scatt_func_values()[1]
+
+    @property
+    def natural(self):
+        """Angular scattering function for natural (unpolarized) light (numpy array, see angles)"""
+        return self._get_angular_scatt_func_values()[2]
+
+    def _get_phase_func_values(self):
+        """Phase functions as array of shape (3, len(angles)); rows are perpendicular, parallel, natural."""
+        if type(self.__phase_func) == type(None):
+            s2r = self.s2[::-1]
+            s2f = np.append(self.s2, s2r[1:])
+            s2s = np.abs(s2f) ** 2
+
+            s1r = self.s1[::-1]
+            s1f = np.append(self.s1, s1r[1:])
+            s1s = np.abs(s1f) ** 2
+
+            s12s = (s1s + s2s) / 2
+
+            self.__phase_func = np.array([s1s, s2s, s12s])
+            self.__phase_func *= 4 * np.pi / (np.pi * self.sizeParameter ** 2 * self.qsca)
+        return self.__phase_func
+
+    def _get_angular_scatt_func_values(self):
+        """Angular scattering functions as array of shape (3, len(angles)); rows are perpendicular, parallel,
+        natural."""
+        if type(self.__angular_scatt_func) == type(None):
+            self.__angular_scatt_func = self._get_phase_func_values() * (self.csca / (4 * np.pi))
+        return self.__angular_scatt_func
+
     def get_phase_func(self):
         """ Returns the phase functions in the interval [0,2*pi).
 
@@ -248,31 +297,15 @@ class bhmie_hagen():
         ----
         The phase phase function is normalized such that the integrale over the entire sphere is 4pi
         """
-        # out = self.get_angular_scatt_func() * 4 * np.pi/self.csca
-        s2r = self.s2[::-1]
-        s2f = np.append(self.s2, s2r[1:])
-        s2s = np.abs(s2f) ** 2
-        # ang = np.linspace(0, np.pi * 2, len(s2s))
-        # df = pd.DataFrame(s2s, index=ang, columns=['Phase_function_parallel'])
-        # df.index.name = 'Angle'
-
-        s1r = self.s1[::-1]
-        s1f = np.append(self.s1, s1r[1:])
-        s1s = np.abs(s1f) ** 2
-
-        s12s = (s1s + s2s) / 2
-
-
-        ang = np.linspace(0, np.pi * 2, len(s1s))
-        df = pd.DataFrame(np.array([s1s, s2s, s12s]).transpose(), index=ang,
-                          columns=['perpendicular', 'parallel', 'natural'])
+        df = pd.DataFrame(self._get_phase_func_values().transpose(), index=self.angles,
+                          columns=['perpendicular', 'parallel', 'natural'], copy=True)
         df.index.name = 'angle'
-        df *= 4 * np.pi / (np.pi * self.sizeParameter ** 2 * self.qsca)
         return df
 
     def get_angular_scatt_func(self):
         """
         Returns the angular scattering function for parallel scattering geometry in the interval [0,2*pi).
+        The same values are available as numpy arrays through the attributes natural, perpendicular, and parallel.
 
         Note
         ----
@@ -281,10 +314,9 @@ class bhmie_hagen():
         >>> theta = theta[theta < np.pi]
         >>> integrate.simps(natural * np.sin(theta) ,theta) * 2 * np.pi # this is equal to scattering crossection
         """
-
-        df = self.get_phase_func()
-        df *= self.csca / (4 * np.pi)
-
+        df = pd.DataFrame(self._get_angular_scatt_func_values().transpose(), index=self.angles,
+                          columns=['perpendicular', 'parallel', 'natural'], copy=True)
+        df.index.name = 'angle'
         return df
 
     # def get_phase_func_parallel(self):
@@ -345,6 +377,318 @@ class bhmie_hagen():
         return self.s1, self.s2, self.qext, self.qsca, self.qback, self.gsca
 
 
+class bhmie_hagen_batch():
+    """Vectorized version of bhmie_hagen. All particles are evaluated together, the recurrences run over the
+    number of terms needed by the largest particle and particles that need fewer terms are simply masked out.
+
+    Parameters
+    ----------
+    x: array-like
+        size parameters
+    refrel: complex or array-like
+        refractive index, either a scalar or one value per size parameter
+    noOfAngles: int
+        number of angles for S1 and S2 function in range from 0 to pi/2
+    diameter: array-like, optional
+        diameters, needed to calculate the crosssections
+    cache: mie_cache.MieCache instance, optional
+        If given, results are taken from (and added to) the cache. Note, the size parameters and refractive
+        indices are quantized in this case (see mie_cache).
+
+    Returns
+    -------
+    Same as bhmie_hagen, but each quantity is an array with one entry (row) per size parameter:
+    s1, s2 (shape = (len(x), 2 * noOfAngles - 1)), qext, qsca, qback, gsca, csca, cext"""
+
+    def __init__(self, x, refrel, noOfAngles, diameter=None, cache=None):
+        self.__angles = None
+        self.__phase_func = {}
+        self.__angular_scatt_func = {}
+        self.sizeParameter = np.atleast_1d(np.asarray(x, dtype=float))
+        self.indOfRefraction = np.broadcast_to(np.asarray(refrel, dtype=np.complex128), self.sizeParameter.shape)
+        if type(diameter) != type(None):
+            diameter = np.broadcast_to(np.asarray(diameter, dtype=float), self.sizeParameter.shape)
+        self.diameter = diameter
+
+        if (noOfAngles > 1000):
+            raise ValueError('noOfAngles > 1000 in bhmie_hagen_batch')
+
+        # Require NANG>1 in order to calculate scattering intensities
+        if (noOfAngles < 2):
+            noOfAngles = 2
+        self.noOfAngles = int(noOfAngles)
+
+        if cache:
+            self._get_from_cache(cache)
+        else:
+            self.calc_noOfTerms()
+            self._calculate()
+        self._calc_derived()
+
+    def _get_from_cache(self, cache):
+        (self.sizeParameter, self.indOfRefraction,
+         self.s1, self.s2, self.qsca, self.gsca) = cache.get(self.sizeParameter, self.indOfRefraction, self.noOfAngles)
+
+    def calc_noOfTerms(self):
+        """Same as bhmie_hagen.calc_noOfTerms, for all size parameters at once."""
+        ymod = np.abs(self.sizeParameter * self.indOfRefraction)
+        xstop = self.sizeParameter + 4. * self.sizeParameter ** 0.3333 + 2.0
+        nmx = np.fix(np.maximum(xstop, ymod) + 15.0)
+        self.noOfTermses = (xstop.astype(int), nmx.astype(int))
+
+        nmxx = 150000
+        if (nmx > nmxx).any():
+            raise ValueError("error: nmx > nmxx=%f for |m|x=%f" % (nmxx, ymod[nmx > nmxx].max()))
+
+    def get_logDeriv(self):
+        """ Logarithmic derivative D(J) calculated by downward recurrence
+            beginning with initial value (0.,0.) at J=NMX. Rows of particles that need fewer terms are kept at zero
+            until their own starting point is reached."""
+        y = self.sizeParameter * self.indOfRefraction
+        nmx = self.noOfTermses[1]
+        d = np.zeros((y.shape[0], nmx.max()), dtype=np.complex128)
+        for k in range(nmx.max() - 2, -1, -1):
+            en = k + 2.
+            active = k <= nmx - 2
+            d[active, k] = (en / y[active]) - (1. / (d[active, k + 1] + en / y[active]))
+        return d
+
+    def _calculate(self):
+        nang = self.noOfAngles
+        nstop = self.noOfTermses[0]
+        noOfParticles = self.sizeParameter.shape[0]
+
+        dang = .5 * np.pi / (nang - 1)
+        amu = np.cos(np.arange(0.0, nang, 1) * dang)
+
+        logDeriv = self.get_logDeriv()
+
+        # sort the particles by the number of terms needed, so that at each step of the recurrence the particles
+        # still in need of terms are a leading slice of the arrays
+        order = np.argsort(-nstop, kind='stable')
+        x = self.sizeParameter[order]
+        m = self.indOfRefraction[order]
+        logDeriv = logDeriv[order]
+        nstop_sorted = nstop[order]
+
+        s1_1 = np.zeros((noOfParticles, nang), dtype=np.complex128)
+        s1_2 = np.zeros((noOfParticles, nang), dtype=np.complex128)
+        s2_1 = np.zeros((noOfParticles, nang), dtype=np.complex128)
+        s2_2 = np.zeros((noOfParticles, nang), dtype=np.complex128)
+        qsca = np.zeros(noOfParticles)
+        gsca = np.zeros(noOfParticles)
+
+        pi0 = np.zeros((noOfParticles, nang), dtype=np.complex128)
+        pi1 = np.ones((noOfParticles, nang), dtype=np.complex128)
+
+        psi0 = np.cos(x)
+        psi1 = np.sin(x)
+        chi0 = -np.sin(x)
+        chi1 = np.cos(x)
+        xi1 = psi1 - chi1 * 1j
+        p = -1
+
+        for n in range(0, nstop.max()):
+            en = n + 1.0
+            fn = (2. * en + 1.) / (en * (en + 1.))
+
+            # drop the particles which are done
+            a = np.count_nonzero(nstop_sorted > n)
+            x = x[:a]
+            m = m[:a]
+            psi0, psi1, chi0, chi1, xi1 = psi0[:a], psi1[:a], chi0[:a], chi1[:a], xi1[:a]
+            pi0, pi1 = pi0[:a], pi1[:a]
+            dn = logDeriv[:a, n]
+
+            psi = (2. * en - 1.) * psi1 / x - psi0
+            chi = (2. * en - 1.) * chi1 / x - chi0
+            xi = psi - chi * 1j
+
+            if (n > 0):
+                an1 = an[:a]
+                bn1 = bn[:a]
+
+            an = (dn / m + en / x) * psi - psi1
+            an /= ((dn / m + en / x) * xi - xi1)
+            bn = (m * dn + en / x) * psi - psi1
+            bn /= ((m * dn + en / x) * xi - xi1)
+
+            qsca[:a] += (2. * en + 1.) * (abs(an) ** 2 + abs(bn) ** 2)
+            gsca[:a] += ((2. * en + 1.) / (en * (en + 1.))) * (np.real(an) * np.real(bn) + np.imag(an) * np.imag(bn))
+
+            if (n > 0):
+                gsca[:a] += ((en - 1.) * (en + 1.) / en) * (np.real(an1) * np.real(an) + np.imag(an1) * np.imag(an) + np.real(bn1) * np.real(bn) + np.imag(bn1) * np.imag(bn))
+
+            pi = 0 + pi1
+            tau = en * amu * pi - (en + 1.) * pi0
+            an_c = an[:, np.newaxis]
+            bn_c = bn[:, np.newaxis]
+            s1_1[:a] += fn * (an_c * pi + bn_c * tau)
+            s2_1[:a] += fn * (an_c * tau + bn_c * pi)
+
+            p = -p
+            s1_2[:a] += fn * p * (an_c * pi - bn_c * tau)
+            s2_2[:a] += fn * p * (bn_c * pi - an_c * tau)
+
+            psi0 = psi1
+            psi1 = psi
+            chi0 = chi1
+            chi1 = chi
+            xi1 = psi1 - chi1 * 1j
+
+            pi1 = ((2. * en + 1.) * amu * pi - (en + 1.) * pi0) / en
+            pi0 = 0 + pi
+
+        # undo the sorting and reverse the order of the elements of the second part of s1 and s2
+        unsort = np.argsort(order)
+        s1 = np.zeros((noOfParticles, 2 * nang - 1), dtype=np.complex128)
+        s2 = np.zeros((noOfParticles, 2 * nang - 1), dtype=np.complex128)
+        s1[:, :nang] = s1_1[unsort]
+        s1[:, nang:] = s1_2[unsort, -2::-1]
+        s2[:, :nang] = s2_1[unsort]
+        s2[:, nang:] = s2_2[unsort, -2::-1]
+        qsca = qsca[unsort]
+        gsca = gsca[unsort]
+
+        self.s1 = s1
+        self.s2 = s2
+        self.gsca = 2. * gsca / qsca
+        self.qsca = (2. / (self.sizeParameter ** 2)) * qsca
+
+    def _calc_derived(self):
+        """extinction and backscattering efficiency and the crosssections"""
+        self.qext = (4. / (self.sizeParameter ** 2)) * np.real(self.s1[:, 0])
+        self.qback = 4 * (abs(self.s1[:, -1]) / self.sizeParameter) ** 2
+        if type(self.diameter) != type(None):
+            self.csca = self.qsca * self.diameter ** 2 * np.pi * 0.5 ** 2
+            self.cext = self.qext * self.diameter ** 2 * np.pi * 0.5 ** 2
+        else:
+            self.csca = np.zeros(self.sizeParameter.shape)
+            self.cext = np.zeros(self.sizeParameter.shape)
+
+    @property
+    def angles(self):
+        """Angle grid of the phase functions and the angular scattering functions in the interval [0,2*pi]"""
+        if type(self.__angles) == type(None):
+            self.__angles = np.linspace(0, np.pi * 2, 2 * self.s1.shape[1] - 1)
+        return self.__angles
+
+    @property
+    def perpendicular(self):
+        """Angular scattering function for perpendicular scattering geometry, one row per particle (see angles).
+        The array is cached, do not change it in place."""
+        return self._get_angular_scatt_func_values('perpendicular')
+
+    @property
+    def parallel(self):
+        """Angular scattering function for parallel scattering geometry, one row per particle (see angles).
+        The array is cached, do not change it in place."""
+        return self._get_angular_scatt_func_values('parallel')
+
+    @property
+    def natural(self):
+        """Angular scattering function for natural (unpolarized) light, one row per particle (see angles).
+        The array is cached, do not change it in place."""
+        return self._get_angular_scatt_func_values('natural')
+
+    def get_angles(self):
+        """Angle grid of the phase functions in the interval [0,2*pi)"""
+        return self.angles.copy()
+
+    def _get_phase_func_values(self, polarization):
+        if polarization not in self.__phase_func:
+            if polarization == 'natural':
+                s1s = np.abs(np.append(self.s1, self.s1[:, -2::-1], axis=1)) ** 2
+                s2s = np.abs(np.append(self.s2, self.s2[:, -2::-1], axis=1)) ** 2
+                out = (s1s + s2s) / 2
+            elif polarization == 'perpendicular':
+                out = np.abs(np.append(self.s1, self.s1[:, -2::-1], axis=1)) ** 2
+            elif polarization == 'parallel':
+                out = np.abs(np.append(self.s2, self.s2[:, -2::-1], axis=1)) ** 2
+            else:
+                txt = 'polarization has to be one of "natural", "perpendicular", or "parallel"; not %s' % polarization
+                raise ValueError(txt)
+
+            out *= (4 * np.pi / (np.pi * self.sizeParameter ** 2 * self.qsca))[:, np.newaxis]
+            self.__phase_func[polarization] = out
+        return self.__phase_func[polarization]
+
+    def _get_angular_scatt_func_values(self, polarization):
+        if polarization not in self.__angular_scatt_func:
+            out = self._get_phase_func_values(polarization) * (self.csca / (4 * np.pi))[:, np.newaxis]
+            self.__angular_scatt_func[polarization] = out
+        return self.__angular_scatt_func[polarization]
+
+    def get_phase_func(self, polarization='natural'):
+        """ Returns the phase functions in the interval [0,2*pi), one row per particle. See get_angles for the
+        corresponding angles.
+
+        Parameters
+        ----------
+        polarization: str ['natural', 'perpendicular', 'parallel']
+
+        Note
+        ----
+        The phase phase function is normalized such that the integrale over the entire sphere is 4pi
+        """
+        return self._get_phase_func_values(polarization).copy()
+
+    def get_angular_scatt_func(self, polarization='natural'):
+        """
+        Returns the angular scattering function in the interval [0,2*pi), one row per particle. See get_angles
+        for the corresponding angles. Without the copy the same values are available through the attributes
+        natural, perpendicular, and parallel.
+
+        Note
+        ----
+        The integral of 'natural' over the entire sqhere is equal to the scattering crossection.
+        """
+        return self._get_angular_scatt_func_values(polarization).copy()
+
+    def return_Values_as_dict(self):
+        return {'extinction_efficiency': self.qext,
+                'scattering_efficiency': self.qsca,
+                'backscatter_efficiency': self.qback,
+                'asymmetry_parameter': self.gsca,
+                'scattering_crosssection': self.csca,
+                'extinction_crosssection': self.cext}
+
+    def return_Values(self):
+        return self.s1, self.s2, self.qext, self.qsca, self.qback, self.gsca
+
+
+def stack_angular_scatt_func(mie_objects, polarization='natural'):
+    """Stacks the angular scattering functions of many Mie calculations into a single array. Pandas objects are
+    not created, which makes this the cheap way to collect the results of many particles.
+
+    Parameters
+    ----------
+    mie_objects: list of bhmie_hagen and/or bhmie_hagen_batch instances
+        All calculations need the same number of angles.
+    polarization: str ['natural', 'perpendicular', 'parallel']
+
+    Returns
+    -------
+    angles: numpy array
+    angular_scatt_func: numpy array of shape (number of particles, len(angles))
+    """
+    if polarization not in ['natural', 'perpendicular', 'parallel']:
+        txt = 'polarization has to be one of "natural", "perpendicular", or "parallel"; not %s' % polarization
+        raise ValueError(txt)
+    mie_objects = list(mie_objects)
+    if len(mie_objects) == 0:
+        raise ValueError('No Mie calculations given.')
+
+    angles = mie_objects[0].angles
+    for mie in mie_objects[1:]:
+        if mie.angles.shape != angles.shape:
+            txt = 'All Mie calculations need the same number of angles.'
+            raise ValueError(txt)
+
+    out = np.concatenate([np.atleast_2d(getattr(mie, polarization)) for mie in mie_objects], axis=0)
+    return angles.copy(), out
+
+
 def bhmie(x,refrel,nang):
     """ This file is converted from mie_scattering.m, see http://atol.ucsd.edu/scatlib/index.htm
          Bohren and Huffman originally published the code in their book on light scattering
@@ -365,12 +709,12 @@ def bhmie(x,refrel,nang):
 
     nmxx=150000
 
-    s1_1=zeros(nang,dtype=complex128)
-    s1_2=zeros(nang,dtype=complex128)
-    s2_1=zeros(nang,dtype=complex128)
-    s2_2=zeros(nang,dtype=complex128)
-    pi=zeros(nang,dtype=complex128)
-    tau=zeros(nang,dtype=complex128)
+    s1_1=np.zeros(nang,dtype=np.complex128)
+    s1_2=np.zeros(nang,dtype=np.complex128)
+    s2_1=np.zeros(nang,dtype=np.complex128)
+    s2_2=np.zeros(nang,dtype=np.complex128)
+    pi=np.zeros(nang,dtype=np.complex128)
+    tau=np.zeros(nang,dtype=np.complex128)
 
     if (nang > 1000):
         print('error: nang > mxnang=1000 in bhmie')
@@ -380,7 +724,7 @@ def bhmie(x,refrel,nang):
     if (nang < 2):
         nang = 2
 
-    pii = 4.*arctan(1.)
+    pii = 4.*np.arctan(1.)
     dx = x
 
     drefrl = refrel
@@ -394,7 +738,7 @@ def bhmie(x,refrel,nang):
     xstop = x + 4.*x**0.3333 + 2.0
     #xstop = x + 4.*x**0.3333 + 10.0
     nmx = max(xstop,ymod) + 15.0
-    nmx=fix(nmx)
+    nmx=np.fix(nmx)
 
     # BTD experiment 91/1/15: add one more term to series and compare resu<s
     #      NMX=AMAX1(XSTOP,YMOD)+16
@@ -412,17 +756,17 @@ def bhmie(x,refrel,nang):
     dang = .5*pii/ (nang-1)
 
 
-    amu=arange(0.0,nang,1)
-    amu=cos(amu*dang)
+    amu=np.arange(0.0,nang,1)
+    amu=np.cos(amu*dang)
 
-    pi0=zeros(nang,dtype=complex128)
-    pi1=ones(nang,dtype=complex128)
+    pi0=np.zeros(nang,dtype=np.complex128)
+    pi1=np.ones(nang,dtype=np.complex128)
 
     # Logarithmic derivative D(J) calculated by downward recurrence
     # beginning with initial value (0.,0.) at J=NMX
 
     nn = int(nmx)-1
-    d=zeros(nn+1,dtype=complex128)
+    d=np.zeros(nn+1,dtype=np.complex128)
     for n in range(0,nn):
         en = nmx - n
         d[nn-n-1] = (en/y) - (1./ (d[nn-n]+en/y))
@@ -430,10 +774,10 @@ def bhmie(x,refrel,nang):
     #*** Riccati-Bessel functions with real argument X
     #    calculated by upward recurrence
 
-    psi0 = cos(dx)
-    psi1 = sin(dx)
-    chi0 = -sin(dx)
-    chi1 = cos(dx)
+    psi0 = np.cos(dx)
+    psi1 = np.sin(dx)
+    chi0 = -np.sin(dx)
+    chi1 = np.cos(dx)
     xi1 = psi1-chi1*1j
     qsca = 0.
     gsca = 0.
@@ -465,10 +809,10 @@ def bhmie(x,refrel,nang):
 
     #*** Augment sums for Qsca and g=<cos(theta)>
         qsca += (2.*en+1.)* (abs(an)**2+abs(bn)**2)
-        gsca += ((2.*en+1.)/ (en* (en+1.)))*( real(an)* real(bn)+imag(an)*imag(bn))
+        gsca += ((2.*en+1.)/ (en* (en+1.)))*( np.real(an)* np.real(bn)+np.imag(an)*np.imag(bn))
 
         if (n > 0):
-            gsca += ((en-1.)* (en+1.)/en)*( real(an1)* real(an)+imag(an1)*imag(an)+real(bn1)* real(bn)+imag(bn1)*imag(bn))
+            gsca += ((en-1.)* (en+1.)/en)*( np.real(an1)* np.real(an)+np.imag(an1)*np.imag(an)+np.real(bn1)* np.real(bn)+np.imag(bn1)*np.imag(bn))
 
 
     #*** Now calculate scattering intensity pattern
@@ -503,11 +847,11 @@ def bhmie(x,refrel,nang):
     #    Now compute QSCA,QEXT,QBACK,and GSCA
 
     #   we have to reverse the order of the elements of the second part of s1 and s2
-    s1=concatenate((s1_1,s1_2[-2::-1]))
-    s2=concatenate((s2_1,s2_2[-2::-1]))
+    s1=np.concatenate((s1_1,s1_2[-2::-1]))
+    s2=np.concatenate((s2_1,s2_2[-2::-1]))
     gsca = 2.*gsca/qsca
     qsca = (2./ (dx*dx))*qsca
-    qext = (4./ (dx*dx))* real(s1[0])
+    qext = (4./ (dx*dx))* np.real(s1[0])
 
     # more common definition of the backscattering efficiency,
     # so that the backscattering cross section really
@@ -0,0 +1,396 @@
+"""Cache for Mie results.
+
+Results are stored per particle and are keyed on the quantized size parameter, the quantized real and imaginary part
+of the refractive index, and the number of angles. Coated particles are keyed on the quantized size parameters and
+refractive indices of core and shell. The cache has two levels: a least-recently-used cache in memory
+and an optional store on disk, which is memory mapped and can be shared by several processes (appending to the
+store is protected by a lock file, flock on posix and msvcrt.locking on windows).
+
+The cache is off by default. Once it is switched on with enable(), size_dist2optical_properties (homogeneous and
+coated particles) and POPS.mie.makeMie_diameter will use it.
+
+Note
+----
+Mie calculations are performed at the quantized values, not the values asked for. This way a result does not
+depend on whether it came from the cache or not. The default quantization (7 significant digits in x, 3 decimals in
+n) keeps the introduced error small compared to the uncertainty of typical refractive indices.
+
+Examples
+--------
+>>> from atmPy.radiation.mie_scattering import mie_cache
+>>> cache = mie_cache.enable('/path/to/cache_folder')
+>>> ... # do optical property calculations
+>>> cache.info
+"""
+import os as _os
+from collections import OrderedDict as _OrderedDict
+
+import numpy as _np
+
+try:
+    import fcntl as _fcntl
+except ImportError:  # windows
+    _fcntl = None
+try:
+    import msvcrt as _msvcrt
+except ImportError:  # posix
+    _msvcrt = None
+
+from atmPy.radiation.mie_scattering import bhmie as _bhmie
+from atmPy.radiation.mie_scattering import mie_coated as _mie_coated
+
+_default_cache = None
+
+# quantized size parameter and refractive index of a particle
+_key_dtype = _np.dtype([('x', 'f8'), ('n_real', 'f8'), ('n_imag', 'f8')])
+# quantized size parameters and refractive indices of core and shell of a coated particle
+_coated_key_dtype = _np.dtype([('x', 'f8'), ('y', 'f8'), ('core_real', 'f8'), ('core_imag', 'f8'),
+                               ('shell_real', 'f8'), ('shell_imag', 'f8')])
+
+
+def enable(path=None, **kwargs):
+    """Switches on the default Mie cache, which is used by size_dist2optical_properties and
+    POPS.mie.makeMie_diameter.
+
+    Parameters
+    ----------
+    path: str, optional
+        Folder of the on-disk store. If None only the in-memory cache is used.
+    kwargs: passed to MieCache
+
+    Returns
+    -------
+    MieCache instance
+    """
+    global _default_cache
+    _default_cache = MieCache(path=path, **kwargs)
+    return _default_cache
+
+
+def disable():
+    """Switches off the default Mie cache"""
+    global _default_cache
+    _default_cache = None
+
+
+def get_default_cache():
+    """Returns the default Mie cache, None if the cache is not enabled"""
+    return _default_cache
+
+
+class MieCache(object):
+    """Two level (memory/disk) cache of Mie results.
+
+    Parameters
+    ----------
+    path: str, optional
+        Folder of the on-disk store. There is one file per number of angles (and one for coated particles). If None, only the in-memory
+        cache is used. The store needs a file lock (fcntl or msvcrt), a ValueError is raised on platforms
+        without either.
+    maxsize: int
+        Maximum number of particles kept in the in-memory cache.
+    x_digits: int
+        Number of significant digits to which the size parameter is quantized.
+    n_decimals: int
+        Number of decimals to which the real and imaginary part of the refractive index are quantized.
+    """
+    def __init__(self, path=None, maxsize=100000, x_digits=7, n_decimals=3):
+        self.path = path
+        self.maxsize = maxsize
+        self.x_digits = x_digits
+        self.n_decimals = n_decimals
+
+        self._memory = _OrderedDict()
+        self._disk = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            if not (_fcntl or _msvcrt):
+                txt = 'The on-disk store needs a file lock (fcntl or msvcrt), which is not available here.'
+                raise ValueError(txt)
+            if not _os.path.isdir(path):
+                _os.makedirs(path)
+
+    @property
+    def info(self):
+        """Hit and miss counters (distinct particles of each call) and the current size of the in-memory cache"""
+        return {'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'size': len(self._memory),
+                'maxsize': self.maxsize}
+
+    def clear(self, disk=False):
+        """Empties the in-memory cache and resets the counters.
+
+        Parameters
+        ----------
+        disk: bool
+            If True the files of the on-disk store are removed too.
+        """
+        self._memory.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk and self.path:
+            for store in self._disk.values():
+                store['memmap'] = None
+            self._disk = {}
+            for fname in _os.listdir(self.path):
+                if fname.startswith(('mie_nang', 'mie_coated_nang')) and fname.endswith(('.dat', '.dat.lock')):
+                    _os.remove(_os.path.join(self.path, fname))
+
+    def quantize(self, x, n):
+        """Returns the quantized size parameters and refractive indices"""
+        x = _np.atleast_1d(_np.asarray(x, dtype=float))
+        n = _np.broadcast_to(_np.asarray(n, dtype=_np.complex128), x.shape)
+        return self._quantize_x(x), self._quantize_n(n)
+
+    def quantize_coated(self, x, y, m_core, m_shell):
+        """Returns the quantized size parameters and refractive indices of core and shell"""
+        y = _np.atleast_1d(_np.asarray(y, dtype=float))
+        x = _np.broadcast_to(_np.asarray(x, dtype=float), y.shape)
+        m_core = _np.broadcast_to(_np.asarray(m_core, dtype=_np.complex128), y.shape)
+        m_shell = _np.broadcast_to(_np.asarray(m_shell, dtype=_np.complex128), y.shape)
+        return self._quantize_x(x), self._quantize_x(y), self._quantize_n(m_core), self._quantize_n(m_shell)
+
+    def _quantize_x(self, x):
+        # a size parameter of 0 (e.g. no core) stays 0
+        with _np.errstate(divide='ignore'):
+            exponent = 10. ** (_np.floor(_np.log10(_np.where(x > 0, x, 1.))) - (self.x_digits - 1))
+        return _np.round(x / exponent) * exponent
+
+    def _quantize_n(self, n):
+        # + 0. turns -0. into 0., so the keys are unique
+        return (_np.round(n.real, self.n_decimals) + 0.) + 1j * (_np.round(n.imag, self.n_decimals) + 0.)
+
+    def get(self, x, n, noOfAngles):
+        """Returns the Mie results for the quantized size parameters and refractive indices. Results that are
+        neither in memory nor on disk are calculated in a single batch.
+
+        Parameters
+        ----------
+        x: array-like
+            size parameters
+        n: complex or array-like
+            refractive index
+        noOfAngles: int
+            see bhmie_hagen
+
+        Returns
+        -------
+        xq, nq, s1, s2, qsca, gsca
+        """
+        xq, nq = self.quantize(x, n)
+        keys = _np.zeros(xq.shape[0], dtype=_key_dtype)
+        keys['x'], keys['n_real'], keys['n_imag'] = xq, nq.real, nq.imag
+
+        def calculate(keys):
+            return _bhmie.bhmie_hagen_batch(keys['x'], keys['n_real'] + 1j * keys['n_imag'], noOfAngles)
+
+        return (xq, nq) + self._get(keys, int(noOfAngles), 'mie_nang', calculate)
+
+    def get_coated(self, x, y, m_core, m_shell, noOfAngles):
+        """Same as get for coated particles (see mie_coated.MieCoatedBatch).
+
+        Parameters
+        ----------
+        x: array-like
+            size parameters of the cores
+        y: array-like
+            size parameters of the shells
+        m_core: complex or array-like
+            refractive index of the core
+        m_shell: complex or array-like
+            refractive index of the shell
+        noOfAngles: int
+            see bhmie_hagen
+
+        Returns
+        -------
+        xq, yq, m_core_q, m_shell_q, s1, s2, qsca, gsca
+        """
+        xq, yq, m_core_q, m_shell_q = self.quantize_coated(x, y, m_core, m_shell)
+        keys = _np.zeros(yq.shape[0], dtype=_coated_key_dtype)
+        keys['x'], keys['y'] = xq, yq
+        keys['core_real'], keys['core_imag'] = m_core_q.real, m_core_q.imag
+        keys['shell_real'], keys['shell_imag'] = m_shell_q.real, m_shell_q.imag
+
+        def calculate(keys):
+            return _mie_coated.MieCoatedBatch(keys['x'], keys['y'], keys['core_real'] + 1j * keys['core_imag'],
+                                              keys['shell_real'] + 1j * keys['shell_imag'], noOfAngles)
+
+        return (xq, yq, m_core_q, m_shell_q) + self._get(keys, int(noOfAngles), 'mie_coated_nang', calculate)
+
+    def _get(self, keys, noOfAngles, kind, calculate):
+        """Looks up the keys in memory and on disk and calculates the missing ones.
+
+        Parameters
+        ----------
+        keys: structured array (_key_dtype or _coated_key_dtype)
+        noOfAngles: int
+        kind: str
+            prefix of the files of the on-disk store
+        calculate: function
+            returns the Mie results (with attributes s1, s2, qsca, gsca) of the keys passed to it
+
+        Returns
+        -------
+        s1, s2, qsca, gsca
+        """
+        # the same particle may be asked for several times in a single call
+        keys, first, inverse = _np.unique(keys, return_index=True, return_inverse=True)
+        no_keys = keys.shape[0]
+
+        s1 = _np.zeros((no_keys, 2 * noOfAngles - 1), dtype=_np.complex128)
+        s2 = _np.zeros((no_keys, 2 * noOfAngles - 1), dtype=_np.complex128)
+        qsca = _np.zeros(no_keys)
+        gsca = _np.zeros(no_keys)
+
+        # in-memory cache, the keys of homogeneous and coated particles differ in length
+        key_tuples = [key + (noOfAngles,) for key in keys.tolist()]
+        found = _np.zeros(no_keys, dtype=bool)
+        for e, key in enumerate(key_tuples):
+            res = self._memory.get(key)
+            if res is not None:
+                self._memory.move_to_end(key)
+                s1[e], s2[e], qsca[e], gsca[e] = res
+                found[e] = True
+        self.hits += int(found.sum())
+
+        # disk store
+        missing = _np.nonzero(~found)[0]
+        if missing.shape[0] and self.path:
+            on_disk, res = self._read_disk(kind, noOfAngles, keys[missing])
+            rows = missing[on_disk]
+            s1[rows], s2[rows], qsca[rows], gsca[rows] = res
+            for e in rows:
+                self._store_memory(key_tuples[e], (s1[e].copy(), s2[e].copy(), qsca[e], gsca[e]))
+            self.disk_hits += rows.shape[0]
+            missing = missing[~on_disk]
+
+        # calculation
+        if missing.shape[0]:
+            self.misses += missing.shape[0]
+            mie = calculate(keys[missing])
+            s1[missing], s2[missing], qsca[missing], gsca[missing] = mie.s1, mie.s2, mie.qsca, mie.gsca
+            for i, e in enumerate(missing):
+                self._store_memory(key_tuples[e], (mie.s1[i].copy(), mie.s2[i].copy(), mie.qsca[i], mie.gsca[i]))
+            self._write_disk(kind, noOfAngles, keys[missing], mie)
+
+        return s1[inverse], s2[inverse], qsca[inverse], gsca[inverse]
+
+    def _store_memory(self, key, res):
+        self._memory[key] = res
+        if len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    ##############
+    # disk store
+    def _get_dtype(self, key_dtype, noOfAngles):
+        return _np.dtype([('key', 'f8', (len(key_dtype.names),)),
+                          ('values', 'f8', (2,)),
+                          ('s1', 'c16', (2 * noOfAngles - 1,)),
+                          ('s2', 'c16', (2 * noOfAngles - 1,))])
+
+    def _get_store(self, kind, noOfAngles, key_dtype):
+        store = self._disk.get((kind, noOfAngles))
+        if store is None:
+            fname = _os.path.join(self.path, '%s%i.dat' % (kind, noOfAngles))
+            store = {'fname': fname, 'dtype': self._get_dtype(key_dtype, noOfAngles), 'memmap': None,
+                     'keys': _np.zeros(0, dtype=key_dtype), 'rows': _np.zeros(0, dtype=int), 'size': 0}
+            self._disk[(kind, noOfAngles)] = store
+        return store
+
+    def _refresh(self, store):
+        """Maps records that were appended (possibly by another process) since the last refresh and updates the
+        sorted index of the keys"""
+        if not _os.path.isfile(store['fname']):
+            return
+        size = _os.path.getsize(store['fname'])
+        noOfRecords = size // store['dtype'].itemsize
+        if noOfRecords == store['size']:
+            return
+        store['memmap'] = _np.memmap(store['fname'], dtype=store['dtype'], mode='r', shape=(noOfRecords,))
+        raw = store['memmap']['key']
+        keys = _np.zeros(noOfRecords, dtype=store['keys'].dtype)
+        for e, name in enumerate(keys.dtype.names):
+            keys[name] = raw[:, e]
+        # if several processes stored the same particle, the first record is used
+        store['keys'], store['rows'] = _np.unique(keys, return_index=True)
+        store['size'] = noOfRecords
+
+    def _read_disk(self, kind, noOfAngles, keys):
+        """Looks up the (sorted, unique) keys in the disk store, which is refreshed first.
+
+        Returns
+        -------
+        bool array (True if a key is on disk) and the tuple s1, s2, qsca, gsca of the keys on disk"""
+        store = self._get_store(kind, noOfAngles, keys.dtype)
+        self._refresh(store)
+        pos = _np.searchsorted(store['keys'], keys)
+        pos = _np.minimum(pos, store['keys'].shape[0] - 1)
+        if store['keys'].shape[0]:
+            on_disk = store['keys'][pos] == keys
+        else:
+            on_disk = _np.zeros(keys.shape[0], dtype=bool)
+        if not on_disk.any():
+            return on_disk, (None, None, None, None)
+        records = store['memmap'][store['rows'][pos[on_disk]]]
+        return on_disk, (records['s1'], records['s2'], records['values'][:, 0], records['values'][:, 1])
+
+    def _write_disk(self, kind, noOfAngles, keys, mie):
+        if not self.path:
+            return
+        store = self._get_store(kind, noOfAngles, keys.dtype)
+        records = _np.zeros(keys.shape[0], dtype=store['dtype'])
+        for e, name in enumerate(keys.dtype.names):
+            records['key'][:, e] = keys[name]
+        records['values'][:, 0] = mie.qsca
+        records['values'][:, 1] = mie.gsca
+        records['s1'] = mie.s1
+        records['s2'] = mie.s2
+        with _FileLock(store['fname'] + '.lock'):
+            with open(store['fname'], 'ab') as fout:
+                # in case another process wrote an incomplete record, make sure we start at a record boundary
+                fout.seek(0, _os.SEEK_END)
+                size = fout.tell()
+                if size % store['dtype'].itemsize:
+                    fout.truncate(size - size % store['dtype'].itemsize)
+                fout.write(records.tobytes())
+                fout.flush()
+
+
+class _FileLock(object):
+    """Exclusive lock of a lock file (flock on posix, msvcrt.locking on windows), used as context manager"""
+    def __init__(self, fname):
+        self.fname = fname
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.fname, 'a+b')
+        if _fcntl:
+            _fcntl.flock(self._file, _fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after 10 attempts (1 s apart)
+                    _msvcrt.locking(self._file.fileno(), _msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+        return self
+
+    def __exit__(self, *args):
+        try:
+            if _fcntl:
+                _fcntl.flock(self._file, _fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                _msvcrt.locking(self._file.fileno(), _msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
@@ -19,11 +19,15 @@ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-from atmPy.mie.mie_coeffs import MieCoeffs
-from atmPy.mie.mie_props import mie_props, mie_S12
+import numpy as np
 from numpy import sqrt
 
-from atmPy.radiation.mie_scattering import Cache
+from atmPy.radiation.mie_scattering import bhmie as _bhmie
+from atmPy.radiation.mie_scattering import mie_coeffs as _mie_coeffs
+from atmPy.radiation.mie_scattering import mie_props as _mie_props
+from atmPy.radiation.mie_scattering.mie_aux import Cache
+from atmPy.radiation.mie_scattering.mie_coeffs import MieCoeffs
+from atmPy.radiation.mie_scattering.mie_props import mie_props, mie_S12
 
 
 class MieScatterProps(object):
@@ -31,14 +35,16 @@ class MieScatterProps(object):
     """
     def __init__(self, params):
         par = dict(zip(("eps","mu","x","y","eps2"),params[:5]))
+        self._props = None
+        self._S12 = None
         if par["x"]==0 and par["y"] is None:
             #give valid output for x==0
-            self._coeffs = {"qext":0.0, "qsca":0.0, "qabs":0.0, "qb":0.0,
-                            "0.0":asy, "0.0":qratio}
+            self._coeffs = None
+            self._props = {"qext":0.0, "qsca":0.0, "qabs":0.0, "qb":0.0,
+                           "asy":0.0, "qratio":0.0}
+            self._S12 = (0j, 0j)
         else:
             self._coeffs = MieCoeffs(par)
-        self._props = None
-        self._S12 = None
         self.size = par["x"] if par["y"]==None else par["y"]
 
     def prop(self, prop_name):
@@ -74,12 +80,15 @@ class Mie(object):
 
     Setting mu together with eps2 and y raises an error.
 
+    cache_size: Maximum number of parameter sets for which the results are kept (least recently used are
+        dropped first).
+
     Any of the above attributes can be given as keyword arguments when
     creating a new Mie instance. For example:
     mie_scattering = Mie(x=1.5,m=complex(1.2,0.1))
     """
-    def __init__(self, **kwargs):
-        self._cache = Cache()
+    def __init__(self, cache_size=100, **kwargs):
+        self._cache = Cache(size=cache_size)
         self.eps = None
         self.mu = 1.0
         self._x = None
@@ -190,7 +199,7 @@ class Mie(object):
 
 
     def _get_m2(self):
-        return sqrt(self.m2)
+        return sqrt(self.eps2)
 
     def _set_m2(self, m2):
         self.eps2 = m2**2
@@ -220,3 +229,52 @@ class Mie(object):
             raise ValueError("The size y cannot be smaller than x.")
 
     y = property(_get_y, _set_y)
+
+
+class MieCoatedBatch(_bhmie.bhmie_hagen_batch):
+    """Mie calculations of many coated spheres at once (e.g. black carbon cores with a shell of non-absorbing
+    material). The results have the same form as the ones of bhmie_hagen_batch, all angular quantities refer to
+    the shell.
+
+    Parameters
+    ----------
+    x: array-like
+        size parameters of the cores
+    y: array-like
+        size parameters of the shells (y >= x)
+    m_core: complex or array-like
+        refractive index of the core
+    m_shell: complex or array-like
+        refractive index of the shell
+    noOfAngles: int
+        number of angles for S1 and S2 function in range from 0 to pi/2
+    diameter: array-like, optional
+        diameters of the shells, needed to calculate the crosssections
+    cache: mie_cache.MieCache instance, optional
+        If given, results are taken from (and added to) the cache. Note, the size parameters and refractive
+        indices are quantized in this case (see mie_cache).
+    """
+    def __init__(self, x, y, m_core, m_shell, noOfAngles, diameter=None, cache=None):
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        self.coreSizeParameter = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+        self.indOfRefractionCore = np.broadcast_to(np.asarray(m_core, dtype=np.complex128), y.shape)
+        super(MieCoatedBatch, self).__init__(y, m_shell, noOfAngles, diameter=diameter, cache=cache)
+
+    def _get_from_cache(self, cache):
+        (self.coreSizeParameter, self.sizeParameter, self.indOfRefractionCore, self.indOfRefraction,
+         self.s1, self.s2, self.qsca, self.gsca) = cache.get_coated(self.coreSizeParameter, self.sizeParameter,
+                                                                    self.indOfRefractionCore, self.indOfRefraction,
+                                                                    self.noOfAngles)
+
+    def calc_noOfTerms(self):
+        """The number of terms are determined in mie_coeffs.mie_coeffs_batch"""
+        return
+
+    def _calculate(self):
+        an, bn, nmax = _mie_coeffs.mie_coeffs_batch(self.indOfRefractionCore, self.indOfRefraction,
+                                                    self.coreSizeParameter, self.sizeParameter)
+        angles = np.linspace(0, np.pi, 2 * self.noOfAngles - 1)
+        self.s1, self.s2 = _mie_props.mie_S12_batch(an, bn, np.cos(angles))
+        props = _mie_props.mie_props_batch(an, bn, self.sizeParameter)
+        self.qsca = props['qsca']
+        self.gsca = props['asy']
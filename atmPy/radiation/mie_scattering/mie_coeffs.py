@@ -19,6 +19,7 @@ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
+import numpy as np
 from numpy import pi, arange, zeros, hstack, sqrt, sin, cos
 from scipy.special import jv, yv
 
@@ -98,7 +99,7 @@ def single_mie_coeff(eps,mu,x):
     gs1x = p1x-complex(0,1)*ch1x
 
     dnx = zeros(nmx,dtype=complex)
-    for j in xrange(nmx-1,0,-1):
+    for j in range(nmx-1,0,-1):
         r = (j+1.0)/z
         dnx[j-1] = r - 1.0/(dnx[j]+r)
     dn = dnx[:nmax]
@@ -144,7 +145,7 @@ def coated_mie_coeff(eps1,eps2,x,y):
     dnx = zeros(nmx,dtype=complex)
 
     for (z, dn) in zip((u,v,w),(dnu,dnv,dnw)):
-        for j in xrange(nmx-1,0,-1):
+        for j in range(nmx-1,0,-1):
             r = (j+1.0)/z
             dnx[j-1] = r - 1.0/(dnx[j]+r)
         dn[:] = dnx[:nmax]
@@ -181,3 +182,166 @@ def coated_mie_coeff(eps1,eps2,x,y):
     bn = (py*b1-p1y)/(gsy*b1-gs1y)
 
     return (an, bn, nmax)
+
+
+def mie_coeffs_batch(m_core, m_shell, x, y):
+    """Mie coefficients of many (coated) spheres at once. The recurrences run over arrays of particles, particles
+    that need fewer terms than the largest one are masked out (their coefficients are zero beyond nmax).
+
+    Args:
+        m_core: The complex refractive index of the core (scalar or one value per particle).
+        m_shell: The complex refractive index of the shell (scalar or one value per particle).
+        x: The size parameters of the cores.
+        y: The size parameters of the shells (y >= x).
+
+    Returns:
+        A tuple containing (an, bn, nmax). an and bn are arrays of shape (number of particles, nmax.max()),
+        nmax is the number of coefficients of each particle.
+    """
+    y = np.atleast_1d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    m_core = np.broadcast_to(np.asarray(m_core, dtype=complex), y.shape)
+    m_shell = np.broadcast_to(np.asarray(m_shell, dtype=complex), y.shape)
+    if (x > y).any():
+        raise ValueError("The size x cannot be larger than y.")
+
+    # Do not use the coated version if it is not necessary
+    homogeneous = (x == y) | (m_core == m_shell) | (x == 0)
+    coated = ~homogeneous
+    m_homogeneous = np.where(x == 0, m_shell, m_core)[homogeneous]
+
+    nmax = np.round(2 + y + 4 * y ** (1.0 / 3.0)).astype(int)
+    ncols = nmax.max()
+    an = np.zeros((y.shape[0], ncols), dtype=complex)
+    bn = np.zeros((y.shape[0], ncols), dtype=complex)
+    if homogeneous.any():
+        an_h, bn_h, nmax_h = single_mie_coeff_batch(m_homogeneous, y[homogeneous])
+        an[homogeneous, :an_h.shape[1]] = an_h
+        bn[homogeneous, :bn_h.shape[1]] = bn_h
+    if coated.any():
+        an_c, bn_c, nmax_c = coated_mie_coeff_batch(m_core[coated], m_shell[coated], x[coated], y[coated])
+        an[coated, :an_c.shape[1]] = an_c
+        bn[coated, :bn_c.shape[1]] = bn_c
+    return (an, bn, nmax)
+
+
+def _log_deriv_batch(z, nmx, ncols):
+    """Logarithmic derivatives by downward recurrence, starting at nmx of each particle.
+    """
+    dnx = zeros((z.shape[0], nmx.max()), dtype=complex)
+    for j in range(nmx.max() - 1, 0, -1):
+        active = j <= nmx - 1
+        r = (j + 1.0) / z[active]
+        dnx[active, j - 1] = r - 1.0 / (dnx[active, j] + r)
+    return dnx[:, :ncols]
+
+
+def _riccati_bessel_batch(z, nmax, ncols):
+    """The functions sqrt(pi z / 2) J(n + 1.5, z) and -sqrt(pi z / 2) Y(n + 1.5, z) for n < nmax of each
+    particle. The Bessel functions are only evaluated where needed, the remaining entries are set to one.
+    """
+    rows, cols = np.nonzero(arange(ncols) < nmax[:, np.newaxis])
+    p = np.ones((z.shape[0], ncols), dtype=z.dtype)
+    ch = np.ones((z.shape[0], ncols), dtype=z.dtype)
+    zz = z[rows]
+    sz = sqrt(0.5 * pi * zz)
+    p[rows, cols] = sz * jv(cols + 1.5, zz)
+    ch[rows, cols] = -sz * yv(cols + 1.5, zz)
+    return p, ch
+
+
+def single_mie_coeff_batch(m, x):
+    """Same as single_mie_coeff (non-magnetic) for arrays of refractive indices and size parameters.
+
+    Returns:
+        A tuple containing (an, bn, nmax), see mie_coeffs_batch.
+    """
+    x = np.atleast_1d(np.asarray(x, dtype=float))
+    m = np.broadcast_to(np.asarray(m, dtype=complex), x.shape)
+    z = m * x
+
+    nmax = np.round(2 + x + 4 * x ** (1.0 / 3.0)).astype(int)
+    nmx = np.round(np.maximum(nmax, abs(z)) + 16).astype(int)
+    ncols = nmax.max()
+    n = arange(ncols)
+
+    xc = x[:, np.newaxis]
+    mc = m[:, np.newaxis]
+    with np.errstate(all='ignore'):
+        px, chx = _riccati_bessel_batch(x, nmax, ncols)
+        p1x = hstack((sin(xc), px[:, :-1]))
+        ch1x = hstack((cos(xc), chx[:, :-1]))
+        gsx = px - complex(0, 1) * chx
+        gs1x = p1x - complex(0, 1) * ch1x
+
+        dn = _log_deriv_batch(z, nmx, ncols)
+        n1 = n + 1
+        da = dn / mc + n1 / xc
+        db = dn * mc + n1 / xc
+
+        an = (da * px - p1x) / (da * gsx - gs1x)
+        bn = (db * px - p1x) / (db * gsx - gs1x)
+
+    valid = (n < nmax[:, np.newaxis]) & (xc > 0)
+    an = np.where(valid, an, 0)
+    bn = np.where(valid, bn, 0)
+    return (an, bn, nmax)
+
+
+def coated_mie_coeff_batch(m1, m2, x, y):
+    """Same as coated_mie_coeff for arrays of refractive indices and size parameters.
+
+    Returns:
+        A tuple containing (an, bn, nmax), see mie_coeffs_batch.
+    """
+    y = np.atleast_1d(np.asarray(y, dtype=float))
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    m1 = np.broadcast_to(np.asarray(m1, dtype=complex), y.shape)
+    m2 = np.broadcast_to(np.asarray(m2, dtype=complex), y.shape)
+    m = m2 / m1
+    u = m1 * x
+    v = m2 * x
+    w = m2 * y
+
+    nmax = np.round(2 + y + 4 * y ** (1.0 / 3.0)).astype(int)
+    mx = np.maximum(abs(m1 * y), abs(w))
+    nmx = np.round(np.maximum(nmax, mx) + 16).astype(int)
+    ncols = nmax.max()
+    n = arange(ncols)
+
+    with np.errstate(all='ignore'):
+        dnu, dnv, dnw = [_log_deriv_batch(z, nmx, ncols) for z in (u, v, w)]
+
+        (pv, chv), (pw, chw), (py, chy) = [_riccati_bessel_batch(zz, nmax, ncols) for zz in (v, w, y)]
+        yc = y[:, np.newaxis]
+        p1y = hstack((sin(yc), py[:, :-1]))
+        ch1y = hstack((cos(yc), chy[:, :-1]))
+        gsy = py - complex(0, 1) * chy
+        gs1y = p1y - complex(0, 1) * ch1y
+
+        mc = m[:, np.newaxis]
+        uu = mc * dnu - dnv
+        vv = dnu / mc - dnv
+        fv = pv / chv
+        ku1 = uu * fv / pw
+        kv1 = vv * fv / pw
+        pt = pw - chw * fv
+        prat = pw / pv / chv
+        ku2 = uu * pt + prat
+        kv2 = vv * pt + prat
+        dns1 = ku1 / ku2
+        gns1 = kv1 / kv2
+
+        dns = dns1 + dnw
+        gns = gns1 + dnw
+        nrat = (n + 1) / yc
+        m2c = m2[:, np.newaxis]
+        a1 = dns / m2c + nrat
+        b1 = m2c * gns + nrat
+        an = (py * a1 - p1y) / (gsy * a1 - gs1y)
+        bn = (py * b1 - p1y) / (gsy * b1 - gs1y)
+
+    valid = n < nmax[:, np.newaxis]
+    an = np.where(valid, an, 0)
+    bn = np.where(valid, bn, 0)
+    return (an, bn, nmax)
@@ -5,8 +5,9 @@ from scipy import stats as _stats
 import matplotlib.pylab as _plt
 from atmPy.tools import plt_tools as _plt_tools
 import scipy.odr as _odr
+import warnings as _warnings
 
-def find_closest(array, value, how = 'closest'):
+def find_closest(array, value, how = 'closest', sorted = None):
     """Finds the element of an array which is the closest to a given number and returns its index
 
     Arguments
@@ -19,12 +20,18 @@ def find_closest(array, value, how = 'closest'):
         'closest': look for the closest value
         'closest_low': look for the closest value that is smaller than value
         'closest_high': look for the closest value that is larger than value
+    sorted: bool, optional
+        If the array is monotonic (increasing or decreasing) the search is done with a binary search
+        (np.searchsorted) for all values at once. If None, this is detected. True skips the detection (make sure
+        it is really monotonic!), False forces the element by element search.
 
     Return
     ------
     integer or array
-        position of closest value(s)"""
-
+        position of closest value(s). If there are several equally close values the first one is returned. If
+        there is no value smaller (closest_low) or larger (closest_high) than value, 0 is returned.
+    """
+    array = _np.asarray(array)
     if _np.any(_np.isnan(array)) or _np.any(_np.isnan(value)):
         txt = '''Array or value contains nan values; that will not work'''
         raise ValueError(txt)
@@ -35,11 +42,66 @@ def find_closest(array, value, how = 'closest'):
 
     elif type(value).__name__ in ('list', 'ndarray'):
         single = False
-        pass
+        value = _np.asarray(value)
 
     else:
         raise ValueError('float,int,array or list are ok types for value. You provided %s' % (type(value).__name__))
 
+    if how not in ('closest', 'closest_low', 'closest_high'):
+        txt = 'The keyword argument how has to be one of the following: "closest", "closest_low", "closest_high"'
+        raise ValueError(txt)
+
+    if sorted == None:
+        diff = _np.diff(array)
+        sorted = bool(_np.all(diff >= 0) or _np.all(diff <= 0))
+
+    if sorted and array.shape[0] > 0:
+        out = _find_closest_sorted(array, value, how)
+    else:
+        out = _find_closest_loop(array, value, how)
+
+    if single:
+        out = out[0]
+    return out
+
+
+def _find_closest_sorted(array, value, how):
+    """find_closest for a monotonic array"""
+    descending = array[0] > array[-1]
+    asc = array[::-1] if descending else array
+    no = asc.shape[0]
+
+    if how == 'closest_low':
+        pos = _np.searchsorted(asc, value, side='right') - 1
+        found = pos >= 0
+    elif how == 'closest_high':
+        pos = _np.searchsorted(asc, value, side='left')
+        found = pos < no
+    else:
+        high = _np.searchsorted(asc, value, side='left')
+        low = _np.clip(high - 1, 0, no - 1)
+        high = _np.clip(high, 0, no - 1)
+        d_low = _np.abs(asc[low] - value)
+        d_high = _np.abs(asc[high] - value)
+        # on a tie the first element of the original array wins
+        if descending:
+            pos = _np.where(d_high <= d_low, high, low)
+        else:
+            pos = _np.where(d_low <= d_high, low, high)
+        found = _np.ones(pos.shape, dtype=bool)
+
+    pos = _np.clip(pos, 0, no - 1)
+    # first occurrence of the value in the original array
+    if descending:
+        out = no - _np.searchsorted(asc, asc[pos], side='right')
+    else:
+        out = _np.searchsorted(asc, asc[pos], side='left')
+    out = _np.where(found, out, 0).astype(int)
+    return out
+
+
+def _find_closest_loop(array, value, how):
+    """find_closest for an arbitrary array, element by element"""
     out = _np.zeros((len(value)), dtype=int)
     for e, i in enumerate(value):
         nar = array - i
@@ -49,15 +111,361 @@ def find_closest(array, value, how = 'closest'):
             nar[nar > 0] = array.max()
         elif how == 'closest_high':
             nar[nar < 0] = array.max()
-        else:
-            txt = 'The keyword argument how has to be one of the following: "closest", "closest_low", "closest_high"'
-            raise ValueError(txt)
         out[e] = _np.abs(nar).argmin()
+    return out
+
+
+def grouped_stats(values, groups, no_of_groups, ddof=1):
+    """Mean, standard deviation, and number of values of each group in a single pass (bincount), nan values are
+    ignored.
+
+    Parameters
+    ----------
+    values: 1D or 2D array
+        The reduction is done along the first axis (for each column separately).
+    groups: 1D array of int
+        Group of each row of values. Rows with a group outside of 0 ... no_of_groups - 1 are ignored.
+    no_of_groups: int
+    ddof: int
+        Delta degrees of freedom of the standard deviation (1 like pandas).
+
+    Returns
+    -------
+    dict with the arrays 'mean', 'std', and 'count' of the shape (no_of_groups,) or (no_of_groups, columns). Groups
+    without values are nan (count 0).
+
+    Examples
+    --------
+    >>> array_tools.grouped_stats(np.array([1., 2., np.nan, 4.]), np.array([0, 0, 1, 1]), 3)['mean']
+    array([1.5, 4. , nan])
+    """
+    values = _np.asarray(values, dtype=float)
+    groups = _np.asarray(groups)
+    single = values.ndim == 1
     if single:
-        out = out[0]
+        values = values[:, _np.newaxis]
+    if groups.shape[0] != values.shape[0]:
+        txt = 'groups has %i elements, values %i rows' % (groups.shape[0], values.shape[0])
+        raise ValueError(txt)
+
+    inside = (groups >= 0) & (groups < no_of_groups)
+    values = values[inside]
+    no_of_columns = values.shape[1]
+    # flat index of each value in the (no_of_groups x columns) result
+    flat = (groups[inside].astype(_np.int64)[:, _np.newaxis] * no_of_columns
+            + _np.arange(no_of_columns)[_np.newaxis, :]).ravel()
+    values = values.ravel()
+    valid = ~_np.isnan(values)
+    flat = flat[valid]
+    values = values[valid]
+
+    size = no_of_groups * no_of_columns
+    count = _np.bincount(flat, minlength=size)
+    with _np.errstate(invalid='ignore', divide='ignore'):
+        mean = _np.bincount(flat, weights=values, minlength=size) / count
+        # second pass with the deviations from the mean, more accurate than the sum of squares
+        sqdev = _np.bincount(flat, weights=(values - mean[flat]) ** 2, minlength=size)
+        std = _np.sqrt(sqdev / (count - ddof))
+    std[count <= ddof] = _np.nan
+
+    out = {'mean': mean, 'std': std, 'count': count}
+    for key in out:
+        out[key] = out[key].reshape(no_of_groups, no_of_columns)
+        if single:
+            out[key] = out[key][:, 0]
+    return out
+
+
+def interp_gaps(x, xp, fp, missing=(), max_missing=3, rank=0, missing_rank=None):
+    """Linear interpolation of fp (given at the sorted positions xp, nan values allowed) onto the sorted positions
+    x, without bridging large gaps. This is the engine of timeseries.merge and does the same as concatenating and
+    sorting the rows of both, interpolating, and averaging rows with the same position, in one pass of binary
+    searches.
+
+    All rows of the concatenation which have no value count as missing: the nan values of fp and the positions
+    in missing. A position is interpolated between the neighbouring values only if less than max_missing rows are
+    missing in between. After the last value the last value is repeated (same rule), before the first value the
+    result is nan. Where there are values at exactly the position their mean is returned.
+
+    Parameters
+    ----------
+    x: 1D array (sorted)
+        target positions, e.g. datetime64 or float
+    xp: 1D array (sorted)
+    fp: 1D array
+    missing: list of 1D arrays (sorted)
+        positions of additional missing rows, e.g. x if x has no value for this column.
+    max_missing: int
+    rank: int or 1D array like xp
+    missing_rank: list of int, optional
+        Order of rows with identical positions: rows with a lower rank come first (like the rows of the first
+        frame of a concatenation sorted with a stable sort). Default is 0 for all.
+
+    Returns
+    -------
+    1D array of floats with the shape of x
+    """
+    x = _as_position(x)
+    xp = _as_position(xp)
+    fp = _np.asarray(fp, dtype=_np.float64)
+    rank = _np.broadcast_to(rank, xp.shape)
+    if type(missing_rank) == type(None):
+        missing_rank = [0] * len(missing)
+    valid = ~_np.isnan(fp)
+    missing = [_as_position(m) for m in missing]
+    missing_rank = list(missing_rank)
+    for r in _np.unique(rank[~valid]):
+        missing.append(xp[~valid & (rank == r)])
+        missing_rank.append(r)
+    xv = xp[valid]
+    fv = fp[valid]
+    rv = rank[valid]
+    out = _np.full(x.shape[0], _np.nan)
+    if xv.shape[0] == 0:
+        return out
+
+    left = _np.searchsorted(xv, x, side='left')
+
+    # values at exactly the position
+    exact = xv[_np.minimum(left, xv.shape[0] - 1)] == x
+    right = _np.searchsorted(xv, x[exact], side='right')
+    csum = _np.concatenate(([0.], _np.cumsum(fv)))
+    out[exact] = (csum[right] - csum[left[exact]]) / (right - left[exact])
+
+    # between two values, p is the last value before and q the first after the position
+    between = ~exact & (left > 0) & (left < xv.shape[0])
+    p = left[between] - 1
+    q = left[between]
+    no_missing = _np.zeros(p.shape[0], dtype=_np.int64)
+    for m, r in zip(missing, missing_rank):
+        after_p = _np.where(r > rv[p], _np.searchsorted(m, xv[p], side='left'),
+                            _np.searchsorted(m, xv[p], side='right'))
+        before_q = _np.where(r < rv[q], _np.searchsorted(m, xv[q], side='right'),
+                             _np.searchsorted(m, xv[q], side='left'))
+        no_missing += before_q - after_p
+    frac = (x[between] - xv[p]).astype(_np.float64) / (xv[q] - xv[p]).astype(_np.float64)
+    out[between] = _np.where(no_missing < max_missing, fv[p] + (fv[q] - fv[p]) * frac, _np.nan)
+
+    # after the last value
+    after = ~exact & (left == xv.shape[0])
+    if after.any():
+        no_missing = 0
+        for m, r in zip(missing, missing_rank):
+            no_missing += m.shape[0] - _np.searchsorted(m, xv[-1], side='left' if r > rv[-1] else 'right')
+        if no_missing < max_missing:
+            out[after] = fv[-1]
     return out
 
 
+def interval_mean(starts, ends, xp, fp):
+    """Mean of the values fp (at the sorted positions xp, nan values are ignored) within each interval
+    [starts, ends). Done with binary searches and cumulative sums, so the intervals can be irregular.
+
+    Parameters
+    ----------
+    starts, ends: 1D arrays
+        Interval boundaries, e.g. datetime64 or float
+    xp: 1D array (sorted)
+    fp: 1D or 2D array
+        Values, for 2D the rows correspond to xp.
+
+    Returns
+    -------
+    array of floats with the length of starts (and the columns of fp). nan where there are no values.
+    """
+    starts = _as_position(starts)
+    ends = _as_position(ends)
+    xp = _as_position(xp)
+    fp = _np.asarray(fp, dtype=_np.float64)
+    single = fp.ndim == 1
+    if single:
+        fp = fp[:, _np.newaxis]
+
+    valid = ~_np.isnan(fp)
+    # the offset reduces the loss of precision of the cumulative sum
+    with _np.errstate(invalid='ignore'):
+        offset = _np.where(valid.any(axis=0), _np.nanmean(_np.where(valid, fp, _np.nan), axis=0), 0)
+    csum = _np.zeros((fp.shape[0] + 1, fp.shape[1]))
+    _np.cumsum(_np.where(valid, fp - offset, 0), axis=0, out=csum[1:])
+    ccount = _np.zeros((fp.shape[0] + 1, fp.shape[1]), dtype=_np.int64)
+    _np.cumsum(valid, axis=0, out=ccount[1:])
+
+    first = _np.searchsorted(xp, starts, side='left')
+    last = _np.searchsorted(xp, ends, side='left')
+    count = ccount[last] - ccount[first]
+    with _np.errstate(invalid='ignore', divide='ignore'):
+        out = (csum[last] - csum[first]) / count + offset
+    out[count == 0] = _np.nan
+    if single:
+        out = out[:, 0]
+    return out
+
+
+def _as_position(x):
+    """datetime64 as int64 (ns), everything else as is"""
+    x = _np.asarray(x)
+    if _np.issubdtype(x.dtype, _np.datetime64):
+        x = x.astype('datetime64[ns]').view(_np.int64)
+    return x
+
+
+def rolling_corr(x, y, window, min_periods=None, center=False, lags=None):
+    """Pearson correlation coefficient of x and y in rolling windows (same windows as pandas rolling). Only points
+    where both x and y are valid count. The sums of x, y, x^2, y^2, and xy in each window are differences of
+    cumulative sums, so the cost does not depend on the window size.
+
+    Parameters
+    ----------
+    x: 1D array
+    y: 1D or 2D array
+        If 2D, each column is correlated with x.
+    window: int
+        Number of points in each window.
+    min_periods: int, optional
+        Minimum number of valid pairs, default is window.
+    center: bool
+        If False the window ends at the point, else it is centered on the point (like pandas).
+    lags: array-like of int, optional
+        y (1D) is shifted by each lag (in points): the column for the lag k correlates x[i] with y[i - k].
+        Points shifted in from outside are nan.
+
+    Returns
+    -------
+    1D array or 2D array (points x columns or lags)
+    """
+    x = _np.asarray(x, dtype=_np.float64)
+    y = _np.asarray(y, dtype=_np.float64)
+    if type(min_periods) == type(None):
+        min_periods = window
+    start, end = _window_bounds(x.shape[0], window, center)
+
+    # offsets reduce the loss of precision in the cumulative sums, r does not depend on them
+    with _np.errstate(invalid='ignore'), _warnings.catch_warnings():
+        _warnings.simplefilter('ignore', RuntimeWarning)
+        x = x - _np.nan_to_num(_np.nanmean(x))
+        y = y - _np.nan_to_num(_np.nanmean(y))
+
+    if type(lags) != type(None):
+        columns = [_shift(y, int(k)) for k in lags]
+    elif y.ndim == 1:
+        columns = [y]
+    else:
+        columns = [y[:, i] for i in range(y.shape[1])]
+
+    out = _np.full((x.shape[0], len(columns)), _np.nan)
+    x_valid = ~_np.isnan(x)
+    for i, yc in enumerate(columns):
+        valid = x_valid & ~_np.isnan(yc)
+        n, sx, sy, sxx, syy, sxy = _window_sums_xy(x, yc, valid, start, end)
+        with _np.errstate(invalid='ignore', divide='ignore'):
+            var = (n * sxx - sx ** 2) * (n * syy - sy ** 2)
+            r = (n * sxy - sx * sy) / _np.sqrt(var)
+        r[(n < max(min_periods, 1)) | ~(var > 0)] = _np.nan
+        out[:, i] = _np.clip(r, -1, 1)
+
+    if type(lags) == type(None) and y.ndim == 1:
+        out = out[:, 0]
+    return out
+
+
+def rolling_regression(x, y, window, min_periods=None, center=False, remove_zeros=False):
+    """Pearson correlation coefficient, linear regression (y = slope * x + intercept), and the slope of the
+    regression through zero (y = slope * x) in rolling windows (same windows as pandas rolling). The sums in
+    each window are differences of cumulative sums, so the cost per window is constant. The results are the
+    same as those of Correlation for each window.
+
+    Parameters
+    ----------
+    x, y: 1D arrays
+    window: int
+        Number of points in each window.
+    min_periods: int, optional
+        Minimum number of points where x and y are both valid (not nan), default is window.
+    center: bool
+        If False the window ends at the point, else it is centered on the point (like pandas).
+    remove_zeros: bool
+        Points where x or y is zero are excluded from the statistics (as in Correlation), after min_periods
+        is checked.
+
+    Returns
+    -------
+    dict with the 1D arrays 'pearson_r', 'slope', 'intercept', 'slope_zero_intercept', and 'no_of_points'
+    (number of points used in each window)
+    """
+    x = _np.asarray(x, dtype=_np.float64)
+    y = _np.asarray(y, dtype=_np.float64)
+    if type(min_periods) == type(None):
+        min_periods = window
+    start, end = _window_bounds(x.shape[0], window, center)
+
+    valid = ~_np.isnan(x) & ~_np.isnan(y)
+    no_valid = _window_sum(valid.astype(_np.float64), start, end)
+    if remove_zeros:
+        valid &= (x != 0) & (y != 0)
+
+    # offsets reduce the loss of precision in the cumulative sums
+    mx = x[valid].mean() if valid.any() else 0.
+    my = y[valid].mean() if valid.any() else 0.
+    n, sx, sy, sxx, syy, sxy = _window_sums_xy(x - mx, y - my, valid, start, end)
+
+    with _np.errstate(invalid='ignore', divide='ignore'):
+        var_x = n * sxx - sx ** 2
+        var_y = n * syy - sy ** 2
+        cov = n * sxy - sx * sy
+        pearson_r = _np.clip(cov / _np.sqrt(var_x * var_y), -1, 1)
+        slope = cov / var_x
+        intercept = (sy - slope * sx) / n + my - slope * mx
+        # sums of the original values for the regression through zero
+        sxy_0 = sxy + my * sx + mx * sy + n * mx * my
+        sxx_0 = sxx + 2 * mx * sx + n * mx ** 2
+        slope_zero_intercept = sxy_0 / sxx_0
+
+    bad = (no_valid < max(min_periods, 1)) | (n < 2)
+    out = {'pearson_r': pearson_r,
+           'slope': slope,
+           'intercept': intercept,
+           'slope_zero_intercept': slope_zero_intercept}
+    for key in out:
+        out[key][bad | ~_np.isfinite(out[key])] = _np.nan
+    out['pearson_r'][~(var_x * var_y > 0)] = _np.nan
+    out['no_of_points'] = n.astype(int)
+    return out
+
+
+def _window_sums_xy(x, y, valid, start, end):
+    """Window sums of n, x, y, x^2, y^2, and xy over the valid points"""
+    xv = _np.where(valid, x, 0)
+    yv = _np.where(valid, y, 0)
+    sums = _window_sum(_np.array([valid, xv, yv, xv * xv, yv * yv, xv * yv], dtype=_np.float64).transpose(),
+                       start, end)
+    return sums.transpose()
+
+
+def _shift(values, k):
+    """values[i - k], nan where this is outside of the array"""
+    out = _np.full(values.shape, _np.nan)
+    if k >= 0:
+        out[k:] = values[:values.shape[0] - k]
+    else:
+        out[:k] = values[-k:]
+    return out
+
+
+def _window_bounds(n, window, center):
+    """start and end (exclusive) of the rolling windows as in pandas"""
+    offset = (window - 1) // 2 if center else 0
+    end = _np.arange(1, n + 1) + offset
+    start = end - window
+    return _np.clip(start, 0, n), _np.clip(end, 0, n)
+
+
+def _window_sum(values, start, end):
+    """Sums of the rows of values between start and end (exclusive) from the cumulative sum"""
+    csum = _np.zeros((values.shape[0] + 1,) + values.shape[1:])
+    _np.cumsum(values, axis=0, out=csum[1:])
+    return csum[end] - csum[start]
+
+
 def reverse_binary(variable, no_bits):
     """This converts all numbers into binary of length no_bits. Then it reverses the
     binaries and finally converts it into integer again.
@@ -1,4 +1,6 @@
+import copy as _copy
 import numpy as np
+import pandas as pd
 import matplotlib.pylab as plt
 
 
@@ -114,4 +116,55 @@ def plot_panel_meshgrid(panel, xaxis = 0, yaxis = 1, sub_set = 0, ax = None, kwa
     a.set_ylabel(panel.major_axis.name)
     cb.set_label(panel.minor_axis[sub_set])
     pc.set_clim(z[~ np.isnan(z)].min(), z[~ np.isnan(z)].max())
-    return f,a,pc,cb
\ No newline at end of file
+    return f,a,pc,cb
+
+def copy_on_write_enabled():
+    """True if pandas copies data lazily (copy-on-write, always the case with pandas >= 3)"""
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except KeyError:
+        return False
+
+
+def copy_on_write(df):
+    """Lightweight copy of a DataFrame or Series. The copy shares the memory with df until one of them is changed.
+    If copy-on-write is not enabled in pandas (see copy_on_write_enabled) a regular (deep) copy is returned."""
+    return df.copy(deep=not copy_on_write_enabled())
+
+
+def lightweight_copy(obj, share=()):
+    """Shallow copy of an object (e.g. TimeSeries or SizeDist) where the attributes are copied lightweight too:
+
+    - pandas objects: copy_on_write
+    - numpy arrays: copy (they are small, e.g. bins)
+    - objects whose class defines __copy__ (e.g. a housekeeping TimeSeries): copy.copy
+    - anything else (numbers, strings, lists, ...) is shared with obj
+
+    Changing the data of the copy (or of obj) therefore does not change the other one, as long as the
+    changes are done via pandas.
+
+    Parameters
+    ----------
+    obj: object
+    share: list of str
+        Names of attributes which are shared with obj in any case (e.g. large arrays which are not changed in
+        place).
+
+    Returns
+    -------
+    object of the same type as obj
+    """
+    out = obj.__class__.__new__(obj.__class__)
+    for key, value in obj.__dict__.items():
+        if key in share:
+            pass
+        elif isinstance(value, (pd.DataFrame, pd.Series)):
+            value = copy_on_write(value)
+        elif isinstance(value, np.ndarray):
+            value = value.copy()
+        elif hasattr(type(value), '__copy__'):
+            value = _copy.copy(value)
+        out.__dict__[key] = value
+    return out
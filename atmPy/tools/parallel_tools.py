@@ -0,0 +1,94 @@
+"""Tools to run row by row calculations on chunks of (large) arrays in a process pool. The input arrays are put
+into shared memory, so they are not copied to each of the worker processes."""
+import concurrent.futures as _futures
+from multiprocessing import shared_memory as _shared_memory
+
+import numpy as _np
+
+# state of a worker process, set by _init_worker
+_worker_arrays = {}
+_worker_blocks = []
+_worker_args = ()
+
+
+def get_chunks(no_rows, n_workers, chunk_size=None):
+    """Splits no_rows rows into chunks.
+
+    Parameters
+    ----------
+    no_rows: int
+    n_workers: int
+    chunk_size: int, optional
+        Number of rows per chunk. If None, the rows are split evenly among the workers.
+
+    Returns
+    -------
+    list of (start, stop) tuples
+    """
+    if not chunk_size:
+        chunk_size = int(_np.ceil(no_rows / float(n_workers)))
+    chunk_size = max(1, int(chunk_size))
+    return [(start, min(start + chunk_size, no_rows)) for start in range(0, no_rows, chunk_size)]
+
+
+def map_chunks(func, arrays, n_workers, chunk_size=None, args=(), initializer=None, initargs=()):
+    """Applies func to chunks of rows of arrays in a process pool.
+
+    Parameters
+    ----------
+    func: callable
+        Module level function (it has to be pickled), called as func(start, stop, arrays, *args) in the worker
+        processes. arrays is a dictionary with the same keys as the arrays argument, the values are views of the
+        shared memory (read only by convention).
+    arrays: dict
+        numpy arrays (no object arrays), all with the same number of rows.
+    n_workers: int
+        number of processes
+    chunk_size: int, optional
+        see get_chunks
+    args: tuple
+        Additional arguments of func. They are sent to each worker once (not with each chunk).
+    initializer: callable, optional
+        Called with initargs in each worker process at startup.
+    initargs: tuple
+
+    Returns
+    -------
+    list with the return values of func, in the order of the chunks
+    """
+    no_rows = list(arrays.values())[0].shape[0]
+    chunks = get_chunks(no_rows, n_workers, chunk_size)
+    blocks = []
+    specs = {}
+    try:
+        for name, array in arrays.items():
+            array = _np.ascontiguousarray(array)
+            shm = _shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(shm)
+            _np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+            specs[name] = (shm.name, array.shape, array.dtype.str)
+
+        with _futures.ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                          initargs=(specs, args, initializer, initargs)) as pool:
+            futures = [pool.submit(_run_chunk, func, start, stop) for start, stop in chunks]
+            results = [future.result() for future in futures]
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return results
+
+
+def _init_worker(specs, args, initializer, initargs):
+    global _worker_args
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = _shared_memory.SharedMemory(name=shm_name)
+        _worker_blocks.append(shm)
+        _worker_arrays[name] = _np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker_args = args
+    if initializer:
+        initializer(*initargs)
+
+
+def _run_chunk(func, start, stop):
+    return func(start, stop, _worker_arrays, *_worker_args)
@@ -0,0 +1,643 @@
+"""Benchmarks and accuracy regression checks of the Mie calculations and other hot spots.
+
+The throughput (items per second) and the peak memory of the Mie engines, _perform_Miecalculations, and
+size_dist2optical_properties are measured in three size parameter regimes (Rayleigh, resonance, and geometric).
+Results are checked against reference values stored in test_data, so a new fast path has to reproduce the
+results of the current implementation before it is used. benchmark_kernel_grid compares the interpolation from a
+MieKernelGrid (time dependent refractive index) to Mie calculations for each refractive index,
+benchmark_find_closest shows how array_tools.find_closest scales with the number of queries, benchmark_copy the
+memory needed for copies of a multi-day dataset, benchmark_storage the memory of the storage options of
+SizeDist_TS, benchmark_fit_normal the batched fit, benchmark_simulate the multi-modal simulator,
+benchmark_convert2verticalprofile the vertical binning, and benchmark_merge timeseries.merge (the engine of
+align_to) against the previous implementation (merge_old), benchmark_corr_timelag the batched time lag correlation, and
+benchmark_rolling_stats the windowed regression statistics.
+
+Examples
+--------
+Print the benchmarks from the command line:
+    python -m atmPy.unit_testing.benchmarks
+
+Check a Mie engine against the reference values:
+>>> from atmPy.unit_testing import benchmarks
+>>> benchmarks.check_mie_reference('bhmie_hagen_batch')
+"""
+import os as _os
+import time as _time
+import tracemalloc as _tracemalloc
+
+import numpy as _np
+import pandas as _pd
+
+from atmPy.aerosols.physics import optical_properties as _optical_properties
+from atmPy.aerosols.size_distribution import sizedistribution as _sizedistribution
+from atmPy.general import timeseries as _timeseries
+from atmPy.radiation.mie_scattering import bhmie as _bhmie
+from atmPy.radiation.mie_scattering import mie_coated as _mie_coated
+from atmPy.tools import array_tools as _array_tools
+
+test_data_folder = _os.path.join(_os.path.dirname(_os.path.abspath(__file__)), 'test_data')
+mie_reference_file = _os.path.join(test_data_folder, 'mie_reference.csv')
+optical_properties_reference_file = _os.path.join(test_data_folder, 'optical_properties_reference.csv')
+
+regimes = {'rayleigh': (0.01, 0.3),
+           'resonance': (1., 10.),
+           'geometric': (30., 300.)}
+refractive_indices = [1.33, 1.5 + 0.01j, 1.95 + 0.79j]
+quantities = ['qext', 'qsca', 'qback', 'gsca']
+
+# relative tolerances of the comparison to the reference values. MieCoatedBatch truncates the series after a
+# slightly different number of terms (Wiscombe's criterion), which mostly affects the backscattering.
+tolerances = {'default': {'qext': 1e-9, 'qsca': 1e-9, 'qback': 1e-7, 'gsca': 1e-9},
+              'MieCoatedBatch': {'qext': 1e-4, 'qsca': 1e-4, 'qback': 5e-2, 'gsca': 1e-4}}
+
+
+#######
+# Mie engines, all return an array with the columns qext, qsca, qback, and gsca (see quantities)
+def _run_bhmie_hagen(x, n, noOfAngles):
+    return _np.array([_bhmie.bhmie_hagen(xi, ni, noOfAngles).return_Values()[2:] for xi, ni in zip(x, n)])
+
+
+def _run_bhmie(x, n, noOfAngles):
+    return _np.array([_bhmie.bhmie(xi, ni, noOfAngles)[2:] for xi, ni in zip(x, n)])
+
+
+def _run_bhmie_hagen_batch(x, n, noOfAngles):
+    mie = _bhmie.bhmie_hagen_batch(x, n, noOfAngles)
+    return _np.array([mie.qext, mie.qsca, mie.qback, mie.gsca]).transpose()
+
+
+def _run_mie_coated_batch(x, n, noOfAngles):
+    # no distinct core, the particles are homogeneous
+    mie = _mie_coated.MieCoatedBatch(x, x, n, n, noOfAngles)
+    return _np.array([mie.qext, mie.qsca, mie.qback, mie.gsca]).transpose()
+
+
+mie_engines = {'bhmie_hagen': _run_bhmie_hagen,
+               'bhmie': _run_bhmie,
+               'bhmie_hagen_batch': _run_bhmie_hagen_batch,
+               'MieCoatedBatch': _run_mie_coated_batch}
+
+
+def get_particles(regime, no_of_particles):
+    """Size parameters (log-spaced over the regime) and refractive indices (cycling through refractive_indices)
+
+    Returns
+    -------
+    x, n: numpy arrays
+    """
+    start, end = regimes[regime]
+    x = _np.logspace(_np.log10(start), _np.log10(end), no_of_particles)
+    n = _np.array([refractive_indices[i % len(refractive_indices)] for i in range(no_of_particles)],
+                  dtype=_np.complex128)
+    return x, n
+
+
+def get_size_distribution(no_of_rows=100, no_of_bins=100, diameter=(10., 2500.)):
+    """A SizeDist_TS with a log-normal mode whose center oscillates between 100 and 300 nm (no randomness, so the
+    result is the same every time)"""
+    bins = _np.logspace(_np.log10(diameter[0]), _np.log10(diameter[1]), no_of_bins + 1)
+    bincenters = _np.sqrt(bins[1:] * bins[:-1])
+    centers = 200. + 100. * _np.sin(_np.linspace(0, 4 * _np.pi, no_of_rows))
+    data = 1000. * _np.exp(-(_np.log10(bincenters)[_np.newaxis, :] - _np.log10(centers)[:, _np.newaxis]) ** 2
+                           / (2 * 0.2 ** 2))
+    index = _pd.date_range('2016-01-01', periods=no_of_rows, freq='60s')
+    dist = _sizedistribution.SizeDist_TS(_pd.DataFrame(data, index=index), bins, 'dNdlogDp')
+    dist._data_period = 60.
+    return dist
+
+
+#######
+# benchmarks
+def _measure(func, repeat):
+    """Best wall time of repeat runs and the peak memory (MB) allocated during one run"""
+    times = []
+    for i in range(repeat):
+        start = _time.perf_counter()
+        func()
+        times.append(_time.perf_counter() - start)
+
+    _tracemalloc.start()
+    try:
+        func()
+        peak = _tracemalloc.get_traced_memory()[1]
+    finally:
+        _tracemalloc.stop()
+    return min(times), peak / 1e6
+
+
+def _result(function, regime, no_of_items, unit, duration, peak_memory):
+    return {'function': function,
+            'regime': regime,
+            'items': no_of_items,
+            'unit': unit,
+            'time_s': duration,
+            'items_per_s': no_of_items / duration,
+            'peak_memory_MB': peak_memory}
+
+
+def benchmark_mie_engine(engine, regime, no_of_particles=200, noOfAngles=100, repeat=3):
+    """Particles per second and peak memory of a Mie engine (see mie_engines)
+
+    Returns
+    -------
+    dict
+    """
+    x, n = get_particles(regime, no_of_particles)
+    run = mie_engines[engine]
+    duration, peak = _measure(lambda: run(x, n, noOfAngles), repeat)
+    return _result(engine, regime, no_of_particles, 'particles', duration, peak)
+
+
+def benchmark_perform_Miecalculations(regime, no_of_diameters=200, wavelength=0.55, n=1.5 + 0.01j, noOfAngles=100,
+                                      repeat=3):
+    """Particles (diameters) per second and peak memory of _perform_Miecalculations. The diameters are chosen
+    such that the size parameters cover the regime.
+
+    Returns
+    -------
+    dict
+    """
+    x, _ = get_particles(regime, no_of_diameters)
+    diam = x * wavelength / _np.pi
+    duration, peak = _measure(lambda: _optical_properties._perform_Miecalculations(diam, wavelength, n,
+                                                                                    noOfAngles=noOfAngles),
+                              repeat)
+    return _result('_perform_Miecalculations', regime, no_of_diameters, 'particles', duration, peak)
+
+
+def benchmark_size_dist2optical_properties(no_of_rows=500, no_of_bins=100, wavelength=550., n=1.5 + 0.01j,
+                                           noOfAngles=100, repeat=3):
+    """Rows (time stamps) per second and peak memory of size_dist2optical_properties, including the extinction
+    coefficient and the asymmetry parameter (which needs the angular scattering function).
+
+    Returns
+    -------
+    dict
+    """
+    dist = get_size_distribution(no_of_rows=no_of_rows, no_of_bins=no_of_bins)
+
+    def run():
+        opt = _optical_properties.size_dist2optical_properties(dist, wavelength, n, noOfAngles=noOfAngles)
+        opt.extinction_coeff
+        opt.asymmetry_param
+
+    duration, peak = _measure(run, repeat)
+    return _result('size_dist2optical_properties', 'all', no_of_rows, 'rows', duration, peak)
+
+
+def get_refractive_index(dist, n_dry=1.53 + 0.01j, n_water=1.33 + 0j):
+    """A time dependent refractive index for the rows of dist, as it results from the volume mixing rule with a
+    water fraction oscillating between 0 and 1 (one distinct refractive index per row)"""
+    water = 0.5 + 0.5 * _np.sin(_np.linspace(0, 6, dist.data.shape[0]))
+    return _pd.DataFrame({'n': n_dry + water * (n_water - n_dry)}, index=dist.data.index)
+
+
+def benchmark_kernel_grid(no_of_rows=1440, no_of_bins=60, wavelength=550., tolerances=(1e-2, 1e-3), noOfAngles=100,
+                          repeat=1):
+    """Rows per second and peak memory of size_dist2optical_properties with a time dependent refractive index (see
+    get_refractive_index), with the Mie calculations done for each refractive index and interpolated from a
+    MieKernelGrid (kernel_tolerance). The maximum relative deviation of the extinction coefficient and the
+    asymmetry parameter from the former is given as well.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    dist = get_size_distribution(no_of_rows=no_of_rows, no_of_bins=no_of_bins)
+    n = get_refractive_index(dist)
+    results = []
+    exact = {}
+    for tolerance in (None,) + tuple(tolerances):
+        out = {}
+
+        def run():
+            opt = _optical_properties.size_dist2optical_properties(dist, wavelength, n, noOfAngles=noOfAngles,
+                                                                   kernel_tolerance=tolerance)
+            out['extinction_coeff'] = opt.extinction_coeff.data.values.ravel()
+            out['asymmetry_param'] = opt.asymmetry_param.data.values.ravel()
+
+        duration, peak = _measure(run, repeat)
+        if tolerance is None:
+            exact = out
+            res = _result('size_dist2optical_properties', 'per refractive index', no_of_rows, 'rows', duration,
+                          peak)
+        else:
+            res = _result('size_dist2optical_properties', 'kernel_tolerance=%s' % tolerance, no_of_rows, 'rows',
+                          duration, peak)
+        for quantity in ['extinction_coeff', 'asymmetry_param']:
+            res['deviation_%s' % quantity] = _np.abs(out[quantity] / exact[quantity] - 1).max()
+        results.append(res)
+    return _pd.DataFrame(results)
+
+
+def run_benchmarks(no_of_particles=200, no_of_rows=500, repeat=3, engines=None):
+    """Runs all benchmarks
+
+    Parameters
+    ----------
+    no_of_particles: int
+        number of particles per regime for the Mie engines and _perform_Miecalculations
+    no_of_rows: int
+        number of rows of the size distribution in the size_dist2optical_properties benchmark
+    repeat: int
+        The best of repeat runs is reported.
+    engines: list, optional
+        Mie engines to be tested, default is all (see mie_engines).
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    if type(engines) == type(None):
+        engines = list(mie_engines.keys())
+    results = []
+    for regime in regimes:
+        for engine in engines:
+            results.append(benchmark_mie_engine(engine, regime, no_of_particles=no_of_particles, repeat=repeat))
+        results.append(benchmark_perform_Miecalculations(regime, no_of_diameters=no_of_particles, repeat=repeat))
+    results.append(benchmark_size_dist2optical_properties(no_of_rows=no_of_rows, repeat=repeat))
+    return _pd.DataFrame(results)
+
+
+def benchmark_find_closest(no_of_queries=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6), array_size=1000, how='closest',
+                           repeat=3, loop_max=10 ** 4):
+    """Queries per second and peak memory of array_tools.find_closest on a sorted array, with the binary search
+    and (up to loop_max queries) with the element by element search.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    array = _np.logspace(0, 4, array_size)
+    results = []
+    for no in no_of_queries:
+        values = _np.linspace(0, 1.1e4, int(no))
+        duration, peak = _measure(lambda: _array_tools.find_closest(array, values, how=how, sorted=True), repeat)
+        results.append(_result('find_closest (sorted)', how, int(no), 'queries', duration, peak))
+        if no <= loop_max:
+            duration, peak = _measure(lambda: _array_tools.find_closest(array, values, how=how, sorted=False),
+                                      repeat)
+            results.append(_result('find_closest (loop)', how, int(no), 'queries', duration, peak))
+    return _pd.DataFrame(results)
+
+
+def get_flight_dataset(days=3, data_period=10., no_of_bins=100):
+    """A SizeDist_TS similar to a multi-day campaign of a balloon or aircraft borne optical particle counter:
+    log-normal size distributions (see get_size_distribution) every data_period seconds with attached housekeeping
+    (altitude, temperature, pressure, relative humidity) and a density time series."""
+    no_of_rows = int(days * 24 * 3600 / data_period)
+    dist = get_size_distribution(no_of_rows=no_of_rows, no_of_bins=no_of_bins)
+    index = _pd.date_range('2016-01-01', periods=no_of_rows, freq='%is' % data_period)
+    dist.data.index = index
+    dist._data_period = data_period
+    altitude = 1500. + 1500. * _np.sin(_np.linspace(0, 20 * _np.pi, no_of_rows))
+    hk = _pd.DataFrame({'Altitude': altitude,
+                        'temperature_K': 288.15 - 0.0065 * altitude,
+                        'pressure_Pa': 101325. * (1 - 2.25577e-5 * altitude) ** 5.25588,
+                        'Relative_humidity': 50. + 30 * _np.cos(_np.linspace(0, 20 * _np.pi, no_of_rows))},
+                       index=index)
+    hk = _timeseries.TimeSeries(hk)
+    hk._data_period = data_period
+    dist.housekeeping = hk
+    density = _timeseries.TimeSeries(_pd.DataFrame({'density': _np.full(no_of_rows, 1.8)}, index=index))
+    density._data_period = data_period
+    dist.physical_property_density = density
+    return dist
+
+
+def benchmark_copy(days=3, data_period=10., no_of_bins=100, repeat=3):
+    """Time and peak memory of copy (lightweight and deep) and zoom_time (one hour) of a multi-day dataset (see
+    get_flight_dataset).
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    dist = get_flight_dataset(days=days, data_period=data_period, no_of_bins=no_of_bins)
+    start = dist.data.index[0]
+    end = start + _pd.Timedelta(1, 'h')
+    results = []
+    for deep in [False, True]:
+        label = 'deep' if deep else 'lightweight'
+        duration, peak = _measure(lambda: dist.copy(deep=deep), repeat)
+        results.append(_result('SizeDist_TS.copy', label, dist.data.shape[0], 'rows', duration, peak))
+        duration, peak = _measure(lambda: dist.copy(deep=deep).zoom_time(start=start, end=end), repeat)
+        results.append(_result('SizeDist_TS.zoom_time', label, dist.data.shape[0], 'rows', duration, peak))
+    out = _pd.DataFrame(results)
+    out['dataset_size_MB'] = (dist.data.memory_usage().sum() + dist.housekeeping.data.memory_usage().sum()
+                              + dist.physical_property_density.data.memory_usage().sum()) / 1e6
+    return out
+
+
+def benchmark_storage(days=30, data_period=60., no_of_bins=100, repeat=3):
+    """Memory of the data and time of the moment calculation (particle_volume_concentration) of a SizeDist_TS
+    with the different storage options (pandas, array with float64 and float32).
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    dist = get_flight_dataset(days=days, data_period=data_period, no_of_bins=no_of_bins)
+    results = []
+    for storage, dtype in [('pandas', None), ('array', _np.float64), ('array', _np.float32)]:
+        label = storage if storage == 'pandas' else '%s (%s)' % (storage, _np.dtype(dtype).name)
+        dist_s = _sizedistribution.SizeDist_TS(dist.data, dist.bins, dist.distributionType, storage=storage,
+                                               dtype=dtype)
+
+        def run():
+            dist_s._update()
+            dist_s.particle_volume_concentration
+
+        duration, peak = _measure(run, repeat)
+        res = _result('SizeDist_TS.particle_volume_concentration', label, dist.data.shape[0], 'rows', duration,
+                      peak)
+        res['data_MB'] = dist_s.values.nbytes / 1e6
+        results.append(res)
+    return _pd.DataFrame(results)
+
+
+def benchmark_fit_normal(no_of_rows=(10 ** 2, 10 ** 3, 10 ** 4), no_of_bins=100, repeat=1, loop_max=10 ** 3):
+    """Rows per second of SizeDist_TS.fit_normal (batched) and (up to loop_max rows) of the row by row fit with
+    fit_normal_dist (scipy.optimize.curve_fit).
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    results = []
+    for no in no_of_rows:
+        dist = get_size_distribution(no_of_rows=int(no), no_of_bins=no_of_bins)
+        duration, peak = _measure(lambda: dist.fit_normal(), repeat)
+        results.append(_result('fit_normal (batch)', '1 mode', int(no), 'rows', duration, peak))
+        if no <= loop_max:
+            def run():
+                for line in dist.values:
+                    _sizedistribution.fit_normal_dist(dist.bincenters, line)
+
+            duration, peak = _measure(run, repeat)
+            results.append(_result('fit_normal_dist (loop)', '1 mode', int(no), 'rows', duration, peak))
+    return _pd.DataFrame(results)
+
+
+def benchmark_simulate(no_of_rows=(10 ** 3, 10 ** 4, 10 ** 5), no_of_bins=100, modes=3, noise='poisson', repeat=3):
+    """Rows per second and peak memory of simulate_sizedistribution_modes with modes modes whose diameters change
+    from row to row.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    results = []
+    for no in no_of_rows:
+        no = int(no)
+        index = _pd.date_range('2016-01-01', periods=no, freq='10s')
+        Dg = _np.logspace(1.5, 2.5, modes)[_np.newaxis, :] * _np.linspace(1, 2, no)[:, _np.newaxis]
+        duration, peak = _measure(lambda: _sizedistribution.simulate_sizedistribution_modes(
+            1000., Dg, 1.6, numberOfDiameters=no_of_bins + 1, index=index, noise=noise, seed=0), repeat)
+        results.append(_result('simulate_sizedistribution_modes', '%i modes' % modes, no, 'rows', duration, peak))
+    return _pd.DataFrame(results)
+
+
+def benchmark_convert2verticalprofile(days=1, data_period=1., no_of_bins=100, laythick=2, repeat=3):
+    """Rows per second and peak memory of SizeDist_TS.convert2verticalprofile of a flight (see
+    get_flight_dataset).
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    dist = get_flight_dataset(days=days, data_period=data_period, no_of_bins=no_of_bins)
+    duration, peak = _measure(lambda: dist.convert2verticalprofile(laythick=laythick), repeat)
+    return _pd.DataFrame([_result('SizeDist_TS.convert2verticalprofile', '%s m layers' % laythick,
+                                  dist.data.shape[0], 'rows', duration, peak)])
+
+
+def merge_old(ts, ts_other):
+    """The previous implementation of timeseries.merge (concat, sort, and groupby), kept as reference for
+    benchmark_merge and the tests. Gaps of 3 or more missing points are not bridged."""
+    ts_this = ts.copy()
+
+    if _np.array_equal(ts_this.data.index, ts_other.data.index):
+        ts_this.data = _pd.concat([ts_this.data, ts_other.data], axis=1)
+
+    else:
+        catsort = _pd.concat([ts_this.data, ts_other.data]).sort_index()
+
+        mask = catsort.copy()
+        grp = ((mask.notnull() != mask.shift().notnull()).cumsum())
+        grp['ones'] = 1
+        for i in catsort.columns:
+            mask[i] = (grp.groupby(i)['ones'].transform('count') < 3) | catsort[i].notnull()
+
+        catsortinterp = catsort.interpolate(method='index')
+        catsortinterpmasked = catsortinterp[mask]
+
+        merged = catsortinterpmasked.groupby(catsortinterpmasked.index).mean().reindex(ts.data.index)
+        ts_this.data = merged
+    return ts_this
+
+
+def get_merge_pair(no_of_rows, nan_ratio=0.05):
+    """Two TimeSeries with one column each and no_of_rows time stamps at 1 s, the second is offset by half a
+    second and has gaps (nan values)"""
+    rng = _np.random.RandomState(0)
+    index = _pd.date_range('2016-01-01', periods=no_of_rows, freq='1s')
+    this = _timeseries.TimeSeries(_pd.DataFrame({'this': rng.normal(size=no_of_rows)}, index=index))
+    values = rng.normal(size=no_of_rows)
+    values[rng.uniform(size=no_of_rows) < nan_ratio] = _np.nan
+    other = _timeseries.TimeSeries(_pd.DataFrame({'other': values}, index=index + _pd.Timedelta(500, 'ms')))
+    this._data_period = other._data_period = 1.
+    return this, other
+
+
+def benchmark_merge(no_of_rows=(10 ** 5, 10 ** 6, 10 ** 7), repeat=1, old_max=10 ** 7):
+    """Rows per second and peak memory of timeseries.merge and (up to old_max rows) of merge_old (concat, sort,
+    and groupby). See get_merge_pair for the data.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    results = []
+    for no in no_of_rows:
+        no = int(no)
+        this, other = get_merge_pair(no)
+        duration, peak = _measure(lambda: _timeseries.merge(this, other), repeat)
+        results.append(_result('timeseries.merge', 'sorted merge', no, 'rows', duration, peak))
+        if no <= old_max:
+            duration, peak = _measure(lambda: merge_old(this, other), repeat)
+            results.append(_result('merge_old', 'concat/sort/groupby', no, 'rows', duration, peak))
+    return _pd.DataFrame(results)
+
+
+def benchmark_corr_timelag(no_of_rows=10 ** 5, no_of_lags=(10, 40, 160), window=(2, 'h'), repeat=1):
+    """Rows per second and peak memory of Rolling.corr_timelag (1 minute data, lags in minutes) for different
+    numbers of lags.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    this, other = get_merge_pair(no_of_rows)
+    for ts in (this, other):
+        ts.data.index = _pd.date_range('2016-01-01', periods=no_of_rows, freq='60s')
+        ts._data_period = 60.
+    rolling = _timeseries.Rolling(this, window, verbose=False)
+    results = []
+    for no in no_of_lags:
+        duration, peak = _measure(lambda: rolling.corr_timelag(other, dt=(1, 'm'), no_of_steps=no), repeat)
+        results.append(_result('Rolling.corr_timelag', '%i lags' % no, no_of_rows, 'rows', duration, peak))
+    return _pd.DataFrame(results)
+
+
+def benchmark_rolling_stats(no_of_rows=(10 ** 4, 10 ** 5, 10 ** 6), window=(2, 'h'), repeat=1):
+    """Rows per second and peak memory of TimeSeries.rolling_stats (1 minute data) for different numbers of rows.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    results = []
+    for no in no_of_rows:
+        this, other = get_merge_pair(no)
+        for ts in (this, other):
+            ts.data.index = _pd.date_range('2016-01-01', periods=no, freq='60s')
+            ts._data_period = 60.
+        duration, peak = _measure(lambda: this.rolling_stats(other, window), repeat)
+        results.append(_result('TimeSeries.rolling_stats', '', no, 'rows', duration, peak))
+    return _pd.DataFrame(results)
+
+
+#######
+# accuracy
+def make_mie_reference(fname=mie_reference_file, no_of_particles=12, noOfAngles=50):
+    """Creates the reference values of the Mie calculations with bhmie_hagen. Only to be done when the current
+    implementation is deliberately changed!"""
+    out = []
+    for regime in regimes:
+        x, n = get_particles(regime, no_of_particles)
+        res = _run_bhmie_hagen(x, n, noOfAngles)
+        df = _pd.DataFrame(res, columns=quantities)
+        df.insert(0, 'regime', regime)
+        df.insert(1, 'x', x)
+        df.insert(2, 'n_real', n.real)
+        df.insert(3, 'n_imag', n.imag)
+        out.append(df)
+    out = _pd.concat(out, ignore_index=True)
+    out.to_csv(fname, index=False, float_format='%.17g')
+    return out
+
+
+def compare_to_mie_reference(engine, fname=mie_reference_file, noOfAngles=50):
+    """Maximum relative deviation of the results of a Mie engine from the reference values
+
+    Parameters
+    ----------
+    engine: str or callable
+        Name of an engine in mie_engines or a function with the same signature (x, n, noOfAngles) returning an
+        array with the columns qext, qsca, qback, and gsca.
+
+    Returns
+    -------
+    pandas.DataFrame: regimes x quantities
+    """
+    run = mie_engines[engine] if isinstance(engine, str) else engine
+    ref = _pd.read_csv(fname, float_precision='round_trip')
+    out = {}
+    for regime, group in ref.groupby('regime', sort=False):
+        n = group.n_real.values + 1j * group.n_imag.values
+        res = run(group.x.values, n, noOfAngles)
+        soll = group[quantities].values
+        out[regime] = _np.abs(res / soll - 1).max(axis=0)
+    return _pd.DataFrame(out, index=quantities).transpose()
+
+
+def check_mie_reference(engine, fname=mie_reference_file, noOfAngles=50, rtol=None):
+    """Raises an AssertionError if the results of the engine deviate from the reference values by more than the
+    tolerance.
+
+    Parameters
+    ----------
+    engine: str or callable
+        see compare_to_mie_reference
+    rtol: dict, optional
+        relative tolerance of each quantity, default see tolerances.
+    """
+    if type(rtol) == type(None):
+        rtol = tolerances.get(engine, tolerances['default']) if isinstance(engine, str) else tolerances['default']
+    deviation = compare_to_mie_reference(engine, fname=fname, noOfAngles=noOfAngles)
+    for quantity in quantities:
+        if (deviation[quantity] > rtol[quantity]).any():
+            txt = '%s deviates from the reference values by more than %s:\n%s' % (quantity, rtol[quantity],
+                                                                                  deviation[quantity])
+            raise AssertionError(txt)
+    return deviation
+
+
+def _optical_properties_of_reference_dist(wavelengths=(450., 550., 700.), n=1.5 + 0.01j):
+    dist = get_size_distribution(no_of_rows=5, no_of_bins=60)
+    opt = _optical_properties.size_dist2optical_properties(dist, list(wavelengths), n, noOfAngles=50)
+    out = _pd.DataFrame({'extinction_coeff': opt.extinction_coeff.data.values.ravel(),
+                         'scattering_coeff': opt.scattering_coeff.data.values.ravel(),
+                         'asymmetry_param': opt.asymmetry_param.data.values.ravel()})
+    out.insert(0, 'row', _np.repeat(_np.arange(dist.data.shape[0]), len(wavelengths)))
+    out.insert(1, 'wavelength', _np.tile(wavelengths, dist.data.shape[0]))
+    return out
+
+
+def make_optical_properties_reference(fname=optical_properties_reference_file):
+    """Creates the reference values of size_dist2optical_properties. Only to be done when the current
+    implementation is deliberately changed!"""
+    out = _optical_properties_of_reference_dist()
+    out.to_csv(fname, index=False, float_format='%.17g')
+    return out
+
+
+def check_optical_properties_reference(fname=optical_properties_reference_file, rtol=1e-9):
+    """Raises an AssertionError if the optical properties of the reference size distribution deviate from the
+    reference values by more than rtol.
+
+    Returns
+    -------
+    pandas.Series: maximum relative deviation of each quantity
+    """
+    ref = _pd.read_csv(fname, float_precision='round_trip')
+    res = _optical_properties_of_reference_dist()
+    columns = ['extinction_coeff', 'scattering_coeff', 'asymmetry_param']
+    deviation = _pd.Series(_np.abs(res[columns].values / ref[columns].values - 1).max(axis=0), index=columns)
+    if (deviation > rtol).any():
+        txt = 'The optical properties deviate from the reference values by more than %s:\n%s' % (rtol, deviation)
+        raise AssertionError(txt)
+    return deviation
+
+
+if __name__ == "__main__":
+    with _pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(run_benchmarks())
+        print()
+        print(benchmark_kernel_grid())
+        print()
+        print(benchmark_find_closest())
+        print()
+        print(benchmark_copy())
+        print()
+        print(benchmark_storage())
+        print()
+        print(benchmark_fit_normal())
+        print()
+        print(benchmark_simulate())
+        print()
+        print(benchmark_convert2verticalprofile())
+        print()
+        print(benchmark_merge())
+        print()
+        print(benchmark_corr_timelag())
+        print()
+        print(benchmark_rolling_stats())
+        print()
+        for engine in mie_engines:
+            print('%s: maximum relative deviation from the reference values' % engine)
+            print(compare_to_mie_reference(engine))
+        print()
+        print('size_dist2optical_properties: maximum relative deviation from the reference values')
+        print(check_optical_properties_reference())
@@ -26,4 +26,509 @@ def test_1twr10xC1():
                        dtype={'vap_pres_25m': np.float32, 'vap_pres_60m': np.float32}
                        )
 
-    assert np.all(out.vapor_pressure.data == soll)
\ No newline at end of file
+    assert np.all(out.vapor_pressure.data == soll)
+
+#### radiation
+######## mie
+from atmPy.radiation.mie_scattering import bhmie
+
+def test_bhmie_hagen_batch():
+    x = np.array([0.05, 0.7, 3., 12., 60.])
+    n = np.array([1.455, 1.5 + 0.01j, 1.455, 1.95 + 0.79j, 1.33])
+    d = x / np.pi
+    batch = bhmie.bhmie_hagen_batch(x, n, 50, diameter=d)
+    for i in range(x.shape[0]):
+        single = bhmie.bhmie_hagen(x[i], n[i], 50, diameter=d[i])
+        assert np.allclose(batch.s1[i], single.s1, rtol=1e-10)
+        assert np.allclose(batch.s2[i], single.s2, rtol=1e-10)
+        assert np.allclose([batch.qext[i], batch.qsca[i], batch.qback[i], batch.gsca[i], batch.csca[i]],
+                           [single.qext, single.qsca, single.qback, single.gsca, single.csca], rtol=1e-10)
+        assert np.allclose(batch.get_angular_scatt_func()[i], single.get_angular_scatt_func().natural.values,
+                           rtol=1e-10)
+
+def test_bhmie_angular_arrays():
+    x = np.array([0.7, 3., 12.])
+    batch = bhmie.bhmie_hagen_batch(x, 1.5 + 0.01j, 30, diameter=x / np.pi)
+    singles = [bhmie.bhmie_hagen(xi, 1.5 + 0.01j, 30, diameter=xi / np.pi) for xi in x]
+    asf = singles[1].get_angular_scatt_func()
+    assert np.array_equal(singles[1].angles, asf.index.values)
+    for pol in ['natural', 'perpendicular', 'parallel']:
+        assert np.array_equal(getattr(singles[1], pol), asf[pol].values)
+        angles, stacked = bhmie.stack_angular_scatt_func(singles + [batch], polarization=pol)
+        assert stacked.shape == (6, angles.shape[0])
+        assert np.allclose(stacked[:3], stacked[3:], rtol=1e-10)
+
+def test_mie_coated():
+    from atmPy.radiation.mie_scattering import mie_coated
+    y = np.array([0.5, 2., 8., 30.])
+    batch = mie_coated.MieCoatedBatch(0.4 * y, y, 1.95 + 0.79j, 1.5, 20)
+    for i in range(y.shape[0]):
+        single = mie_coated.Mie(x=0.4 * y[i], y=y[i], m=1.95 + 0.79j, m2=1.5 + 0j)
+        assert np.allclose([batch.qext[i], batch.qsca[i], batch.gsca[i], batch.qback[i]],
+                           [single.qext(), single.qsca(), single.asy(), single.qb()], rtol=1e-10)
+
+    # without a distinct core the results are those of a homogeneous sphere
+    homogeneous = mie_coated.MieCoatedBatch(0.4 * y, y, 1.5 + 0.01j, 1.5 + 0.01j, 20)
+    reference = bhmie.bhmie_hagen_batch(y, 1.5 + 0.01j, 20)
+    assert np.allclose(homogeneous.qext, reference.qext, rtol=1e-5)
+    assert np.allclose(homogeneous.natural, reference.natural, rtol=1e-3)
+
+    mie = mie_coated.Mie(x=1., m=1.5, cache_size=2)
+    for x in [1., 2., 3., 1.]:
+        mie.x = x
+        mie.qext()
+    assert len(mie._cache) == 2
+
+def test_mie_reference():
+    from atmPy.unit_testing import benchmarks
+    for engine in benchmarks.mie_engines:
+        benchmarks.check_mie_reference(engine)
+
+def test_mie_cache():
+    import tempfile
+    from atmPy.radiation.mie_scattering import mie_cache
+    x = np.logspace(-1, 1.5, 20)
+    folder = tempfile.mkdtemp()
+    cache = mie_cache.MieCache(folder)
+    first = bhmie.bhmie_hagen_batch(x, 1.5 + 0.01j, 20, cache=cache)
+    second = bhmie.bhmie_hagen_batch(x, 1.5 + 0.01j, 20, cache=cache)
+    assert cache.info['misses'] == 20 and cache.info['hits'] == 20
+    assert np.array_equal(first.s1, second.s1)
+
+    # a new cache (e.g. in another process) finds the results on disk
+    cache = mie_cache.MieCache(folder)
+    third = bhmie.bhmie_hagen_batch(x, 1.5 + 0.01j, 20, cache=cache)
+    assert cache.info['disk_hits'] == 20 and cache.info['misses'] == 0
+    assert np.array_equal(first.s2, third.s2)
+
+    reference = bhmie.bhmie_hagen_batch(x, 1.5 + 0.01j, 20)
+    assert np.allclose(first.qext, reference.qext, rtol=1e-4)
+
+    # coated particles have their own keys, in memory and on disk
+    from atmPy.radiation.mie_scattering import mie_coated
+    coated = mie_coated.MieCoatedBatch(0.4 * x, x, 1.95 + 0.79j, 1.5 + 0.01j, 20, cache=cache)
+    assert cache.info['misses'] == 20
+    assert not np.allclose(coated.qext, third.qext)
+    cache = mie_cache.MieCache(folder)
+    coated_disk = mie_coated.MieCoatedBatch(0.4 * x, x, 1.95 + 0.79j, 1.5 + 0.01j, 20, cache=cache)
+    assert cache.info['disk_hits'] == 20 and cache.info['misses'] == 0
+    assert np.array_equal(coated.s1, coated_disk.s1)
+    reference = mie_coated.MieCoatedBatch(0.4 * x, x, 1.95 + 0.79j, 1.5 + 0.01j, 20)
+    assert np.allclose(coated.qext, reference.qext, rtol=1e-4)
+
+#### aerosols
+######## optical properties
+from atmPy.aerosols.size_distribution import sizedistribution
+
+def get_size_distribution(no_of_rows, no_of_bins=30, random=False):
+    """SizeDist_TS of 1 minute data with bins from 20 to 2500 nm. The values increase linearly with the bin and
+    the row, or, if random, are uniformly distributed between 10 and 1000."""
+    bins = np.logspace(np.log10(20), np.log10(2500), no_of_bins + 1)
+    index = pd.date_range('2016-01-01', periods=no_of_rows, freq='60s')
+    if random:
+        data = np.random.RandomState(0).uniform(10, 1000, (no_of_rows, no_of_bins))
+    else:
+        data = np.linspace(100, 1000, no_of_bins)[np.newaxis, :] * np.linspace(1, 2, no_of_rows)[:, np.newaxis]
+    dist = sizedistribution.SizeDist_TS(pd.DataFrame(data, index=index), bins, 'dNdlogDp')
+    dist._data_period = 60.
+    return dist
+
+def test_optical_properties_lazy():
+    dist = get_size_distribution(5)
+    opt = dist.calculate_optical_properties(550, 1.5 + 0.01j)
+
+    # only the crossections are calculated
+    ext = opt.extinction_coeff.data.values
+    assert 'angular_scatt_func' not in opt.data_orig
+
+    # after the full calculation (at noOfAngles angles) the extinction is the same
+    angular_scatt_func = opt.angular_scatt_func
+    assert angular_scatt_func.data.shape == (5, 4 * 100 - 3)
+    assert np.allclose(opt.data_orig.kernel.extinction_coeff_per_bin.sum(axis=1), ext[:, 0], rtol=1e-12)
+    assert np.allclose(opt.scattering_coeff.data.values + opt.absorption_coeff.data.values, ext, rtol=1e-12)
+
+def test_optical_properties_multi_wavelength():
+    dist = get_size_distribution(5)
+    opt = dist.calculate_optical_properties([460., 550., 700.], [1.5, 1.5 + 0.01j, 1.45])
+    assert np.array_equal(opt.extinction_coeff.data.columns.values, [460., 550., 700.])
+    single = dist.calculate_optical_properties(550., 1.5 + 0.01j)
+    assert np.allclose(opt[550].extinction_coeff.data.values, single.extinction_coeff.data.values, rtol=1e-12)
+    assert np.allclose(opt.scattering_coeff.data[550.].values, single.scattering_coeff.data.values[:, 0],
+                       rtol=1e-12)
+
+def test_optical_properties_parallel():
+    dist = get_size_distribution(20)
+    index = dist.data.index
+    n = pd.DataFrame(np.linspace(1.45, 1.55, 20) + 0.01j, index=index)
+    serial = dist.calculate_optical_properties(550, n)
+    parallel = dist.calculate_optical_properties(550, n, n_workers=2, chunk_size=7)
+    assert np.array_equal(serial.extinction_coeff_per_bin.data.values, parallel.extinction_coeff_per_bin.data.values)
+    assert np.array_equal(serial.angular_scatt_func.data.values, parallel.angular_scatt_func.data.values)
+
+def test_optical_properties_kernel_grid():
+    from atmPy.aerosols.physics import optical_properties
+    dist = get_size_distribution(20)
+    index = dist.data.index
+    n = pd.DataFrame(np.linspace(1.45, 1.55, 20) + np.linspace(0.001, 0.01, 20) * 1j, index=index)
+    exact = dist.calculate_optical_properties(550, n)
+    grid = dist.calculate_optical_properties(550, n, kernel_tolerance=1e-4)
+    assert np.allclose(grid.extinction_coeff.data.values, exact.extinction_coeff.data.values, rtol=1e-4)
+    assert np.allclose(grid.asymmetry_param.data.values, exact.asymmetry_param.data.values, rtol=1e-4)
+
+    # a tolerance which can not be met with the maximum number of grid points raises an error
+    try:
+        optical_properties.MieKernelGrid(dist.bincenters / 1000., 0.55, n.iloc[:, 0].values, tolerance=1e-4,
+                                         max_grid_points=5)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('No ValueError raised.')
+
+def test_optical_properties_reference():
+    from atmPy.unit_testing import benchmarks
+    benchmarks.check_optical_properties_reference()
+
+######## size distribution
+def test_apply_growth_shift_data():
+    dist = get_size_distribution(50, no_of_bins=40, random=True)
+    bins = dist.bins
+    gf = np.random.RandomState(1).uniform(1, 2.5, 50)
+    gf[3] = 1.
+    gf[5] = np.nan
+    grown = dist.apply_growth(pd.DataFrame(gf, index=dist.data.index))
+
+    numb = dist.convert2numberconcentration().data.values
+    numb_grown = grown.data.values
+    assert np.allclose(grown.bins[:bins.shape[0]], bins)
+    assert grown.bins[-1] >= bins[-1] * np.nanmax(gf)
+    # conservation of number
+    valid = ~np.isnan(gf)
+    assert np.allclose(numb_grown[valid].sum(axis=1), numb[valid].sum(axis=1), rtol=1e-12)
+    assert np.array_equal(numb_grown[3, :40], numb[3])
+    assert np.all(np.isnan(numb_grown[5, :40]))
+
+def test_moment_cache():
+    dist = get_size_distribution(20, no_of_bins=40, random=True)
+    dist.physical_property_density = 1.5
+
+    # number, surface, and volume against the moment conversion
+    for moment, conv, scale in [('number', dist.convert2numberconcentration(), 1),
+                                ('surface', dist.convert2dSdDp(), 1e-6),
+                                ('volume', dist.convert2dVdDp(), 1e-9)]:
+        soll = (conv.data * conv.binwidth).sum(axis=1).values if moment != 'number' else conv.data.sum(axis=1).values
+        quantity = getattr(dist, 'particle_%s_concentration' % moment)
+        assert np.allclose(quantity.data.values[:, 0], soll * scale, rtol=1e-12)
+        # cached until something changes
+        assert getattr(dist, 'particle_%s_concentration' % moment) is quantity
+
+    numb = dist.particle_number_concentration.data.values.copy()
+    mass = dist.particle_mass_concentration.data.values.copy()
+    dist.data *= 2
+    assert np.allclose(dist.particle_number_concentration.data.values, 2 * numb)
+    dist.physical_property_density = 3.
+    assert np.allclose(dist.particle_mass_concentration.data.values, 4 * mass)
+    dist.data.iloc[0, :] = 0
+    dist._update()
+    assert dist.particle_number_concentration.data.values[0, 0] == 0
+
+def test_moment_conversion():
+    dist_ts = get_size_distribution(5, no_of_bins=40, random=True)
+    data = dist_ts.data.reset_index(drop=True)
+    dist = sizedistribution.SizeDist(data, dist_ts.bins, 'dNdlogDp')
+    bincenters = dist.bincenters
+
+    dNdDp = dist.convert2dNdDp()
+    assert np.allclose(dNdDp.data.values, data.values / (bincenters * np.log(10)), rtol=1e-13)
+    dVdlogDp = dist.convert2dVdlogDp(deep=False)
+    assert np.allclose(dVdlogDp.data.values, data.values * np.pi / 6 * bincenters ** 3, rtol=1e-13)
+    numb = dVdlogDp.convert2numberconcentration(deep=False)
+    assert np.allclose(numb.data.values, dNdDp.data.values * dist.binwidth, rtol=1e-13)
+    # the data of a shallow copy is not shared
+    assert dist.convert2dNdlogDp(deep=False).data is not dist.data
+
+def test_lightweight_copy():
+    from atmPy.unit_testing import benchmarks
+    dist = benchmarks.get_flight_dataset(days=0.1)
+    numb = dist.particle_number_concentration.data.values.copy()
+
+    dist_copy = dist.copy()
+    # without copy-on-write in pandas (pandas < 3 with default settings) the copy is a deep copy
+    from atmPy.tools import pandas_tools
+    if pandas_tools.copy_on_write_enabled():
+        assert np.shares_memory(dist_copy.data.values, dist.data.values)
+    dist_copy.data *= 2
+    dist_copy.housekeeping.data['Altitude'] += 1
+    dist_copy.bins[0] = 1
+    # the original is unchanged
+    assert not np.shares_memory(dist_copy.data.values, dist.data.values)
+    assert np.array_equal(dist.particle_number_concentration.data.values, numb)
+    assert np.allclose(dist_copy.particle_number_concentration.data.values, 2 * numb)
+    assert dist.housekeeping.data['Altitude'].iloc[0] == 1500.
+    assert dist.bins[0] == 10.
+
+    dist_deep = dist.copy(deep=True)
+    assert not np.shares_memory(dist_deep.data.values, dist.data.values)
+
+def test_array_storage():
+    from atmPy.unit_testing import benchmarks
+    dist = benchmarks.get_size_distribution(no_of_rows=20, no_of_bins=40)
+    dist_a = sizedistribution.SizeDist_TS(dist.data, dist.bins, 'dNdlogDp', storage='array', dtype=np.float32)
+    assert dist_a.values.dtype == np.float32
+    assert np.array_equal(dist_a.index_values, dist.data.index.values)
+    assert np.allclose(dist_a.particle_volume_concentration.data.values,
+                       dist.particle_volume_concentration.data.values, rtol=1e-6)
+    # the DataFrame is a view of the array
+    assert np.shares_memory(dist_a.data.values, dist_a.values)
+    assert dist_a.data.index.name == 'Time'
+    assert np.allclose(dist_a.data.values, dist.data.values, rtol=1e-6)
+    dist_a.data *= 2
+    assert np.allclose(dist_a.particle_number_concentration.data.values,
+                       2 * dist.particle_number_concentration.data.values, rtol=1e-6)
+
+    # copies and derived size distributions stay array backed
+    dist_a = sizedistribution.SizeDist_TS(dist.data, dist.bins, 'dNdlogDp', storage='array')
+    copy = dist_a.copy()
+    assert np.shares_memory(copy.values, dist_a.values)
+    zoomed = dist_a.zoom_time(start=dist.data.index[5], end=dist.data.index[9])
+    assert np.array_equal(zoomed.index_values, dist.data.index.values[5:10])
+    converted = dist_a.convert2dVdlogDp()
+    assert np.allclose(converted.values, dist.convert2dVdlogDp().data.values, rtol=1e-12)
+    average = dist_a.average_overAllTime()
+    assert np.allclose(average.data.values, dist.average_overAllTime().data.values, rtol=1e-12)
+    opt = dist_a.calculate_optical_properties(550, 1.5 + 0.01j)
+    assert np.allclose(opt.extinction_coeff.data.values,
+                       dist.calculate_optical_properties(550, 1.5 + 0.01j).extinction_coeff.data.values, rtol=1e-12)
+    for sd in [dist_a, copy, zoomed, converted]:
+        assert sd._array_only()
+
+    # changing the DataFrame of a copy does not change the original
+    zoomed.data *= 2
+    copy.data *= 2
+    assert np.array_equal(dist_a.values, dist.data.values)
+    assert np.array_equal(zoomed.data.values, 2 * dist.data.values[5:10])
+
+def test_fit_normal():
+    from scipy import optimize
+    from atmPy.tools import math_functions
+    bins = np.logspace(np.log10(60), np.log10(1000), 61)
+    x = np.log10((bins[1:] + bins[:-1]) / 2.)
+    index = pd.date_range('2016-01-01', periods=3, freq='60s')
+    truth = np.array([[100., np.log10(150.), 0.15, 50., np.log10(600.), 0.08],
+                      [300., np.log10(200.), 0.2, 300., np.log10(700.), 0.05],
+                      [80., np.log10(250.), 0.1, 200., np.log10(500.), 0.1]])
+    data = np.zeros((3, 60))
+    for i in range(2):
+        data += math_functions.gauss(x[np.newaxis, :], truth[:, [3 * i]], truth[:, [3 * i + 1]], truth[:, [3 * i + 2]])
+    noise = np.random.RandomState(0).normal(0, 2, data.shape)
+
+    # one mode, same result as curve_fit
+    dist = sizedistribution.SizeDist_TS(pd.DataFrame(data[:, :30] + noise[:, :30], index=index), bins[:31], 'dNdlogDp')
+    fit = dist.fit_normal()
+    for e, line in enumerate(dist.data.values):
+        soll = optimize.curve_fit(math_functions.gauss, np.log10(dist.bincenters), line,
+                                  p0=[10, np.log10(180), 0.2])[0]
+        assert np.allclose(fit.iloc[e][['Amp', 'Sigma']].values, [soll[0], abs(soll[2])], rtol=1e-4)
+        assert np.isclose(fit.Pos.iloc[e], 10 ** soll[1], rtol=1e-5)
+
+    # two modes
+    dist = sizedistribution.SizeDist_TS(pd.DataFrame(data, index=index), bins, 'dNdlogDp')
+    fit = dist.fit_normal(modes=2)
+    assert np.allclose(fit[['Amp_1', 'Amp_2']].values, truth[:, [0, 3]], rtol=1e-6)
+    assert np.allclose(fit[['Pos_1', 'Pos_2']].values, 10 ** truth[:, [1, 4]], rtol=1e-6)
+
+def test_simulate_modes():
+    index = pd.date_range('2016-01-01', periods=50, freq='10s')
+    Dg = np.array([np.full(50, 30.), np.linspace(150, 300, 50)]).transpose()
+    dist = sizedistribution.simulate_sizedistribution_modes([2000., 500.], Dg, [1.5, 1.6], diameter=[1, 1e5],
+                                                            index=index)
+    assert isinstance(dist, sizedistribution.SizeDist_TS)
+    assert dist.data.shape == (50, 99)
+    dlogDp = np.log10(dist.bins[1:] / dist.bins[:-1])
+    assert np.allclose((dist.data.values * dlogDp).sum(axis=1), 2500., rtol=1e-6)
+
+    # poisson noise is reproducible with a seed
+    kwargs = dict(index=index, noise='poisson', sample_volume=2., seed=1)
+    noisy = sizedistribution.simulate_sizedistribution_modes([2000., 500.], Dg, [1.5, 1.6], **kwargs)
+    noisy_II = sizedistribution.simulate_sizedistribution_modes([2000., 500.], Dg, [1.5, 1.6], **kwargs)
+    assert np.array_equal(noisy.data.values, noisy_II.data.values)
+    counts = noisy.data.values * np.log10(noisy.bins[1:] / noisy.bins[:-1]) * 2.
+    assert np.allclose(counts, np.round(counts))
+
+    layers = sizedistribution.simulate_sizedistribution_modes([[100.], [200.]], 200., 1.5,
+                                                              layerbounderies=[[0, 100], [100, 200]])
+    assert isinstance(layers, sizedistribution.SizeDist_LS)
+
+def test_convert2verticalprofile():
+    from atmPy.general import timeseries
+    index = pd.date_range('2016-01-01', periods=8, freq='1s')
+    data = np.arange(16.).reshape(8, 2)
+    data[1, 0] = np.nan
+    dist = sizedistribution.SizeDist_TS(pd.DataFrame(data, index=index), np.array([100., 200., 300.]), 'dNdlogDp')
+    dist.housekeeping = timeseries.TimeSeries(pd.DataFrame({'Altitude': [0.5, 1.5, 1.2, 0.1, 2.5, 3.5, 3.7, 3.9]},
+                                                           index=index))
+    vp = dist.convert2verticalprofile(laythick=2)
+    assert np.array_equal(vp.layerbounderies, [[0, 2], [2, 4]])
+    assert np.array_equal(vp.sample_count.values, [4, 4])
+    assert np.allclose(vp.data.values, [[(0 + 4 + 6) / 3., (1 + 3 + 5 + 7) / 4.], [11., 12.]])
+    assert np.isclose(vp.data_std.values[1, 0], data[4:, 0].std(ddof=1))
+
+    # the altitude range (0 to 5) is not a multiple of the layer thickness
+    dist = sizedistribution.SizeDist_TS(pd.DataFrame(data[:6], index=index[:6]), np.array([100., 200., 300.]),
+                                        'dNdlogDp')
+    dist.housekeeping = timeseries.TimeSeries(pd.DataFrame({'Altitude': [0.2, 1.5, 3.0, 4.5, 4.9, 2.0]},
+                                                           index=index[:6]))
+    vp = dist.convert2verticalprofile(laythick=2)
+    assert np.array_equal(vp.layerbounderies, [[0, 2], [2, 4], [4, 6]])
+    assert np.array_equal(vp.sample_count.values, [2, 2, 2])
+    assert np.allclose(vp.data.values[2], [(6 + 8) / 2., (7 + 9) / 2.])
+
+#### general
+######## timeseries
+from atmPy.general import timeseries
+from scipy import stats as scipy_stats
+
+def test_running_statistics():
+    index = pd.date_range('2016-01-01 00:20:00', periods=3000, freq='10s')
+    values = 1e4 + np.random.RandomState(0).normal(size=(3000, 2))
+    values[::11, 0] = np.nan
+    data = pd.DataFrame(values, index=index, columns=['a', 'b'])
+    stats = timeseries.RunningStatistics(window=(1, 'h'))
+    # chunks arriving in arbitrary order
+    for chunk in [data.iloc[1000:], data.iloc[:400], data.iloc[400:1000]]:
+        stats.add(chunk)
+    resample = data.resample('1h', label='left')
+    assert stats.mean.index.equals(resample.mean().index)
+    assert np.allclose(stats.mean.values, resample.mean().values)
+    assert np.allclose(stats.std.values, resample.std().values, rtol=1e-8)
+    assert np.array_equal(stats.count.values, resample.count().values)
+    assert np.array_equal(stats.min.values, resample.min().values)
+    assert np.array_equal(stats.max.values, resample.max().values)
+
+    total = timeseries.RunningStatistics()
+    total.add(timeseries.TimeSeries(data.iloc[:1500]))
+    other = timeseries.RunningStatistics()
+    other.add(data.iloc[1500:])
+    total.merge(other)
+    assert np.allclose(total.mean.values[0], np.nanmean(values, axis=0))
+
+def test_merge():
+    index = pd.date_range('2016-01-01', periods=50, freq='10s')
+    values = np.random.RandomState(0).normal(size=50)
+    values[[5, 20, 21, 30, 31, 32, 33]] = np.nan
+    this = timeseries.TimeSeries(pd.DataFrame({'this': np.arange(50.)}, index=index))
+    other = timeseries.TimeSeries(pd.DataFrame({'other': values}, index=index + pd.Timedelta(3, 's')))
+    merged = timeseries.merge(this, other).data
+    from atmPy.unit_testing import benchmarks
+    assert np.allclose(merged.values, benchmarks.merge_old(this, other).data.values, equal_nan=True)
+    # gaps of 3 or more missing points (including the time stamps of this) are not bridged
+    assert np.array_equal(np.where(np.isnan(merged.other.values))[0], [0, 5, 6, 20, 21, 22, 30, 31, 32, 33, 34])
+    assert np.isclose(merged.other.values[1], values[0] + (values[1] - values[0]) * 7 / 10.)
+    # columns found in both
+    other.data['this'] = values[::-1]
+    shared = timeseries.merge(this, other).data
+    assert np.allclose(shared.values, benchmarks.merge_old(this, other).data.values, equal_nan=True)
+
+def test_align_to_interval_mean():
+    index = pd.date_range('2016-01-01', periods=6000, freq='50ms')
+    keep = np.random.RandomState(0).uniform(size=6000) > 0.3
+    values = np.random.RandomState(1).normal(size=(keep.sum(), 2))
+    values[::13, 1] = np.nan
+    fast = timeseries.TimeSeries(pd.DataFrame(values, index=index[keep], columns=['a', 'b']))
+    fast._data_period = 0.05
+    slow = timeseries.TimeSeries(pd.DataFrame({'c': np.zeros(5)}, index=pd.date_range('2016-01-01', periods=5,
+                                                                                      freq='60s')))
+    slow._data_period = 60.
+    aligned = fast.align_to(slow, how='interval_mean')
+    soll = fast.data.resample('60s').mean()
+    assert aligned.data.index.equals(slow.data.index)
+    assert np.allclose(aligned.data.values, soll.reindex(slow.data.index).values, equal_nan=True)
+    assert aligned._data_period == 60.
+
+def test_close_gaps():
+    index = pd.date_range('2016-01-01', periods=100, freq='10s')
+    keep = np.ones(100, dtype=bool)
+    keep[[10, 11, 12, 40, 60, 61, 62, 63, 64, 65]] = False
+    ts = timeseries.TimeSeries(pd.DataFrame({'a': np.arange(100.)[keep]}, index=index[keep]))
+    ts._data_period = 10.
+    closed = ts.close_gaps()
+    # the single missing point (40) is not a gap
+    assert closed.data.index.equals(index[keep | (np.arange(100) != 40)])
+    assert np.isnan(closed.data.a.values[[10, 11, 12]]).all()
+    assert np.array_equal(closed.gap_summary.missing_points.values, [3, 6])
+    assert closed.gap_summary.start.iloc[1] == index[59]
+
+def test_corr_timelag():
+    index = pd.date_range('2016-01-01', periods=1000, freq='60s')
+    rng = np.random.RandomState(0)
+    x = np.cumsum(rng.normal(size=1000))
+    y = np.roll(x, 4) + rng.normal(size=1000) * 0.3
+    x[::17] = np.nan
+    data = timeseries.TimeSeries(pd.DataFrame({'x': x}, index=index))
+    other = timeseries.TimeSeries(pd.DataFrame({'y': y}, index=index))
+    data._data_period = other._data_period = 60.
+    rolling = timeseries.Rolling(data, (1, 'h'), verbose=False)
+    corr, dt_max = rolling.corr_timelag(other, dt=(1, 'm'), no_of_steps=10, normalize=False)
+    # lag 0 is the same as the pandas rolling correlation
+    soll = pd.Series(x).rolling(60, min_periods=40, center=True).corr(pd.Series(y))
+    assert np.allclose(corr.data[0].values, soll.values, equal_nan=True)
+    assert np.nanmedian(dt_max.data.values) == -4
+    # away from the edges the same as aligning the shifted other for each lag
+    def align_per_lag(unit):
+        ys = []
+        for dtt in corr.data.columns:
+            shifted = other.copy()
+            shifted.data = shifted.data.copy()
+            shifted.data.index += np.timedelta64(int(dtt), unit)
+            ys.append(shifted.align_to(data).data.iloc[:, 0].values)
+        return array_tools.rolling_corr(x, np.array(ys).T, rolling.window, min_periods=rolling.min_periods,
+                                        center=rolling.center)
+    assert np.allclose(corr.data.values[:900], align_per_lag('m')[:900], equal_nan=True)
+    # lags that are no multiples of the data period, other without gaps
+    corr, dt_max = rolling.corr_timelag(other, dt=(90, 's'), no_of_steps=3, normalize=False)
+    assert np.allclose(corr.data.values[:900], align_per_lag('s')[:900], equal_nan=True)
+
+def test_rolling_stats():
+    index = pd.date_range('2016-01-01', periods=500, freq='10s')
+    rng = np.random.RandomState(1)
+    x = np.cumsum(rng.normal(size=500))
+    y = 2 * x + 1 + rng.normal(size=500)
+    x[::13] = np.nan
+    data = timeseries.TimeSeries(pd.DataFrame({'x': x}, index=index))
+    other = timeseries.TimeSeries(pd.DataFrame({'y': y}, index=index))
+    data._data_period = other._data_period = 10.
+    stats = data.rolling_stats(other, (5, 'm'), remove_zeros=False)
+    assert stats.data.shape[0] == 500 - 30 + 1
+    assert stats.data.index[0] == index[0] + (index[29] - index[0]) / 2
+    for i in [0, 100, 470]:
+        xx, yy = x[i:i + 30], y[i:i + 30]
+        valid = ~np.isnan(xx)
+        slope, intercept, r, p, err = scipy_stats.linregress(xx[valid], yy[valid])
+        row = stats.data.iloc[i]
+        assert row.no_of_points == valid.sum()
+        assert np.allclose([row.pearson_r, row.slope, row.intercept], [r, slope, intercept])
+        assert np.isclose(row.slope_zero_intercept, (xx[valid] * yy[valid]).sum() / (xx[valid] ** 2).sum())
+
+#### tools
+######## array tools
+from atmPy.tools import array_tools
+
+def test_find_closest():
+    array = np.array([1., 2., 2., 4., 8., 16.])
+    values = np.array([0., 1., 1.5, 2., 3., 3.5, 5., 20.])
+    for arr in [array, array[::-1]]:
+        for how in ['closest', 'closest_low', 'closest_high']:
+            assert np.array_equal(array_tools.find_closest(arr, values, how=how),
+                                  array_tools.find_closest(arr, values, how=how, sorted=False))
+    assert array_tools.find_closest(array, 3.5, how='closest_low') == 1
+    assert array_tools.find_closest(array, 3.5, how='closest_high') == 3
+
+def test_grouped_stats():
+    values = np.random.RandomState(0).normal(size=(200, 3))
+    values[::7, 1] = np.nan
+    groups = np.random.RandomState(1).randint(-1, 6, 200)
+    stats = array_tools.grouped_stats(values, groups, 6)
+    df = pd.DataFrame(values)[groups >= 0].groupby(groups[groups >= 0])
+    assert np.allclose(stats['mean'], df.mean().values)
+    assert np.allclose(stats['std'], df.std().values)
+    assert np.array_equal(stats['count'], df.count().values)
+